@@ -0,0 +1,257 @@
+"""Pub/sub backplane that carries WebSocket deliveries between uvicorn workers/pods.
+
+Every ConnectionManager publishes its outbound deliveries (broadcasts, per-user
+frames, group frames, session invalidations) to the backplane and also applies
+them to its own sockets. Other nodes receive the envelope and apply it to theirs.
+
+Implementations:
+- InProcessBackplane: nodes living in one process (single worker, tests)
+- BrokerBackplane: newline-delimited JSON over a Unix or TCP socket to a
+  BackplaneBroker, run with `python backplane.py --listen unix:///tmp/cashout-backplane.sock`
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+from typing import Callable, Dict, Any, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+Envelope = Dict[str, Any]
+EnvelopeHandler = Callable[[Envelope], None]
+
+# Line limit for stream readers - image messages carry base64 payloads
+BACKPLANE_MAX_LINE = 16 * 1024 * 1024
+# Pending bytes allowed towards the broker (or a broker client) before frames are dropped
+BACKPLANE_MAX_BUFFER = int(os.getenv("WS_BACKPLANE_MAX_BUFFER", str(64 * 1024 * 1024)))
+
+
+def parse_backplane_url(url: str) -> Tuple[str, Any]:
+    """Parse unix:///path/to.sock or tcp://host:port"""
+    if url.startswith("unix://"):
+        return "unix", url[len("unix://"):]
+    if url.startswith("tcp://"):
+        host, _, port = url[len("tcp://"):].rpartition(":")
+        return "tcp", (host or "127.0.0.1", int(port))
+    raise ValueError(f"Unsupported backplane URL: {url}")
+
+
+class Backplane:
+    """Transport interface used by ConnectionManager"""
+
+    def attach(self, node_id: str, handler: EnvelopeHandler):
+        """Register a node; handler receives envelopes published by other nodes"""
+        raise NotImplementedError
+
+    def publish(self, node_id: str, envelope: Envelope):
+        """Send an envelope to every other node. Must not block."""
+        raise NotImplementedError
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class InProcessBackplane(Backplane):
+    """Delivers envelopes between ConnectionManagers in the same process"""
+
+    def __init__(self):
+        self.handlers: Dict[str, EnvelopeHandler] = {}
+        self.published = 0
+
+    def attach(self, node_id: str, handler: EnvelopeHandler):
+        self.handlers[node_id] = handler
+
+    def publish(self, node_id: str, envelope: Envelope):
+        self.published += 1
+        for other_id, handler in list(self.handlers.items()):
+            if other_id == node_id:
+                continue
+            try:
+                handler(envelope)
+            except Exception as e:
+                logger.error(f"Backplane handler error on node {other_id}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"type": "inprocess", "nodes": len(self.handlers), "published": self.published}
+
+
+class BrokerBackplane(Backplane):
+    """Connects this worker to a BackplaneBroker and relays envelopes through it"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.kind, self.address = parse_backplane_url(url)
+        self.handlers: Dict[str, EnvelopeHandler] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.reconnects = 0
+
+    def attach(self, node_id: str, handler: EnvelopeHandler):
+        self.handlers[node_id] = handler
+
+    def _deliver(self, envelope: Envelope, skip_node: Optional[str] = None):
+        for node_id, handler in list(self.handlers.items()):
+            if node_id == skip_node:
+                continue
+            try:
+                handler(envelope)
+            except Exception as e:
+                logger.error(f"Backplane handler error on node {node_id}: {e}")
+
+    def publish(self, node_id: str, envelope: Envelope):
+        # Other nodes attached in this process get it directly
+        self._deliver(envelope, skip_node=node_id)
+
+        writer = self._writer
+        if writer is None or writer.is_closing():
+            self.dropped += 1
+            return
+        if writer.transport.get_write_buffer_size() > BACKPLANE_MAX_BUFFER:
+            self.dropped += 1
+            logger.warning("Backplane write buffer full - dropping envelope")
+            return
+        writer.write((json.dumps(envelope, default=str) + "\n").encode())
+        self.published += 1
+
+    async def _open(self):
+        if self.kind == "unix":
+            return await asyncio.open_unix_connection(self.address, limit=BACKPLANE_MAX_LINE)
+        host, port = self.address
+        return await asyncio.open_connection(host, port, limit=BACKPLANE_MAX_LINE)
+
+    async def _run(self):
+        backoff = 0.5
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._open()
+                self._writer = writer
+                backoff = 0.5
+                logger.info(f"🔗 Connected to WebSocket backplane broker at {self.url}")
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    self.received += 1
+                    self._deliver(json.loads(line))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Backplane broker connection error ({self.url}): {e}")
+            finally:
+                self._writer = None
+                if writer is not None:
+                    writer.close()
+            self.reconnects += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 10)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "type": "broker",
+            "url": self.url,
+            "connected": self._writer is not None,
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+            "reconnects": self.reconnects,
+        }
+
+
+class BackplaneBroker:
+    """Relays each line from one worker to every other connected worker"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.kind, self.address = parse_backplane_url(url)
+        self.clients = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients.add(writer)
+        logger.info(f"Backplane worker connected ({len(self.clients)} total)")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for other in list(self.clients):
+                    if other is writer or other.is_closing():
+                        continue
+                    if other.transport.get_write_buffer_size() > BACKPLANE_MAX_BUFFER:
+                        # A worker that cannot keep up is cut off; it reconnects on its own
+                        logger.warning("Backplane worker too slow - disconnecting it")
+                        other.close()
+                        continue
+                    other.write(line)
+        except Exception as e:
+            logger.warning(f"Backplane worker connection error: {e}")
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+            logger.info(f"Backplane worker disconnected ({len(self.clients)} total)")
+
+    async def start(self):
+        if self.kind == "unix":
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            self.server = await asyncio.start_unix_server(self._handle_client, self.address, limit=BACKPLANE_MAX_LINE)
+        else:
+            host, port = self.address
+            self.server = await asyncio.start_server(self._handle_client, host, port, limit=BACKPLANE_MAX_LINE)
+        logger.info(f"📡 WebSocket backplane broker listening on {self.url}")
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in list(self.clients):
+            writer.close()
+
+    async def serve_forever(self):
+        await self.start()
+        await self.server.serve_forever()
+
+
+def create_backplane(url: Optional[str] = None) -> Backplane:
+    """Backplane from WS_BACKPLANE_URL; in-process when unset"""
+    url = url if url is not None else os.getenv("WS_BACKPLANE_URL", "")
+    if not url or url == "inprocess":
+        return InProcessBackplane()
+    return BrokerBackplane(url)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="CashOutAI WebSocket backplane broker")
+    parser.add_argument("--listen", default=os.getenv("WS_BACKPLANE_URL", "unix:///tmp/cashout-backplane.sock"))
+    args = parser.parse_args()
+    try:
+        asyncio.run(BackplaneBroker(args.listen).serve_forever())
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,274 @@
+"""Content-addressed store for chat images.
+
+Blobs are keyed by the SHA-256 of their bytes, so identical uploads are
+stored once. Metadata (content type, size) lives in db.blobs for every
+backend; the bytes live in GridFS (default, shared by every worker/pod) or on
+a local filesystem:
+
+    BLOB_STORE=gridfs                 # bucket "blobs" in the app database
+    BLOB_STORE=local:/var/lib/cashout/blobs
+
+Messages reference a blob by its URL path (/api/blobs/<sha256>).
+
+Offload inline base64 images already in db.messages:
+`python blob_store.py --migrate`
+"""
+import os
+import re
+import sys
+import base64
+import asyncio
+import hashlib
+import logging
+import argparse
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+from image_pipeline import ALLOWED_FORMATS, sniff_image_type
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+BLOB_URL_PREFIX = "/api/blobs/"
+# Chunk size used when streaming bytes to the client
+BLOB_STREAM_CHUNK = 256 * 1024
+# Largest image accepted from a data URL
+BLOB_MAX_IMAGE_BYTES = int(os.getenv("BLOB_MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+# Content types served inline; any other stored type is sent as an attachment
+BLOB_INLINE_TYPES = frozenset(content_type for content_type, _ in ALLOWED_FORMATS.values())
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+_DATA_URL_RE = re.compile(r"^data:(?P<type>[\w.+-]+/[\w.+-]+)?(?P<params>(;[\w-]+=[^;,]*)*)(?P<b64>;base64)?,", re.I)
+
+
+def is_sha256(value: str) -> bool:
+    return bool(_SHA256_RE.match(value or ""))
+
+
+def blob_url(sha256: str) -> str:
+    return f"{BLOB_URL_PREFIX}{sha256}"
+
+
+def blob_sha_from_url(value: Optional[str]) -> Optional[str]:
+    """sha256 referenced by a message's content, None for anything else"""
+    if value and value.startswith(BLOB_URL_PREFIX):
+        sha256 = value[len(BLOB_URL_PREFIX):]
+        if is_sha256(sha256):
+            return sha256
+    return None
+
+
+def decode_data_url(data_url: str) -> Tuple[bytes, str]:
+    """Bytes and declared content type of a data: URL. Raises ValueError if malformed."""
+    match = _DATA_URL_RE.match(data_url)
+    if not match or not match.group("b64"):
+        raise ValueError("Not a base64 data URL")
+    data = base64.b64decode(data_url[match.end():], validate=False)
+    return data, (match.group("type") or "application/octet-stream").lower()
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) inclusive for a single-range `bytes=` header, None to send the whole blob.
+
+    Raises ValueError when the range cannot be satisfied (HTTP 416).
+    Multi-range requests are answered with the whole blob, which RFC 9110 allows.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid range: {header}")
+    if start >= size or end < start:
+        raise ValueError(f"Range not satisfiable: {header}")
+    return start, min(end, size - 1)
+
+
+class BlobStore(ABC):
+    """Metadata in db.blobs plus bytes in a backend; subclasses implement the byte I/O"""
+
+    backend = "abstract"
+
+    def __init__(self, db):
+        self.db = db
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        """Store bytes (once per distinct content) and return their sha256"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        if await self.db.blobs.find_one({"_id": sha256}, {"_id": 1}):
+            return sha256
+        await self._write(sha256, data)
+        await self.db.blobs.update_one(
+            {"_id": sha256},
+            {"$setOnInsert": {
+                "content_type": content_type,
+                "size": len(data),
+                "backend": self.backend,
+                "created_at": datetime.utcnow(),
+            }},
+            upsert=True
+        )
+        return sha256
+
+    async def stat(self, sha256: str) -> Optional[Dict[str, Any]]:
+        if not is_sha256(sha256):
+            return None
+        return await self.db.blobs.find_one({"_id": sha256})
+
+    @abstractmethod
+    def iter_range(self, sha256: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Bytes start..end (inclusive) in BLOB_STREAM_CHUNK pieces"""
+
+    @abstractmethod
+    async def _write(self, sha256: str, data: bytes):
+        """Store the bytes under sha256 (may already exist)"""
+
+
+class GridFSBlobStore(BlobStore):
+    """Bytes in a GridFS bucket, file name = sha256"""
+
+    backend = "gridfs"
+
+    def __init__(self, db, bucket_name: str = "blobs"):
+        super().__init__(db)
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+
+    async def _write(self, sha256: str, data: bytes):
+        async for _ in self.bucket.find({"filename": sha256}, limit=1):
+            return  # Bytes survived an earlier write whose metadata insert failed
+        await self.bucket.upload_from_stream(sha256, data)
+
+    async def iter_range(self, sha256: str, start: int, end: int) -> AsyncIterator[bytes]:
+        stream = await self.bucket.open_download_stream_by_name(sha256)
+        try:
+            stream.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await stream.read(min(BLOB_STREAM_CHUNK, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            stream.close()
+
+
+class LocalBlobStore(BlobStore):
+    """Bytes under root/ab/cd/<sha256>; file I/O runs in the default thread pool"""
+
+    backend = "local"
+
+    def __init__(self, db, root: str):
+        super().__init__(db)
+        self.root = root
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def _write_file(self, sha256: str, data: bytes):
+        path = self._path(sha256)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial blob
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as handle:
+            handle.write(data)
+        os.replace(temp_path, path)
+
+    async def _write(self, sha256: str, data: bytes):
+        await asyncio.get_running_loop().run_in_executor(None, self._write_file, sha256, data)
+
+    def _read_file(self, sha256: str, offset: int, length: int) -> bytes:
+        with open(self._path(sha256), "rb") as handle:
+            handle.seek(offset)
+            return handle.read(length)
+
+    async def iter_range(self, sha256: str, start: int, end: int) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        offset = start
+        while offset <= end:
+            chunk = await loop.run_in_executor(None, self._read_file, sha256, offset, min(BLOB_STREAM_CHUNK, end - offset + 1))
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+
+
+def create_blob_store(db, spec: Optional[str] = None) -> BlobStore:
+    """Blob store from BLOB_STORE; GridFS when unset"""
+    spec = spec if spec is not None else os.getenv("BLOB_STORE", "gridfs")
+    if spec.startswith("local:"):
+        return LocalBlobStore(db, spec[len("local:"):])
+    return GridFSBlobStore(db)
+
+
+async def migrate_inline_images(db, store: BlobStore, batch_size: int = 100) -> Dict[str, int]:
+    """Move base64 data URLs out of db.messages into the blob store.
+
+    Only images in an allowed format move, stored under their sniffed content
+    type; anything else is left in place and counted as failed. Safe to stop
+    and re-run: converted messages no longer match the query.
+    """
+    query = {"content_type": "image", "content": {"$regex": "^data:"}}
+    stats = {"migrated": 0, "failed": 0, "bytes": 0}
+    failed_ids = []
+    started = datetime.utcnow()
+    while True:
+        batch = await db.messages.find(
+            {**query, "id": {"$nin": failed_ids}}, {"_id": 0, "id": 1, "content": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        for message in batch:
+            try:
+                data, declared_type = decode_data_url(message["content"])
+                if not declared_type.startswith("image/"):
+                    raise ValueError(f"Declared type {declared_type} is not an image")
+                # Legacy data URLs came from clients: store the type the bytes really are
+                sha256 = await store.put(data, sniff_image_type(data))
+                await db.messages.update_one(
+                    {"id": message["id"], "content": message["content"]},
+                    {"$set": {"content": blob_url(sha256)}}
+                )
+                stats["migrated"] += 1
+                stats["bytes"] += len(message["content"])
+            except Exception as e:
+                failed_ids.append(message["id"])
+                stats["failed"] += 1
+                logger.warning(f"Could not migrate image of message {message['id']}: {e}")
+        elapsed = (datetime.utcnow() - started).total_seconds() or 1
+        logger.info(f"🖼️ Image migration: {stats['migrated']} messages moved ({stats['migrated'] / elapsed:.0f}/s)")
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="CashOutAI chat image blob store")
+    parser.add_argument("--migrate", action="store_true", help="offload inline base64 images from db.messages")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    if not args.migrate:
+        parser.print_help()
+        sys.exit(0)
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def main():
+        client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017/emergent_db"))
+        database = client[os.getenv("DB_NAME", "emergent_db")]
+        result = await migrate_inline_images(database, create_blob_store(database), args.batch_size)
+        print(result)
+
+    asyncio.run(main())
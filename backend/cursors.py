@@ -0,0 +1,88 @@
+"""Opaque keyset cursors over (timestamp, id) for message listings.
+
+A cursor names one message position. Pages are read with
+`timestamp/id` range predicates on the compound index instead of skip/limit
+or a bare timestamp, so ties on timestamp never drop or repeat messages and
+"anything newer than X?" is a single index probe.
+"""
+import base64
+import binascii
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+CursorKey = Tuple[datetime, str]
+
+
+def _stored_timestamp(value: str) -> datetime:
+    """Naive UTC, like stored message timestamps; hand-made cursors may carry an offset"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def encode_cursor(timestamp: datetime, message_id: str) -> str:
+    raw = f"{timestamp.isoformat()}|{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> CursorKey:
+    """(timestamp, id) of a cursor; raises ValueError if it was not made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        timestamp, message_id = raw.split("|", 1)
+        return _stored_timestamp(timestamp), message_id
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {token}")
+
+
+def cursor_of(message: Any) -> str:
+    return encode_cursor(message.timestamp, message.id)
+
+
+def keyset_filter(before: Optional[CursorKey] = None, after: Optional[CursorKey] = None,
+                  timestamp_field: str = "timestamp", id_field: str = "id") -> Dict[str, Any]:
+    """MongoDB filter for keys strictly before and/or after the given positions"""
+    clauses = []
+    if before is not None:
+        clauses.append({"$or": [
+            {timestamp_field: {"$lt": before[0]}},
+            {timestamp_field: before[0], id_field: {"$lt": before[1]}},
+        ]})
+    if after is not None:
+        clauses.append({"$or": [
+            {timestamp_field: {"$gt": after[0]}},
+            {timestamp_field: after[0], id_field: {"$gt": after[1]}},
+        ]})
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+RankedKey = Tuple[float, datetime, str]
+
+
+def encode_ranked_cursor(score: float, timestamp: datetime, message_id: str) -> str:
+    """Cursor for relevance-ordered results: (score, timestamp, id), all descending"""
+    raw = f"{score!r}|{timestamp.isoformat()}|{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_ranked_cursor(token: str) -> RankedKey:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        score, timestamp, message_id = raw.split("|", 2)
+        return float(score), _stored_timestamp(timestamp), message_id
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {token}")
+
+
+def ranked_keyset_filter(after: RankedKey, score_field: str = "score",
+                         timestamp_field: str = "timestamp", id_field: str = "id") -> Dict[str, Any]:
+    """Filter for results ranked below `after` in (score, timestamp, id) descending order"""
+    score, timestamp, message_id = after
+    return {"$or": [
+        {score_field: {"$lt": score}},
+        {score_field: score, timestamp_field: {"$lt": timestamp}},
+        {score_field: score, timestamp_field: timestamp, id_field: {"$lt": message_id}},
+    ]}
@@ -0,0 +1,150 @@
+"""Sequenced chat event stream with a replay ring buffer for gap-free WebSocket resume"""
+import os
+import bisect
+import logging
+from typing import Dict, List, Optional, Any, Iterable, Set, Callable
+
+from pymongo import ReturnDocument
+
+from frames import Frame, as_frame
+from websocket_manager import TOPIC_CHAT_GLOBAL
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Recent events kept in memory for replay on reconnect
+EVENT_REPLAY_SIZE = int(os.getenv("WS_EVENT_REPLAY_SIZE", "2000"))
+
+# Counter document that hands out sequence numbers shared by every worker
+EVENT_SEQ_COUNTER_ID = "ws_events"
+
+# Sequenced frames start with their seq so transports can read it without parsing the JSON
+_SEQ_PREFIX = '{"seq":'
+
+
+def frame_seq(frame: str) -> Optional[int]:
+    """seq of a sequenced event frame, None for any other frame"""
+    if not frame.startswith(_SEQ_PREFIX):
+        return None
+    return int(frame[len(_SEQ_PREFIX):frame.index(",", len(_SEQ_PREFIX))])
+
+
+class EventStream:
+    """Broadcast events (new messages, deletions) stamped with a global sequence number.
+
+    Sequence numbers come from an atomic counter in db.counters so they are
+    monotonic across workers. Every worker keeps the latest EVENT_REPLAY_SIZE
+    events, ordered by seq, so a client that reconnects with its last seen seq
+    gets exactly the events it missed on the topics it is subscribed to.
+    Older gaps return None and the caller falls back to the database.
+    """
+
+    def __init__(self, db, manager, size: int = EVENT_REPLAY_SIZE):
+        self.db = db
+        self.manager = manager
+        self.size = size
+        self.seqs: List[int] = []
+        self.frames: List[Frame] = []
+        self.topics: List[List[str]] = []
+        # Highest seq this worker cannot replay past (events before start-up or trimmed)
+        self.floor = 0
+        self.replayed = 0
+        self.resyncs = 0
+        self.listeners: List[Callable[[str, Dict[str, Any]], Any]] = []
+        manager.register_handler("event", self._apply_event)
+
+    def add_listener(self, listener: Callable[[str, Dict[str, Any]], Any]):
+        """Called with (event_type, data) for every event on every worker, e.g. to keep caches current"""
+        self.listeners.append(listener)
+
+    @property
+    def latest_seq(self) -> int:
+        return self.seqs[-1] if self.seqs else self.floor
+
+    async def _next_seq(self) -> int:
+        counter = await self.db.counters.find_one_and_update(
+            {"_id": EVENT_SEQ_COUNTER_ID},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter["seq"]
+
+    async def publish(self, event_type: str, data: Dict[str, Any], topics: Iterable[str] = (TOPIC_CHAT_GLOBAL,)) -> int:
+        """Stamp an event with the next seq and deliver it to the topic's subscribers on every worker"""
+        seq = await self._next_seq()
+        # Encoded once here (lazily, per wire encoding) and shared by every subscriber
+        frame = Frame({"seq": seq, "type": event_type, "data": data})
+        self.manager.publish({"op": "event", "seq": seq, "topics": list(topics), "frame": frame})
+        return seq
+
+    def _apply_event(self, envelope: Dict[str, Any]) -> int:
+        topics = envelope.get("topics") or [TOPIC_CHAT_GLOBAL]
+        frame = as_frame(envelope["frame"])  # Text when it came through the broker
+        self._remember(envelope["seq"], frame, topics)
+        if self.listeners:
+            event = frame.payload
+            for listener in self.listeners:
+                try:
+                    listener(event["type"], event["data"])
+                except Exception as e:
+                    logger.error(f"Event listener error for {event['type']}: {e}")
+        return self.manager.apply({"op": "topics", "topics": topics, "frame": frame})
+
+    def _remember(self, seq: int, frame: Frame, topics: List[str]):
+        if seq <= self.floor:
+            return
+        if not self.seqs or seq > self.seqs[-1]:
+            self.seqs.append(seq)
+            self.frames.append(frame)
+            self.topics.append(topics)
+        else:
+            # Another worker's event arrived late - keep the buffer ordered by seq
+            index = bisect.bisect_left(self.seqs, seq)
+            if index < len(self.seqs) and self.seqs[index] == seq:
+                return
+            self.seqs.insert(index, seq)
+            self.frames.insert(index, frame)
+            self.topics.insert(index, topics)
+        if len(self.seqs) > self.size:
+            trim = len(self.seqs) - self.size
+            self.floor = self.seqs[trim - 1]
+            del self.seqs[:trim]
+            del self.frames[:trim]
+            del self.topics[:trim]
+
+    def replay(self, last_seq: int, topics: Optional[Set[str]] = None) -> Optional[List[Frame]]:
+        """Frames after last_seq (limited to the given topics), or None when the gap is older than the buffer"""
+        if last_seq < self.floor:
+            self.resyncs += 1
+            return None
+        start = bisect.bisect_right(self.seqs, last_seq)
+        if topics is None:
+            frames = self.frames[start:]
+        else:
+            frames = [
+                frame for frame, event_topics in zip(self.frames[start:], self.topics[start:])
+                if not topics.isdisjoint(event_topics)
+            ]
+        self.replayed += len(frames)
+        return frames
+
+    async def start(self):
+        """Anything published before this worker started can only be served from the DB"""
+        counter = await self.db.counters.find_one({"_id": EVENT_SEQ_COUNTER_ID})
+        if counter:
+            self.floor = max(self.floor, counter.get("seq", 0))
+            # Drop anything that raced in below the new floor
+            index = bisect.bisect_right(self.seqs, self.floor)
+            del self.seqs[:index]
+            del self.frames[:index]
+            del self.topics[:index]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "latest_seq": self.latest_seq,
+            "buffered": len(self.seqs),
+            "floor": self.floor,
+            "replayed": self.replayed,
+            "resyncs": self.resyncs,
+        }
@@ -1,20 +1,112 @@
 import os
+import sys
 import json
+import time
+import uuid
+import asyncio
 import logging
-from typing import List, Optional, Dict, Any
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Iterable, List, Optional, Dict, Any
 from datetime import datetime
-from firebase_admin import credentials, initialize_app, messaging
+from firebase_admin import credentials, initialize_app, messaging, exceptions
 import firebase_admin
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# FCM accepts at most 500 tokens per multicast
+FCM_MULTICAST_MAX_TOKENS = 500
+# Threads running the blocking Firebase HTTPS calls; also caps concurrent requests to FCM
+FCM_MAX_WORKERS = int(os.getenv("FCM_MAX_WORKERS", "8"))
+# "local" sends through LocalTransport instead of Firebase (offline benchmarks and development)
+FCM_TRANSPORT = os.getenv("FCM_TRANSPORT", "firebase")
+# Test projects without FCM enabled answer 404: with FCM_TEST_MODE=true those sends are
+# reported as delivered (logged, never counted as sent). Off by default.
+FCM_TEST_MODE = os.getenv("FCM_TEST_MODE", "false").lower() == "true"
+
+
+def is_invalid_token_error(error: Optional[Exception]) -> bool:
+    """True when FCM says the token itself is dead (app uninstalled, token rotated or malformed)"""
+    if isinstance(error, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+        return True
+    return isinstance(error, exceptions.InvalidArgumentError) and "registration token" in str(error).lower()
+
+
+def stringify_data(data: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """FCM data payloads are string-to-string; drop empty values and stringify the rest"""
+    return {str(key): value if isinstance(value, str) else json.dumps(value, default=str)
+            for key, value in (data or {}).items() if value is not None}
+
+
+class FirebaseTransport:
+    """The real thing: blocking firebase_admin.messaging calls (run them off the event loop)"""
+
+    def send(self, message: messaging.Message) -> str:
+        return messaging.send(message)
+
+    def send_each_for_multicast(self, message: messaging.MulticastMessage) -> messaging.BatchResponse:
+        return messaging.send_each_for_multicast(message)
+
+
+class LocalTransport:
+    """Offline stand-in for FCM: blocks for `latency` seconds per call like an HTTPS round trip,
+    and answers tokens starting with `invalid` as unregistered"""
+
+    def __init__(self, latency: float = 0.05, invalid_prefix: str = "invalid"):
+        self.latency = latency
+        self.invalid_prefix = invalid_prefix
+        self.calls = 0
+
+    def _response(self, token: str) -> messaging.SendResponse:
+        if token.startswith(self.invalid_prefix):
+            return messaging.SendResponse(None, messaging.UnregisteredError("Requested entity was not found."))
+        return messaging.SendResponse({"name": f"projects/local/messages/{uuid.uuid4()}"}, None)
+
+    def send(self, message: messaging.Message) -> str:
+        self.calls += 1
+        time.sleep(self.latency)
+        response = self._response(message.token)
+        if response.exception:
+            raise response.exception
+        return response.message_id
+
+    def send_each_for_multicast(self, message: messaging.MulticastMessage) -> messaging.BatchResponse:
+        self.calls += 1
+        time.sleep(self.latency)
+        return messaging.BatchResponse([self._response(token) for token in message.tokens])
+
+
 class FCMService:
-    """Firebase Cloud Messaging service for sending push notifications"""
-    
-    def __init__(self):
+    """Firebase Cloud Messaging service for sending push notifications.
+
+    Firebase's client is blocking, so every send runs on a bounded thread pool
+    and the event loop only awaits it. Multicasts are split into chunks of at
+    most FCM_MULTICAST_MAX_TOKENS sent concurrently, and tokens FCM reports as
+    dead are handed to the token pruner (set by the server) for deletion.
+    """
+
+    def __init__(self, transport=None, max_workers: int = FCM_MAX_WORKERS, test_mode: bool = FCM_TEST_MODE):
         self.initialized = False
+        self.test_mode = test_mode
+        self.transport = transport
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fcm")
+        self.max_workers = max_workers
+        self.token_pruner: Optional[Callable[[List[str]], Awaitable[Any]]] = None
+        self.sent = 0
+        self.failed = 0
+        self.pruned = 0
+        self.simulated = 0
+        if transport is not None:
+            self.initialized = True
+            return
+        if FCM_TRANSPORT == "local":
+            self.transport = LocalTransport()
+            self.initialized = True
+            logger.info("FCM using local transport - nothing leaves this machine")
+            return
+        self.transport = FirebaseTransport()
         try:
             # Check if Firebase is already initialized
             try:
@@ -24,7 +116,7 @@ class FCMService:
                 return
             except ValueError:
                 pass
-            
+
             # Try env var first (for Render), then file
             cred = None
             firebase_creds_json = os.getenv("FIREBASE_ADMIN_CREDENTIALS")
@@ -37,7 +129,7 @@ class FCMService:
                 if os.path.exists(cred_path):
                     cred = credentials.Certificate(cred_path)
                     logger.info("Firebase Admin SDK initialized from file")
-            
+
             if cred:
                 initialize_app(cred)
                 self.initialized = True
@@ -46,18 +138,40 @@ class FCMService:
         except Exception as e:
             logger.warning(f"Firebase Admin SDK initialization failed: {str(e)}")
             self.initialized = False
-    
-    async def send_notification(self, token: str, title: str, body: str, 
+
+    def set_token_pruner(self, pruner: Callable[[List[str]], Awaitable[Any]]):
+        """Register the coroutine that deletes tokens FCM reports as unregistered or invalid"""
+        self.token_pruner = pruner
+
+    async def _run(self, call, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call, *args)
+
+    def _simulated_404(self, error: BaseException) -> bool:
+        """FCM_TEST_MODE only: a 404 from a test project counts as delivered"""
+        return self.test_mode and isinstance(error, exceptions.NotFoundError)
+
+    async def _prune(self, tokens: Iterable[str]):
+        tokens = list(dict.fromkeys(tokens))
+        if not tokens or self.token_pruner is None:
+            return
+        try:
+            await self.token_pruner(tokens)
+            self.pruned += len(tokens)
+            logger.info(f"🧹 Pruned {len(tokens)} dead FCM tokens")
+        except Exception as e:
+            logger.error(f"Failed to prune FCM tokens: {e}")
+
+    async def send_notification(self, token: str, title: str, body: str,
                                data: Optional[Dict[str, str]] = None) -> bool:
         """
         Send a notification to a single device
-        
+
         Args:
             token: FCM device token
             title: Notification title
             body: Notification body
             data: Optional data payload
-            
+
         Returns:
             bool: True if notification was sent successfully, False otherwise
         """
@@ -65,7 +179,7 @@ class FCMService:
         if not self.initialized:
             logger.info(f"[TEST MODE] Would send notification to {token}: {title} - {body}")
             return True
-            
+
         try:
             # Create message
             message = messaging.Message(
@@ -73,34 +187,40 @@ class FCMService:
                     title=title,
                     body=body
                 ),
-                data=data or {},
+                data=stringify_data(data),
                 token=token
             )
-            
-            # Send message
-            response = messaging.send(message)
+
+            # Send message (blocking HTTPS call, on the FCM thread pool)
+            response = await self._run(self.transport.send, message)
+            self.sent += 1
             logger.info(f"Successfully sent notification to {token}: {response}")
             return True
         except Exception as e:
-            logger.error(f"Failed to send notification to {token}: {str(e)}")
-            # In test environment, consider it a success even if Firebase fails
-            if "404" in str(e):
+            if is_invalid_token_error(e):
+                self.failed += 1
+                await self._prune([token])
+                return False
+            if self._simulated_404(e):
+                self.simulated += 1
                 logger.info(f"[TEST MODE] Would send notification to {token}: {title} - {body}")
                 return True
+            self.failed += 1
+            logger.error(f"Failed to send notification to {token}: {str(e)}")
             return False
-    
-    async def send_chat_notification(self, token: str, sender_name: str, message_content: str, 
+
+    async def send_chat_notification(self, token: str, sender_name: str, message_content: str,
                                     sender_id: str, message_type: str = "text") -> bool:
         """
         Send a chat notification to a single device
-        
+
         Args:
             token: FCM device token
             sender_name: Name of the message sender
             message_content: Content of the message
             sender_id: ID of the sender
             message_type: Type of message (text, image, etc.)
-            
+
         Returns:
             bool: True if notification was sent successfully, False otherwise
         """
@@ -109,7 +229,7 @@ class FCMService:
             message_preview = "📷 Sent an image"
         else:
             message_preview = message_content[:100] + "..." if len(message_content) > 100 else message_content
-        
+
         # Send notification
         return await self.send_notification(
             token=token,
@@ -123,57 +243,156 @@ class FCMService:
                 "timestamp": str(int(datetime.utcnow().timestamp()))
             }
         )
-    
-    async def send_to_multiple(self, tokens: List[str], title: str, body: str, 
+
+    async def _send_chunk(self, tokens: List[str], notification: messaging.Notification, data: Dict[str, str]) -> List[messaging.SendResponse]:
+        """Per-token responses for one chunk; raises if the request as a whole failed"""
+        message = messaging.MulticastMessage(notification=notification, data=data, tokens=tokens)
+        response = await self._run(self.transport.send_each_for_multicast, message)
+        return list(response.responses)
+
+    async def send_to_multiple(self, tokens: List[str], title: str, body: str,
                               data: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
         """
         Send a notification to multiple devices
-        
+
         Args:
             tokens: List of FCM device tokens
             title: Notification title
             body: Notification body
             data: Optional data payload
-            
+
         Returns:
-            dict: Result with success and failure counts
+            dict: Result with success and failure counts, per-token results and the tokens pruned
         """
+        tokens = list(dict.fromkeys(tokens))
         if not tokens:
             logger.warning("No tokens provided for multicast notification")
             return {"success_count": 0, "failure_count": 0}
-        
+
         # In test environment, just log the notification and return success
         if not self.initialized:
             logger.info(f"[TEST MODE] Would send multicast notification to {len(tokens)} devices: {title} - {body}")
             return {"success_count": len(tokens), "failure_count": 0}
-            
-        try:
-            # Create multicast message
-            message = messaging.MulticastMessage(
-                notification=messaging.Notification(
-                    title=title,
-                    body=body
-                ),
-                data=data or {},
-                tokens=tokens
-            )
-            
-            # Send multicast message
-            response = messaging.send_multicast(message)
-            logger.info(f"Multicast notification results: {response.success_count} successful, {response.failure_count} failed")
-            
-            return {
-                "success_count": response.success_count,
-                "failure_count": response.failure_count,
-                "responses": [r.success for r in response.responses]
-            }
-        except Exception as e:
-            logger.error(f"Failed to send multicast notification: {str(e)}")
-            # In test environment, consider it a success even if Firebase fails
-            if "404" in str(e):
-                logger.info(f"[TEST MODE] Would send multicast notification to {len(tokens)} devices: {title} - {body}")
-                return {"success_count": len(tokens), "failure_count": 0}
-            return {"success_count": 0, "failure_count": len(tokens), "error": str(e)}
+
+        notification = messaging.Notification(title=title, body=body)
+        data = stringify_data(data)
+        chunks = [tokens[start:start + FCM_MULTICAST_MAX_TOKENS] for start in range(0, len(tokens), FCM_MULTICAST_MAX_TOKENS)]
+        results = await asyncio.gather(*(self._send_chunk(chunk, notification, data) for chunk in chunks), return_exceptions=True)
+
+        responses: List[bool] = []
+        invalid_tokens: List[str] = []
+        errors = set()
+        simulated = 0
+        for chunk, outcome in zip(chunks, results):
+            if isinstance(outcome, BaseException):
+                if self._simulated_404(outcome):
+                    logger.info(f"[TEST MODE] Would send multicast notification to {len(chunk)} devices: {title} - {body}")
+                    simulated += len(chunk)
+                    responses.extend([True] * len(chunk))
+                    continue
+                # The whole request failed, so there is no per-token verdict and nothing is pruned
+                logger.error(f"Failed to send multicast chunk of {len(chunk)}: {str(outcome)}")
+                responses.extend([False] * len(chunk))
+                errors.add(str(outcome))
+                continue
+            # Only tokens FCM itself reports as unregistered or invalid (responses[i] is tokens[i])
+            for token, response in zip(chunk, outcome):
+                responses.append(response.success)
+                if is_invalid_token_error(response.exception):
+                    invalid_tokens.append(token)
+                elif response.exception:
+                    errors.add(str(response.exception))
+
+        success_count = sum(responses)
+        failure_count = len(responses) - success_count
+        self.sent += success_count - simulated
+        self.simulated += simulated
+        self.failed += failure_count
+        await self._prune(invalid_tokens)
+        logger.info(f"Multicast notification results: {success_count} successful, {failure_count} failed ({len(chunks)} chunks)")
+
+        result = {
+            "success_count": success_count,
+            "failure_count": failure_count,
+            "responses": responses,
+            "invalid_tokens": invalid_tokens
+        }
+        if errors and success_count == 0:
+            result["error"] = "; ".join(sorted(errors))
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "initialized": self.initialized,
+            "transport": type(self.transport).__name__,
+            "workers": self.max_workers,
+            "sent": self.sent,
+            "failed": self.failed,
+            "pruned": self.pruned,
+            "simulated": self.simulated
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 # Create a singleton instance
-fcm_service = FCMService()
\ No newline at end of file
+fcm_service = FCMService()
+
+
+async def _benchmark(sends: int, tokens: int, latency: float, workers: int):
+    """Event-loop stall and throughput of pushes, blocking on the loop vs on the thread pool"""
+    token_list = [f"token-{index}" for index in range(tokens - tokens // 20)] + [f"invalid-{index}" for index in range(tokens // 20)]
+    print(f"{sends} multicasts to {tokens} tokens each, {latency * 1000:.0f} ms per FCM call")
+
+    async def run(label, send):
+        lag = []
+        done = asyncio.Event()
+
+        async def ticker():
+            # Event-loop responsiveness: how late a 10 ms timer fires while pushes run
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lag.append((time.perf_counter() - started) * 1000 - 10)
+
+        tick = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        await asyncio.gather(*(send() for _ in range(sends)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await tick
+        print(f"{label:<30} {elapsed:6.2f} s  {sends * tokens / elapsed:9.0f} tokens/s  max loop stall {max(lag or [0]):7.1f} ms")
+
+    transport = LocalTransport(latency)
+
+    async def blocking():
+        # Before: the blocking call made directly from the coroutine. One request, and only the
+        # first 500 tokens - MulticastMessage rejects longer lists, so larger sends used to fail outright
+        transport.send_each_for_multicast(messaging.MulticastMessage(tokens=token_list[:FCM_MULTICAST_MAX_TOKENS], notification=messaging.Notification(title="t", body="b")))
+
+    pruned = []
+
+    async def pruner(dead):
+        pruned.extend(dead)
+
+    service = FCMService(transport=LocalTransport(latency), max_workers=workers)
+    service.set_token_pruner(pruner)
+
+    async def dispatched():
+        await service.send_to_multiple(token_list, "t", "b", {"type": "benchmark"})
+
+    await run("blocking on event loop", blocking)
+    await run(f"thread pool ({workers}w, chunked)", dispatched)
+    print(f"FCM calls {service.transport.calls}, dead tokens pruned {len(set(pruned))}")
+    service.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark FCM dispatch against a local fake transport")
+    parser.add_argument("--sends", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=1200)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, default=FCM_MAX_WORKERS)
+    args = parser.parse_args()
+    asyncio.run(_benchmark(args.sends, args.tokens, args.latency, args.workers))
+    sys.exit(0)
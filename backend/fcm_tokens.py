@@ -0,0 +1,179 @@
+"""FCM device tokens: one document per (user, device), cached in memory for every push.
+
+Each registered device is its own db.fcm_tokens document, so a user's phone
+and laptop both get pushes. A token belongs to at most one user (unique
+index on `token`); a device re-registering with a rotated token replaces its
+old one (unique on user_id + device_id, for clients that send a device_id).
+Writes go to MongoDB first and are then applied to every worker's
+user -> tokens map through the ConnectionManager backplane, so push paths
+resolve audiences without a query. A periodic reload catches changes made
+outside the server.
+"""
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+FCM_TOKEN_RELOAD_INTERVAL = float(os.getenv("FCM_TOKEN_RELOAD_INTERVAL", "600"))
+
+
+class FCMTokenRegistry:
+    """Write-through user -> device tokens cache over db.fcm_tokens"""
+
+    def __init__(self, db, manager):
+        self.db = db
+        self.manager = manager
+        self.tokens_by_user: Dict[str, Set[str]] = {}
+        self.owners: Dict[str, str] = {}  # token -> user_id
+        self.loaded = False
+        self._task: Optional[asyncio.Task] = None
+        manager.register_handler("fcm_tokens", self._apply)
+
+    # ---- reads ----
+
+    def tokens_for(self, user_id: str) -> List[str]:
+        return list(self.tokens_by_user.get(user_id, ()))
+
+    def tokens_for_users(self, user_ids: Iterable[str]) -> List[str]:
+        tokens: List[str] = []
+        for user_id in user_ids:
+            tokens.extend(self.tokens_by_user.get(user_id, ()))
+        return tokens
+
+    @property
+    def count(self) -> int:
+        return len(self.owners)
+
+    # ---- writes (MongoDB first, then every worker's cache) ----
+
+    async def ensure_indexes(self):
+        await self.db.fcm_tokens.create_index([("token", ASCENDING)], unique=True)
+        await self.db.fcm_tokens.create_index(
+            [("user_id", ASCENDING), ("device_id", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"device_id": {"$type": "string"}},
+        )
+
+    async def register(self, user_id: str, token: str, device_id: Optional[str] = None, platform: Optional[str] = None):
+        """Add or refresh one device's token for a user"""
+        now = datetime.utcnow()
+        # Tokens deleted on any attempt - a retry finds nothing left to delete but must still announce them
+        replaced = []
+        for attempt in range(2):
+            try:
+                if device_id:
+                    # The device's previous token (rotation) goes away
+                    previous = await self.db.fcm_tokens.find_one_and_delete(
+                        {"user_id": user_id, "device_id": device_id, "token": {"$ne": token}},
+                        projection={"_id": 0, "token": 1},
+                    )
+                    if previous:
+                        replaced.append(previous["token"])
+                # Keyed on the token: a device that switches accounts moves its token to the new user
+                await self.db.fcm_tokens.update_one(
+                    {"token": token},
+                    {
+                        "$set": {"user_id": user_id, "device_id": device_id, "platform": platform, "updated_at": now},
+                        "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now},
+                    },
+                    upsert=True,
+                )
+                break
+            except DuplicateKeyError:
+                # Lost a race with a concurrent registration of the same token or device
+                if attempt:
+                    if replaced:
+                        self.manager.publish({"op": "fcm_tokens", "removed": replaced})
+                    raise
+        self.manager.publish({"op": "fcm_tokens", "user_id": user_id, "added": [token], "removed": replaced})
+
+    async def remove_tokens(self, tokens: List[str]):
+        """Forget tokens FCM reported as dead (the FCM service's token pruner)"""
+        if not tokens:
+            return
+        await self.db.fcm_tokens.delete_many({"token": {"$in": tokens}})
+        self.manager.publish({"op": "fcm_tokens", "removed": tokens})
+
+    async def remove_user(self, user_id: str) -> int:
+        """Drop every device of a deleted user; returns documents deleted"""
+        result = await self.db.fcm_tokens.delete_many({"user_id": user_id})
+        self.manager.publish({"op": "fcm_tokens", "removed_user": user_id})
+        return result.deleted_count
+
+    # ---- envelopes from any worker (including this one) ----
+
+    def _apply(self, envelope: Dict[str, Any]):
+        for token in envelope.get("removed") or []:
+            self._discard(token)
+        removed_user = envelope.get("removed_user")
+        if removed_user:
+            for token in self.tokens_by_user.pop(removed_user, set()):
+                self.owners.pop(token, None)
+        for token in envelope.get("added") or []:
+            self._discard(token)
+            self.owners[token] = envelope["user_id"]
+            self.tokens_by_user.setdefault(envelope["user_id"], set()).add(token)
+
+    def _discard(self, token: str):
+        user_id = self.owners.pop(token, None)
+        if user_id is None:
+            return
+        tokens = self.tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self.tokens_by_user[user_id]
+
+    # ---- lifecycle ----
+
+    async def load(self):
+        docs = await self.db.fcm_tokens.find({}, {"_id": 0, "user_id": 1, "token": 1}).to_list(None)
+        tokens_by_user: Dict[str, Set[str]] = {}
+        owners: Dict[str, str] = {}
+        for doc in docs:
+            if doc.get("user_id") and doc.get("token"):
+                owners[doc["token"]] = doc["user_id"]
+                tokens_by_user.setdefault(doc["user_id"], set()).add(doc["token"])
+        self.tokens_by_user, self.owners = tokens_by_user, owners
+        self.loaded = True
+        logger.info(f"📱 FCM token registry loaded: {len(owners)} devices for {len(tokens_by_user)} users")
+
+    async def _reload_loop(self):
+        while True:
+            await asyncio.sleep(FCM_TOKEN_RELOAD_INTERVAL)
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error(f"Error reloading FCM tokens: {e}")
+
+    async def start(self):
+        try:
+            await self.ensure_indexes()
+        except Exception as e:
+            logger.warning(f"Could not create FCM token indexes (duplicate tokens?): {e}")
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"FCM token registry not loaded, retrying in {FCM_TOKEN_RELOAD_INTERVAL:.0f}s: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._reload_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"loaded": self.loaded, "devices": len(self.owners), "users": len(self.tokens_by_user)}
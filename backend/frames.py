@@ -0,0 +1,190 @@
+"""Encode-once outbound frames for WebSocket fan-out.
+
+A Frame is built once per event and shared by every subscriber. Each wire
+encoding is produced at most once per frame, however many connections ask
+for it:
+
+- json:            text frame (default, what browsers get today)
+- msgpack:         binary MessagePack frame
+- json+deflate:    binary, zlib-compressed JSON
+- msgpack+deflate: binary, zlib-compressed MessagePack
+
+Clients pick one with ?encoding= on /api/ws. Compressing here once per event
+replaces compressing once per socket, which is what transport-level
+permessage-deflate costs on a broadcast.
+
+Benchmark: `python frames.py --subscribers 1000`
+"""
+import sys
+import json
+import time
+import zlib
+import logging
+import argparse
+from datetime import datetime
+from typing import Any, Dict, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Binary encodings are not offered without msgpack
+    msgpack = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+DEFLATE_SUFFIX = "+deflate"
+# zlib level 6 is the usual size/CPU balance; the cost is paid once per event
+DEFLATE_LEVEL = 6
+
+SUPPORTED_ENCODINGS = {ENCODING_JSON, ENCODING_JSON + DEFLATE_SUFFIX}
+if msgpack is not None:
+    SUPPORTED_ENCODINGS |= {ENCODING_MSGPACK, ENCODING_MSGPACK + DEFLATE_SUFFIX}
+
+
+def _default(value: Any) -> Any:
+    """Types neither encoder handles natively (ObjectId, Decimal, enums without str mixin)"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(payload: Any) -> str:
+    """Fast JSON text; datetimes become ISO 8601 without a per-object fallback call"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default).decode()
+    return json.dumps(payload, default=_default)
+
+
+def loads(text: str) -> Any:
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def negotiate_encoding(requested: Optional[str]) -> str:
+    """Encoding a client asked for, or json if it is missing or unsupported"""
+    if requested and requested.lower() in SUPPORTED_ENCODINGS:
+        return requested.lower()
+    return ENCODING_JSON
+
+
+class Frame:
+    """One outbound event, serialized lazily and at most once per encoding"""
+
+    __slots__ = ("_payload", "_text", "_encoded")
+
+    def __init__(self, payload: Any = None, text: Optional[str] = None):
+        self._payload = payload
+        self._text = text
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = dumps(self._payload)
+        return self._text
+
+    @property
+    def payload(self) -> Any:
+        if self._payload is None:
+            self._payload = loads(self._text)
+        return self._payload
+
+    def encode(self, encoding: str = ENCODING_JSON) -> Union[str, bytes]:
+        """Wire form for an encoding: str for json (text frame), bytes for the binary ones"""
+        if encoding == ENCODING_JSON:
+            return self.text
+        data = self._encoded.get(encoding)
+        if data is None:
+            base, _, compression = encoding.partition("+")
+            if base == ENCODING_MSGPACK:
+                data = msgpack.packb(self.payload, default=_default)
+            else:
+                data = self.text.encode()
+            if compression:
+                data = zlib.compress(data, DEFLATE_LEVEL)
+            self._encoded[encoding] = data
+        return data
+
+    def __str__(self) -> str:
+        # Lets the backplane's json.dumps(default=str) carry the frame as its JSON text
+        return self.text
+
+
+def as_frame(frame: Union[Frame, str]) -> Frame:
+    return frame if isinstance(frame, Frame) else Frame(text=frame)
+
+
+def _sample_message(index: int) -> Dict[str, Any]:
+    """Chat message shaped like Message.dict()"""
+    return {
+        "id": f"5f0c6a52-8d0e-4a40-9d61-{index:012d}",
+        "user_id": "0b7e7c1d-3f2e-4a8e-9a43-6b5d2f1e9c10",
+        "username": "trader_joe",
+        "real_name": "Joe Trader",
+        "screen_name": "JoeTrades",
+        "content": "Picked up $TSLA calls at the open, watching $NVDA into earnings - stops at yesterday's low",
+        "content_type": "text",
+        "is_admin": False,
+        "avatar_url": "https://example.com/avatars/joe.png",
+        "highlighted_tickers": ["TSLA", "NVDA"],
+        "reply_to_id": None,
+        "reply_to": None,
+        "text_content": None,
+        "timestamp": datetime.utcnow(),
+    }
+
+
+def benchmark(subscribers: int = 1000, events: int = 200):
+    """Encode cost and bytes on the wire for broadcasting to `subscribers` sockets"""
+    payloads = [{"seq": index, "type": "message", "data": _sample_message(index)} for index in range(events)]
+
+    def run(label, encode_event):
+        started = time.perf_counter()
+        wire_bytes = 0
+        for payload in payloads:
+            wire_bytes += encode_event(payload)
+        elapsed = time.perf_counter() - started
+        print(f"{label:<40} {elapsed / events * 1000:9.3f} ms/event  {wire_bytes / events / 1024:9.1f} KiB/event on wire")
+
+    print(f"Broadcast of one chat message to {subscribers} subscribers (avg over {events} events)")
+
+    def stdlib_once(payload):
+        # What the server did before: json.dumps(default=str), same text to every socket
+        return len(json.dumps(payload, default=str).encode()) * subscribers
+
+    def per_socket_deflate(payload):
+        # Transport permessage-deflate: one compression per socket
+        text = json.dumps(payload, default=str).encode()
+        total = 0
+        for _ in range(subscribers):
+            compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+            total += len(compressor.compress(text) + compressor.flush(zlib.Z_SYNC_FLUSH))
+        return total
+
+    def encode_once(encoding):
+        def encode_event(payload):
+            # Every subscriber's writer gets the cached bytes; only the first call encodes
+            return len(Frame(payload).encode(encoding)) * subscribers
+        return encode_event
+
+    run("json.dumps(default=str) (before)", stdlib_once)
+    run("+ permessage-deflate per socket", per_socket_deflate)
+    for encoding in sorted(SUPPORTED_ENCODINGS):
+        run(f"Frame encode once ({encoding})", encode_once(encoding))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark WebSocket frame encodings")
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=200)
+    args = parser.parse_args()
+    benchmark(args.subscribers, args.events)
+    sys.exit(0)
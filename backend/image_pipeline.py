@@ -0,0 +1,259 @@
+"""Chat image processing off the event loop.
+
+Uploads are decoded, validated and re-encoded in a process pool so a burst of
+large photos never stalls WebSocket fan-out. Each upload yields three
+metadata-free variants:
+
+- original:  full size, in the format it really is (sniffed, not trusted from the data URL)
+- display:   longest side <= IMAGE_DISPLAY_SIZE, WebP
+- thumbnail: longest side <= IMAGE_THUMB_SIZE, WebP - what chat lists render
+
+Benchmark: `python image_pipeline.py --uploads 32 --concurrency 8`
+"""
+import io
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+from PIL import Image, ImageOps, ImageSequence
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+IMAGE_PIPELINE_WORKERS = int(os.getenv("IMAGE_PIPELINE_WORKERS", str(min(4, os.cpu_count() or 1))))
+IMAGE_DISPLAY_SIZE = int(os.getenv("IMAGE_DISPLAY_SIZE", "1280"))
+IMAGE_THUMB_SIZE = int(os.getenv("IMAGE_THUMB_SIZE", "320"))
+# Reject decompression bombs before decoding any pixels
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(40_000_000)))
+
+# Sniffed format -> (content type, save options for the metadata-free original)
+ALLOWED_FORMATS = {
+    "JPEG": ("image/jpeg", {"format": "JPEG", "quality": 92}),
+    "PNG": ("image/png", {"format": "PNG"}),
+    "GIF": ("image/gif", {"format": "GIF"}),
+    "WEBP": ("image/webp", {"format": "WEBP", "quality": 90}),
+}
+DISPLAY_OPTIONS = {"format": "WEBP", "quality": 80, "method": 4}
+THUMB_OPTIONS = {"format": "WEBP", "quality": 70, "method": 4}
+
+
+def _encode(image: Image.Image, options: Dict[str, Any]) -> bytes:
+    buffer = io.BytesIO()
+    # No exif/icc/comment arguments: Pillow writes no metadata unless asked to
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def _encode_animation(image: Image.Image, options: Dict[str, Any]) -> bytes:
+    """Every frame re-encoded with its timing and the loop count - and nothing else of the upload"""
+    frames, durations = [], []
+    for frame in ImageSequence.Iterator(image):
+        copy = frame.convert("RGBA")
+        # Read after convert(): WebP frames only report their duration once loaded
+        durations.append(frame.info.get("duration", 100))
+        # The GIF writer picks up comment/extension info from the frames themselves
+        copy.info = {}
+        frames.append(copy)
+    buffer = io.BytesIO()
+    frames[0].save(buffer, save_all=True, append_images=frames[1:], duration=durations,
+                   loop=image.info.get("loop", 0), disposal=2, **options)
+    return buffer.getvalue()
+
+
+def _resized(image: Image.Image, bound: int) -> Image.Image:
+    copy = image.copy()
+    # reducing_gap decodes by whole-factor steps first, much faster than plain LANCZOS on big photos
+    copy.thumbnail((bound, bound), Image.LANCZOS, reducing_gap=3.0)
+    return copy
+
+
+def sniff_image_type(data: bytes) -> str:
+    """Content type of an allowed image format, read from the bytes' own header. Raises ValueError."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format = image.format
+    except Exception:
+        raise ValueError("Not a supported image")
+    if image_format not in ALLOWED_FORMATS:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    return ALLOWED_FORMATS[image_format][0]
+
+
+def process_image(data: bytes) -> Dict[str, Any]:
+    """Validate and re-encode one upload. Runs in a pool worker; raises ValueError for bad input."""
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Exception:
+        raise ValueError("Not a supported image")
+    if image.format not in ALLOWED_FORMATS:
+        raise ValueError(f"Unsupported image format: {image.format}")
+    if image.width * image.height > IMAGE_MAX_PIXELS:
+        raise ValueError("Image dimensions too large")
+    content_type, original_options = ALLOWED_FORMATS[image.format]
+    animated = getattr(image, "is_animated", False)
+    try:
+        image.load()
+        if animated:
+            # Re-encoded frame by frame so EXIF/XMP/comments do not survive in the original
+            original = _encode_animation(image, original_options)
+            image.seek(0)
+    except Exception:
+        raise ValueError("Corrupt image data")
+
+    # Apply the EXIF rotation to the pixels, since the EXIF block itself is dropped
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    # Animated originals keep the animation; variants show the first frame
+    if not animated:
+        flat = image.convert("RGB") if original_options["format"] == "JPEG" else image
+        original = _encode(flat, original_options)
+
+    display = _resized(image, IMAGE_DISPLAY_SIZE)
+    thumbnail = _resized(display, IMAGE_THUMB_SIZE)
+    return {
+        "format": image.format.lower() if image.format else content_type.split("/")[1],
+        "width": image.width,
+        "height": image.height,
+        "variants": {
+            "original": (original, content_type),
+            "display": (_encode(display, DISPLAY_OPTIONS), "image/webp"),
+            "thumbnail": (_encode(thumbnail, THUMB_OPTIONS), "image/webp"),
+        },
+        "thumbnail_size": [thumbnail.width, thumbnail.height],
+    }
+
+
+class ImagePipeline:
+    """Process pool for process_image, created on first use"""
+
+    def __init__(self, workers: int = IMAGE_PIPELINE_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.processed = 0
+        self.rejected = 0
+        self.total_ms = 0.0
+
+    async def process(self, data: bytes) -> Dict[str, Any]:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._pool, process_image, data)
+        except ValueError:
+            self.rejected += 1
+            raise
+        self.processed += 1
+        self.total_ms += (time.perf_counter() - started) * 1000
+        return result
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_ms / self.processed, 1) if self.processed else 0,
+        }
+
+
+def _sample_photo(width: int, height: int, seed: int) -> bytes:
+    """Noisy JPEG with an EXIF block, roughly what a phone upload costs to decode"""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 24 + seed % 8)
+    image = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+    exif = Image.Exif()
+    exif[0x0110] = "Benchmark Phone"  # Model
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90, exif=exif)
+    return buffer.getvalue()
+
+
+async def _benchmark(uploads: int, concurrency: int, width: int, height: int):
+    from frames import Frame
+
+    photos = [_sample_photo(width, height, index) for index in range(min(uploads, 4))]
+    print(f"{uploads} uploads of {width}x{height} JPEG (~{len(photos[0]) // 1024} KiB), {concurrency} at a time")
+
+    async def run(label, handle):
+        latencies = []
+        frame_bytes = []
+        lag = []
+        done = asyncio.Event()
+
+        async def ticker():
+            # Event-loop responsiveness: how late a 10 ms timer fires while uploads run
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lag.append((time.perf_counter() - started) * 1000 - 10)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def upload(index):
+            async with semaphore:
+                started = time.perf_counter()
+                result = await handle(photos[index % len(photos)])
+                # Broadcast: the chat message frame built for fan-out
+                frame_bytes.append(len(Frame({"type": "message", "data": {"id": str(index), "content_type": "image", "image": result}}).text))
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        tick = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        await asyncio.gather(*(upload(index) for index in range(uploads)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await tick
+        latencies.sort()
+        print(
+            f"{label:<28} p50 {statistics.median(latencies):8.1f} ms  p95 {latencies[int(len(latencies) * 0.95) - 1]:8.1f} ms"
+            f"  {uploads / elapsed:6.1f} uploads/s  max loop stall {max(lag or [0]):7.1f} ms"
+            f"  frame {max(frame_bytes) / 1024:7.1f} KiB"
+        )
+
+    async def inline_base64(data):
+        # Before: base64 data URL built on the event loop, stored and broadcast as is
+        import base64
+        return f"data:image/jpeg;base64,{base64.b64encode(data).decode()}"
+
+    async def on_loop(data):
+        result = process_image(data)
+        return {name: len(blob) for name, (blob, _) in result["variants"].items()}
+
+    pipeline = ImagePipeline()
+
+    async def in_pool(data):
+        result = await pipeline.process(data)
+        return {name: len(blob) for name, (blob, _) in result["variants"].items()}
+
+    await run("inline base64 (before)", inline_base64)
+    await run("pipeline on event loop", on_loop)
+    await in_pool(photos[0])  # Warm the pool so worker start-up is not measured
+    await run(f"pipeline in pool ({pipeline.workers}w)", in_pool)
+    pipeline.shutdown()
+
+    sizes = process_image(photos[0])["variants"]
+    print("Bytes per variant: " + ", ".join(f"{name} {len(blob) / 1024:.1f} KiB" for name, (blob, _) in sizes.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the chat image pipeline")
+    parser.add_argument("--uploads", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--width", type=int, default=3024)
+    parser.add_argument("--height", type=int, default=4032)
+    args = parser.parse_args()
+    asyncio.run(_benchmark(args.uploads, args.concurrency, args.width, args.height))
+    sys.exit(0)
@@ -0,0 +1,149 @@
+"""In-process cache of the most recent chat messages for the hot read endpoints"""
+import os
+import bisect
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Newest messages kept in memory: the 50-message chat page and the 500-message welcome
+# history, with headroom so a few deletions do not push welcome back onto MongoDB
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", "600"))
+
+
+def listing_view(message):
+    """Message as list endpoints send it: inline base64 images become a lazy-load placeholder"""
+    if message.content_type == "image" and message.content.startswith("data:"):
+        return message.copy(update={"content": f"__IMAGE__{message.id}__"})
+    return message
+
+
+def _sort_key(message) -> Tuple[datetime, str]:
+    return (message.timestamp, message.id)
+
+
+class RecentMessageCache:
+    """Newest MESSAGE_CACHE_SIZE messages, validated once and ordered oldest -> newest.
+
+    Loaded from MongoDB at start-up and kept current from the chat event
+    stream (new messages, deletions, purges), so it stays in sync on every
+    worker. Reads that reach further back than the cache return None and the
+    caller queries MongoDB.
+    """
+
+    def __init__(self, db, build_message: Callable[[Dict[str, Any]], Any], size: int = MESSAGE_CACHE_SIZE):
+        self.db = db
+        self.build_message = build_message
+        self.size = size
+        self.keys: List[Tuple[datetime, str]] = []
+        self.messages: List[Any] = []  # (full, listing) pairs
+        self.ids: Dict[str, Tuple[datetime, str]] = {}
+        # True while the cache holds every message in the collection
+        self.complete = False
+        self.loaded = False
+        self._pending: List[Tuple[str, Any]] = []
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self):
+        """(Re)fill from MongoDB; events that arrive meanwhile are applied afterwards"""
+        self.loaded = False
+        docs = await self.db.messages.find({}, {"_id": 0}).sort("timestamp", -1).limit(self.size).to_list(self.size)
+        self.keys, self.messages, self.ids = [], [], {}
+        for doc in reversed(docs):
+            message = self.build_message(doc)
+            if message is not None:
+                self._insert(message)
+        self.complete = len(docs) < self.size
+        self.loaded = True
+        pending, self._pending = self._pending, []
+        for op, value in pending:
+            self._apply(op, value)
+        logger.info(f"💬 Message cache loaded with {len(self.messages)} messages")
+
+    # ---- updates ----
+
+    def add(self, message):
+        self._apply("add", message)
+
+    def remove(self, message_id: str):
+        self._apply("remove", message_id)
+
+    def _apply(self, op: str, value: Any):
+        if not self.loaded:
+            self._pending.append((op, value))
+            return
+        if op == "add":
+            self._insert(value)
+        elif op == "remove":
+            self._delete(value)
+
+    def _insert(self, message):
+        if message.id in self.ids:
+            return
+        key = _sort_key(message)
+        index = bisect.bisect_right(self.keys, key)
+        if len(self.keys) >= self.size and index == 0:
+            return  # Older than everything kept
+        self.keys.insert(index, key)
+        self.messages.insert(index, (message, listing_view(message)))
+        self.ids[message.id] = key
+        if len(self.keys) > self.size:
+            self.keys.pop(0)
+            dropped, _ = self.messages.pop(0)
+            del self.ids[dropped.id]
+            self.complete = False
+
+    def _delete(self, message_id: str):
+        key = self.ids.pop(message_id, None)
+        if key is None:
+            return
+        index = bisect.bisect_left(self.keys, key)
+        del self.keys[index]
+        del self.messages[index]
+
+    # ---- reads ----
+
+    def recent(self, limit: int, before: Optional[Tuple[datetime, str]] = None, listing: bool = True) -> Optional[List[Any]]:
+        """Newest `limit` messages (keyed before the (timestamp, id) cursor), oldest first; None if MongoDB is needed"""
+        if not self.loaded:
+            self.misses += 1
+            return None
+        end = len(self.keys) if before is None else bisect.bisect_left(self.keys, before)
+        start = max(0, end - limit)
+        if end - start < limit and not self.complete:
+            # Page reaches past the oldest cached message
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [pair[1] if listing else pair[0] for pair in self.messages[start:end]]
+
+    def after(self, after: Tuple[datetime, str], limit: int, listing: bool = True) -> Optional[List[Any]]:
+        """Oldest `limit` messages keyed after the cursor, oldest first; None if MongoDB is needed"""
+        if not self.loaded or (not self.complete and (not self.keys or after < self.keys[0])):
+            # Messages between the cursor and the oldest cached one may exist only in MongoDB
+            self.misses += 1
+            return None
+        self.hits += 1
+        start = bisect.bisect_right(self.keys, after)
+        return [pair[1] if listing else pair[0] for pair in self.messages[start:start + limit]]
+
+    def has_after(self, after: Tuple[datetime, str]) -> Optional[bool]:
+        """Whether anything newer than the cursor exists; None if the cache cannot tell"""
+        if not self.loaded:
+            return None
+        if self.keys and self.keys[-1] > after:
+            return True
+        # Nothing newer in memory; every new message passes through the cache, so nothing newer exists
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "messages": len(self.messages),
+            "capacity": self.size,
+            "complete": self.complete,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
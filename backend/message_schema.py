@@ -0,0 +1,164 @@
+"""Canonical shape of stored chat messages and the migration that brings old documents up to it.
+
+Older writers stored `highlighted_tickers` as `{"symbol": ...}` dicts (or
+never extracted them) and left optional fields out, so every read had to
+patch each row before validating it. Documents stamped with the current
+MESSAGE_SCHEMA_VERSION are already in canonical form and are loaded without
+fix-ups or re-validation. New messages are stamped by their writer
+(canonical_message_doc); existing ones by MessageSchemaMigration, which runs
+in the background at start-up and can be stopped and resumed at any point.
+"""
+import os
+import re
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# 1: canonical field set; 2: highlighted_tickers extracted for every text message (ticker timeline index)
+MESSAGE_SCHEMA_VERSION = 2
+MESSAGE_MIGRATION_BATCH_SIZE = int(os.getenv("MESSAGE_MIGRATION_BATCH_SIZE", "1000"))
+
+# Optional fields every canonical document carries
+MESSAGE_DEFAULTS = {
+    "content_type": "text",
+    "is_admin": False,
+    "avatar_url": None,
+    "real_name": None,
+    "screen_name": None,
+    "reply_to_id": None,
+    "reply_to": None,
+    "text_content": None,
+}
+
+
+_TICKER_RE = re.compile(r'\$([A-Z]{1,5})')
+
+
+def extract_stock_tickers(content: str) -> List[str]:
+    """Extract stock tickers that start with $ from message content"""
+    return _TICKER_RE.findall(content.upper())
+
+
+def normalize_message_doc(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Bring a stored message document to the canonical shape (in place) and stamp the schema version"""
+    tickers = doc.get("highlighted_tickers")
+    if isinstance(tickers, list) and tickers:
+        if isinstance(tickers[0], dict):
+            # extract_tickers() shape from older writers
+            doc["highlighted_tickers"] = [ticker.get("symbol", "") for ticker in tickers if isinstance(ticker, dict) and "symbol" in ticker]
+        elif not isinstance(tickers[0], str):
+            doc["highlighted_tickers"] = []
+    else:
+        doc["highlighted_tickers"] = []
+    if not doc["highlighted_tickers"] and doc.get("content_type", "text") == "text" and "$" in doc.get("content", ""):
+        # History written before tickers were extracted
+        doc["highlighted_tickers"] = list(dict.fromkeys(extract_stock_tickers(doc["content"])))
+    for field, default in MESSAGE_DEFAULTS.items():
+        doc.setdefault(field, default)
+    doc["schema_version"] = MESSAGE_SCHEMA_VERSION
+    return doc
+
+
+def canonical_message_doc(message) -> Dict[str, Any]:
+    """The one way writers turn a Message into the document they insert"""
+    return normalize_message_doc(message.dict())
+
+
+class MessageSchemaMigration:
+    """Batched, resumable rewrite of messages below MESSAGE_SCHEMA_VERSION.
+
+    Walks the collection in _id order and only touches unstamped documents,
+    so a restart simply continues. Each update sets only the fields
+    normalization changed and is guarded on the document still being
+    unstamped, so re-runs and racing workers are no-ops. Documents that fail
+    `validate` are left unstamped and keep going through the validating read
+    path.
+    """
+
+    def __init__(self, db, validate: Callable[[Dict[str, Any]], Any], batch_size: int = MESSAGE_MIGRATION_BATCH_SIZE):
+        self.db = db
+        self.validate = validate
+        self.batch_size = batch_size
+        self.total = 0
+        self.migrated = 0
+        self.invalid = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.running = False
+
+    @property
+    def rows_per_sec(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return (self.migrated + self.invalid) / elapsed if elapsed > 0 else 0.0
+
+    async def run(self):
+        if self.running:
+            return
+        self.running = True
+        self.started_at, self.finished_at = time.monotonic(), None
+        query = {"schema_version": {"$ne": MESSAGE_SCHEMA_VERSION}}
+        try:
+            self.total = await self.db.messages.count_documents(query)
+            if not self.total:
+                return
+            logger.info(f"🗄️ Message schema migration: {self.total} messages to normalize")
+            last_id = None
+            while True:
+                batch_query = dict(query)
+                if last_id is not None:
+                    batch_query["_id"] = {"$gt": last_id}
+                batch = await self.db.messages.find(batch_query).sort("_id", 1).limit(self.batch_size).to_list(self.batch_size)
+                if not batch:
+                    break
+                last_id = batch[-1]["_id"]
+                operations = []
+                for doc in batch:
+                    doc_id = doc.pop("_id")
+                    original = dict(doc)
+                    normalized = normalize_message_doc(doc)
+                    try:
+                        self.validate(normalized)
+                    except Exception as e:
+                        self.invalid += 1
+                        logger.warning(f"Message {doc.get('id', doc_id)} left unmigrated: {e}")
+                        continue
+                    # Only what normalization added or changed: writing the whole document back would
+                    # revert concurrent updates (reaction counts, offloaded image content) made since the read
+                    changes = {field: value for field, value in normalized.items()
+                               if field not in original or original[field] != value}
+                    operations.append(UpdateOne({"_id": doc_id, **query}, {"$set": changes}))
+                if operations:
+                    await self.db.messages.bulk_write(operations, ordered=False)
+                    self.migrated += len(operations)
+                logger.info(
+                    f"🗄️ Message schema migration: {self.migrated + self.invalid}/{self.total} "
+                    f"({self.rows_per_sec:.0f} rows/sec)"
+                )
+                # Let request handlers in between batches
+                await asyncio.sleep(0)
+            logger.info(f"✅ Message schema migration done: {self.migrated} normalized, {self.invalid} invalid")
+        except Exception as e:
+            logger.error(f"Message schema migration stopped (resumes on next start): {e}")
+        finally:
+            self.finished_at = time.monotonic()
+            self.running = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        done = self.migrated + self.invalid
+        return {
+            "schema_version": MESSAGE_SCHEMA_VERSION,
+            "running": self.running,
+            "total": self.total,
+            "migrated": self.migrated,
+            "invalid": self.invalid,
+            "progress": round(done / self.total, 4) if self.total else 1.0,
+            "rows_per_sec": round(self.rows_per_sec, 1),
+        }
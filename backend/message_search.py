@@ -0,0 +1,131 @@
+"""Full-text chat search on a MongoDB text index.
+
+The index (MESSAGE_SEARCH_INDEX) is partial on content_type "text", so
+image messages - and the base64 payloads older ones carry in `content` - are
+never tokenized or matched. Results are ranked by text score (newest first on
+ties), paged with opaque cursors and returned with a highlighted snippet.
+"""
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from cursors import RankedKey, CursorKey, keyset_filter, ranked_keyset_filter
+
+MESSAGE_SEARCH_INDEX = "message_search"
+SEARCH_MAX_LIMIT = 50
+# Characters of context on each side of the first match
+SNIPPET_CONTEXT = 80
+
+SORT_RELEVANCE = "relevance"
+SORT_NEWEST = "newest"
+
+_TOKEN_RE = re.compile(r'"[^"]+"|-?\$?\w+')
+# Cheap stand-in for the index's English stemmer when locating matches for highlighting
+_SUFFIX_RE = re.compile(r"(ing|ed|es|s)$")
+
+
+def search_index_spec() -> Dict[str, Any]:
+    """create_index arguments for the search index"""
+    return {
+        "keys": [("content", "text")],
+        "name": MESSAGE_SEARCH_INDEX,
+        "default_language": "english",
+        "partialFilterExpression": {"content_type": "text"},
+    }
+
+
+def search_terms(query: str) -> List[str]:
+    """Words and quoted phrases to highlight (negated terms are excluded)"""
+    terms = []
+    for token in _TOKEN_RE.findall(query):
+        if token.startswith("-"):
+            continue
+        token = token.strip('"').lstrip("$").lower()
+        if token:
+            terms.append(token)
+    return terms
+
+
+def _term_pattern(terms: List[str]) -> Optional["re.Pattern"]:
+    parts = []
+    for term in terms:
+        if " " in term:
+            parts.append(re.escape(term))
+        else:
+            root = _SUFFIX_RE.sub("", term) if len(term) > 4 else term
+            parts.append(re.escape(root) + r"\w*")
+    if not parts:
+        return None
+    return re.compile(r"\b(?:" + "|".join(parts) + r")", re.IGNORECASE)
+
+
+def make_snippet(content: str, terms: List[str], context: int = SNIPPET_CONTEXT) -> Tuple[str, List[List[int]]]:
+    """Excerpt around the first match plus [start, end) offsets of every match inside it"""
+    pattern = _term_pattern(terms)
+    matches = list(pattern.finditer(content)) if pattern else []
+    if not matches:
+        snippet = content[:context * 2]
+        return (snippet + "…" if len(content) > len(snippet) else snippet), []
+
+    start = max(0, matches[0].start() - context)
+    end = min(len(content), matches[0].end() + context)
+    # Do not cut words in half
+    if start > 0:
+        space = content.find(" ", start)
+        start = space + 1 if 0 <= space < matches[0].start() else start
+    if end < len(content):
+        space = content.rfind(" ", matches[0].end(), end)
+        end = space if space > 0 else end
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(content) else ""
+    offset = len(prefix) - start
+    highlights = [
+        [match.start() + offset, match.end() + offset]
+        for match in matches if match.start() >= start and match.end() <= end
+    ]
+    return prefix + content[start:end] + suffix, highlights
+
+
+def build_search_pipeline(
+    query: str,
+    limit: int,
+    author: Optional[str] = None,
+    ticker: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    sort: str = SORT_RELEVANCE,
+    ranked_after: Optional[RankedKey] = None,
+    before: Optional[CursorKey] = None,
+) -> List[Dict[str, Any]]:
+    """Aggregation for one page of results (limit + 1 rows, so the caller can tell if there is more)"""
+    match: Dict[str, Any] = {"$text": {"$search": query}, "content_type": "text"}
+    if author:
+        match["username"] = author
+    if ticker:
+        match["highlighted_tickers"] = ticker.upper().lstrip("$")
+    if since or until:
+        match["timestamp"] = {}
+        if since:
+            match["timestamp"]["$gte"] = since
+        if until:
+            match["timestamp"]["$lt"] = until
+
+    pipeline: List[Dict[str, Any]] = [{"$match": match}]
+    if sort == SORT_NEWEST:
+        if before:
+            pipeline.append({"$match": keyset_filter(before=before)})
+        pipeline += [
+            {"$sort": {"timestamp": -1, "id": -1}},
+            {"$limit": limit + 1},
+            {"$addFields": {"score": {"$meta": "textScore"}}},
+        ]
+    else:
+        pipeline.append({"$addFields": {"score": {"$meta": "textScore"}}})
+        if ranked_after:
+            pipeline.append({"$match": ranked_keyset_filter(ranked_after)})
+        pipeline += [
+            {"$sort": {"score": -1, "timestamp": -1, "id": -1}},
+            {"$limit": limit + 1},
+        ]
+    pipeline.append({"$project": {"_id": 0}})
+    return pipeline
@@ -0,0 +1,139 @@
+"""Per-user unread notification counters, kept on the user document.
+
+`users.unread_notifications` is moved by the code paths that change a
+notification's unread state - +n when the notification queue stores a batch,
+-1/-n on read, read-all, auto-read and delete - so the badge is a single
+indexed read instead of counting db.notifications. Every change is pushed to
+the user's sockets as an `unread_count` frame. Updates clamp at zero, and a
+periodic reconciliation recomputes the counts from db.notifications to
+repair any drift (crashes between a write and its counter update, manual
+edits). A repair only applies if the counter has not moved since it was read,
+so it never overwrites a concurrent update with a stale count. Counters are only ever initialized by reconciliation (which also
+runs at start-up): a read-time count could race the queue's increments and
+count a new notification twice, so a user without a counter reads as 0.
+"""
+import os
+import json
+import asyncio
+import logging
+from typing import Any, Dict, Mapping, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+UNREAD_FIELD = "unread_notifications"
+UNREAD_RECONCILE_INTERVAL = float(os.getenv("UNREAD_RECONCILE_INTERVAL", "3600"))
+UNREAD_RECONCILE_BATCH_SIZE = 1000
+
+
+def _adjusted(delta: int):
+    """Pipeline update adding delta to the counter without going below zero"""
+    return [{"$set": {UNREAD_FIELD: {"$max": [0, {"$add": [{"$ifNull": [f"${UNREAD_FIELD}", 0]}, delta]}]}}}]
+
+
+class UnreadCounters:
+    """Unread notification counts per user, with WebSocket push on change"""
+
+    def __init__(self, db, manager):
+        self.db = db
+        self.manager = manager
+        self._task: Optional[asyncio.Task] = None
+        self.last_reconcile: Dict[str, Any] = {}
+
+    def push(self, user_id: str, count: int):
+        self.manager.send_to_user(user_id, json.dumps({"type": "unread_count", "count": count}))
+
+    async def get(self, user_id: str) -> Optional[int]:
+        """Current unread count; None for an unknown user, 0 until reconciliation first sets the counter"""
+        user = await self.db.users.find_one({"id": user_id}, {"_id": 0, UNREAD_FIELD: 1})
+        if user is None:
+            return None
+        return user.get(UNREAD_FIELD) or 0
+
+    async def adjust(self, user_id: str, delta: int) -> Optional[int]:
+        """Add delta to one user's counter and push the new value"""
+        if not delta:
+            return None
+        user = await self.db.users.find_one_and_update(
+            {"id": user_id}, _adjusted(delta),
+            projection={"_id": 0, UNREAD_FIELD: 1}, return_document=ReturnDocument.AFTER,
+        )
+        if user is None:
+            return None
+        self.push(user_id, user[UNREAD_FIELD])
+        return user[UNREAD_FIELD]
+
+    async def add_many(self, counts: Mapping[str, int]):
+        """Count a stored batch of new notifications: one bulk write, one read back, one push per user"""
+        counts = {user_id: count for user_id, count in counts.items() if count}
+        if not counts:
+            return
+        await self.db.users.bulk_write(
+            [UpdateOne({"id": user_id}, _adjusted(count)) for user_id, count in counts.items()], ordered=False
+        )
+        users = await self.db.users.find(
+            {"id": {"$in": list(counts)}}, {"_id": 0, "id": 1, UNREAD_FIELD: 1}
+        ).to_list(len(counts))
+        for user in users:
+            self.push(user["id"], user.get(UNREAD_FIELD, 0))
+
+    async def reconcile(self) -> Dict[str, Any]:
+        """Recompute every counter from db.notifications; returns how many were wrong"""
+        rows = await self.db.notifications.aggregate([
+            {"$match": {"read": False}},
+            {"$group": {"_id": "$user_id", "count": {"$sum": 1}}},
+        ]).to_list(None)
+        actual = {row["_id"]: row["count"] for row in rows}
+        # Users whose stored counter disagrees: every non-zero counter, plus everyone with unread notifications
+        stored = await self.db.users.find(
+            {"$or": [{UNREAD_FIELD: {"$gt": 0}}, {"id": {"$in": list(actual)}}]},
+            {"_id": 0, "id": 1, UNREAD_FIELD: 1},
+        ).to_list(None)
+        repairs = [
+            (user["id"], user[UNREAD_FIELD] if UNREAD_FIELD in user else {"$exists": False}, actual.get(user["id"], 0))
+            for user in stored
+            if user.get(UNREAD_FIELD) != actual.get(user["id"], 0)
+        ]
+        repaired = 0
+        for start in range(0, len(repairs), UNREAD_RECONCILE_BATCH_SIZE):
+            batch = repairs[start:start + UNREAD_RECONCILE_BATCH_SIZE]
+            # Only if the counter still holds the value read above: an increment or read that
+            # landed since then is newer than this repair, and the next reconciliation re-checks it
+            results = await asyncio.gather(*(
+                self.db.users.update_one({"id": user_id, UNREAD_FIELD: seen}, {"$set": {UNREAD_FIELD: count}})
+                for user_id, seen, count in batch
+            ))
+            for (user_id, _, count), result in zip(batch, results):
+                if result.modified_count:
+                    repaired += 1
+                    self.push(user_id, count)
+        self.last_reconcile = {"checked": len(stored), "repaired": repaired}
+        if repaired:
+            logger.info(f"🔢 Unread counters reconciled: {repaired} of {len(stored)} repaired")
+        return self.last_reconcile
+
+    async def _reconcile_loop(self):
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Error reconciling unread counters: {e}")
+            await asyncio.sleep(UNREAD_RECONCILE_INTERVAL)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._reconcile_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.last_reconcile)
@@ -0,0 +1,247 @@
+"""Batched delivery of user notifications, off the request path.
+
+create_user_notification used to insert, push over the WebSocket, look up an
+FCM token and send a push inline - four round trips per notification on the
+caller's critical path. Producers now only enqueue the notification document;
+a small pool of workers drains the queue in batches:
+
+  1. one insert_many for the whole batch (retried with backoff),
+  2. a WebSocket `notification` frame per recipient (after the insert, so a
+     client that refetches sees it), and the recipients' unread counters,
+  3. one multicast per distinct (title, body, data) to the recipients' devices
+     (from the in-memory token registry) - a mention of five users is one FCM call.
+
+The queue is bounded: when it is full, enqueue() waits for room, which slows
+producers instead of letting memory grow.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import Counter, deque
+from typing import Any, Dict, List, Tuple
+
+from pymongo.errors import BulkWriteError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_QUEUE_SIZE = int(os.getenv("NOTIFICATION_QUEUE_SIZE", "10000"))
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", "2"))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "200"))
+# How long a worker waits for a batch to fill once it has one notification
+NOTIFICATION_BATCH_WAIT = float(os.getenv("NOTIFICATION_BATCH_WAIT", "0.05"))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "4"))
+NOTIFICATION_RETRY_BASE_DELAY = float(os.getenv("NOTIFICATION_RETRY_BASE_DELAY", "0.5"))
+# Enqueue-to-delivered samples kept for the latency percentiles
+NOTIFICATION_LATENCY_SAMPLES = 1000
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class NotificationQueue:
+    """Bounded queue of notification documents drained in batches by a worker pool"""
+
+    def __init__(self, db, manager, tokens, counters=None, fcm=None, workers: int = NOTIFICATION_WORKERS,
+                 batch_size: int = NOTIFICATION_BATCH_SIZE, max_pending: int = NOTIFICATION_QUEUE_SIZE,
+                 max_attempts: int = NOTIFICATION_MAX_ATTEMPTS, retry_base_delay: float = NOTIFICATION_RETRY_BASE_DELAY):
+        self.db = db
+        self.manager = manager
+        self.tokens = tokens  # FCMTokenRegistry
+        self.counters = counters  # UnreadCounters
+        self._fcm = fcm
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._tasks: List[asyncio.Task] = []
+        self.latencies: deque = deque(maxlen=NOTIFICATION_LATENCY_SAMPLES)
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.pushes = 0
+        self.backpressure_waits = 0
+
+    @property
+    def fcm(self):
+        """The FCM service, imported on first use like the rest of the server does"""
+        if self._fcm is None:
+            try:
+                from fcm_service import fcm_service
+                self._fcm = fcm_service
+            except Exception as e:
+                logger.warning(f"FCM service unavailable - push notifications disabled: {e}")
+                self._fcm = False
+        return self._fcm or None
+
+    # ---- producers ----
+
+    async def enqueue(self, notification: Dict[str, Any]):
+        """Queue a notification document for delivery; waits while the queue is full"""
+        if self.queue.full():
+            self.backpressure_waits += 1
+        await self.queue.put((time.monotonic(), notification))
+        self.enqueued += 1
+
+    # ---- workers ----
+
+    async def _next_batch(self) -> List[Tuple[float, Dict[str, Any]]]:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + NOTIFICATION_BATCH_WAIT
+        while len(batch) < self.batch_size:
+            if self.queue.empty():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self.deliver(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"Error delivering {len(batch)} notifications: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _with_retries(self, what: str, operation):
+        """Run operation(), retrying with exponential backoff; re-raises after the last attempt"""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return await operation()
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                self.retries += 1
+                delay = self.retry_base_delay * 2 ** (attempt - 1)
+                logger.warning(f"🔁 {what} failed (attempt {attempt}/{self.max_attempts}), retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def deliver(self, batch: List[Tuple[float, Dict[str, Any]]]):
+        """Store, push and send one batch of notifications"""
+        self.batches += 1
+        notifications = [notification for _, notification in batch]
+        # insert_many adds _id to each document, so build the WebSocket payloads first
+        frames = [
+            (notification["user_id"], json.dumps({
+                "type": "notification",
+                "notification": {**notification, "created_at": notification["created_at"].isoformat()}
+            }, default=str))
+            for notification in notifications
+        ]
+        await self._with_retries("Notification insert", lambda: self._insert(notifications))
+
+        for user_id, frame in frames:
+            self.manager.send_to_user(user_id, frame)
+
+        if self.counters is not None:
+            try:
+                await self.counters.add_many(Counter(notification["user_id"] for notification in notifications))
+            except Exception as e:
+                # Stored and delivered; reconciliation repairs the counters
+                logger.error(f"Unread counter update for {len(notifications)} notifications failed: {e}")
+
+        try:
+            await self._push(notifications)
+        except Exception as e:
+            # Stored and sent over WebSocket; only the push is lost
+            logger.error(f"FCM push for {len(notifications)} notifications failed: {e}")
+
+        now = time.monotonic()
+        self.latencies.extend(now - enqueued_at for enqueued_at, _ in batch)
+        self.delivered += len(batch)
+
+    async def _insert(self, notifications: List[Dict[str, Any]]):
+        try:
+            await self.db.notifications.insert_many(notifications, ordered=False)
+        except BulkWriteError as e:
+            # A retried batch may be partly stored already (the documents keep their _id)
+            details = e.details or {}
+            if details.get("writeConcernErrors") or any(error.get("code") != 11000 for error in details.get("writeErrors", [])):
+                raise
+
+    async def _push(self, notifications: List[Dict[str, Any]]):
+        """One multicast per distinct notification content, to every device of its recipients"""
+        fcm = self.fcm
+        if fcm is None or not fcm.initialized:
+            return
+        groups: Dict[Tuple[str, str, str], Tuple[Dict[str, Any], List[str]]] = {}
+        for notification in notifications:
+            tokens = self.tokens.tokens_for(notification["user_id"])
+            if not tokens:
+                continue
+            key = (notification["title"], notification["message"], json.dumps(notification["data"], sort_keys=True, default=str))
+            groups.setdefault(key, (notification["data"], []))[1].extend(tokens)
+
+        # fcm_service splits large token lists into 500-token requests and prunes dead tokens
+        for (title, body, _), (data, tokens) in groups.items():
+            await self._with_retries("FCM multicast", lambda: self._send_multicast(fcm, tokens, title, body, data))
+            self.pushes += 1
+
+    async def _send_multicast(self, fcm, tokens: List[str], title: str, body: str, data: Dict[str, Any]):
+        result = await fcm.send_to_multiple(tokens=tokens, title=title, body=body, data=data)
+        if result.get("error"):
+            # The whole call failed (not individual tokens) - worth another attempt
+            raise RuntimeError(result["error"])
+        return result
+
+    # ---- lifecycle ----
+
+    async def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            logger.info(f"📬 Notification queue started with {self.workers} workers")
+
+    async def stop(self, timeout: float = 5.0):
+        """Deliver what is queued (up to timeout), then stop the workers"""
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Notification queue stopped with {self.queue.qsize()} undelivered")
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        samples = list(self.latencies)
+        return {
+            "depth": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "workers": len(self._tasks),
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "fcm_multicasts": self.pushes,
+            "backpressure_waits": self.backpressure_waits,
+            "latency_ms": {
+                "p50": round(_percentile(samples, 0.5) * 1000, 1),
+                "p95": round(_percentile(samples, 0.95) * 1000, 1),
+                "max": round(max(samples, default=0.0) * 1000, 1),
+            },
+        }
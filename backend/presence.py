@@ -0,0 +1,368 @@
+"""In-memory presence registry - who is online, served without touching MongoDB"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Set, Tuple
+
+from pymongo import UpdateOne
+
+from frames import Frame
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# How often each worker re-announces its connected users to the other workers
+PRESENCE_SYNC_INTERVAL = 30
+# A remote worker that has not re-announced for this long is considered gone
+PRESENCE_NODE_TTL = 3 * PRESENCE_SYNC_INTERVAL
+# Joins/leaves within this window are sent to clients as one presence_delta frame
+PRESENCE_DELTA_INTERVAL = 0.25
+
+# Write-behind flush of is_online/last_seen to db.users
+PRESENCE_FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", "5"))
+# Pending users that trigger an early flush; heartbeats for new users are dropped past twice this
+PRESENCE_FLUSH_MAX_PENDING = int(os.getenv("PRESENCE_FLUSH_MAX_PENDING", "5000"))
+
+# Fields of the user document that make up the public online-user profile
+PRESENCE_PROFILE_FIELDS = ("id", "username", "real_name", "screen_name", "is_admin", "avatar_url")
+
+
+def presence_profile(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Public profile shown in the online users list"""
+    profile = {field: user.get(field) for field in PRESENCE_PROFILE_FIELDS}
+    profile["is_admin"] = bool(profile["is_admin"])
+    return profile
+
+
+def _public(profile: Dict[str, Any]) -> Tuple:
+    """Profile fields clients display - last_seen alone is not worth a delta"""
+    return tuple(profile.get(field) for field in PRESENCE_PROFILE_FIELDS)
+
+
+class PresenceEntry:
+    """One online user: profile plus how many sockets each worker holds for them"""
+
+    __slots__ = ("profile", "nodes")
+
+    def __init__(self, profile: Dict[str, Any]):
+        self.profile = profile
+        self.nodes: Dict[str, List[float]] = {}  # node_id -> [connections, refreshed_at]
+
+
+class PresenceFlusher:
+    """Write-behind buffer for db.users is_online/last_seen.
+
+    Connects, disconnects and heartbeats are merged per user in memory (the
+    latest state wins) and written every PRESENCE_FLUSH_INTERVAL seconds as one
+    unordered bulk_write. A full buffer flushes early; if it keeps growing,
+    heartbeat-only updates for users not yet buffered are dropped - online and
+    offline transitions are always kept.
+    """
+
+    def __init__(self, db, interval: float = PRESENCE_FLUSH_INTERVAL, max_pending: int = PRESENCE_FLUSH_MAX_PENDING):
+        self.db = db
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending: Dict[str, Tuple[Optional[bool], datetime]] = {}  # user_id -> (is_online, last_seen)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.writes = 0
+        self.errors = 0
+
+    def record(self, user_id: str, is_online: Optional[bool] = None):
+        """Buffer a last_seen refresh, plus an is_online change when given"""
+        previous = self.pending.get(user_id)
+        if previous is None and len(self.pending) >= self.max_pending:
+            self._wake.set()
+            if is_online is None and len(self.pending) >= 2 * self.max_pending:
+                self.dropped += 1
+                return
+        if is_online is None and previous is not None:
+            is_online = previous[0]
+        self.pending[user_id] = (is_online, datetime.utcnow())
+        self.recorded += 1
+
+    async def flush(self) -> int:
+        """Write everything buffered so far. Returns the number of users written."""
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, {}
+        operations = []
+        for user_id, (is_online, last_seen) in batch.items():
+            fields: Dict[str, Any] = {"last_seen": last_seen}
+            if is_online is not None:
+                fields["is_online"] = is_online
+            operations.append(UpdateOne({"id": user_id}, {"$set": fields}))
+        try:
+            await self.db.users.bulk_write(operations, ordered=False)
+            self.flushes += 1
+            self.writes += len(operations)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error flushing presence for {len(operations)} users: {e}")
+            # Put the batch back unless newer updates arrived meanwhile
+            for user_id, update in batch.items():
+                self.pending.setdefault(user_id, update)
+        return len(operations)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the loop and write whatever is still buffered"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.pending),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "errors": self.errors,
+        }
+
+
+class PresenceRegistry:
+    """Authoritative online-user view kept in memory on every worker.
+
+    Connects, disconnects and heartbeats update it directly. Changes are shared
+    with other workers through the ConnectionManager backplane as absolute
+    per-worker connection counts, so lost or repeated envelopes cannot drift
+    the totals. Every worker turns membership changes into one presence_delta
+    frame per PRESENCE_DELTA_INTERVAL for its own sockets. MongoDB
+    is_online/last_seen are written in batches by a PresenceFlusher.
+    """
+
+    def __init__(self, db, manager):
+        self.db = db
+        self.manager = manager
+        self.node_id = manager.node_id
+        self.entries: Dict[str, PresenceEntry] = {}
+        self._snapshot: Optional[List[Dict[str, Any]]] = None
+        self.flusher = PresenceFlusher(db)
+        self._added: Set[str] = set()
+        self._removed: Set[str] = set()
+        self._joined: Set[str] = set()  # added this tick, not yet seen by clients
+        self._delta_task: Optional[asyncio.Task] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        manager.register_handler("presence", self._apply_presence)
+        manager.register_handler("presence_sync", self._apply_sync)
+        # Every way a socket can go (close, slow consumer, failed send, ping timeout) ends here
+        manager.add_disconnect_listener(lambda connection: self.user_disconnected(connection.user_id))
+
+    # ---- reads ----
+
+    @property
+    def count(self) -> int:
+        return len(self.entries)
+
+    def is_online(self, user_id: str) -> bool:
+        return user_id in self.entries
+
+    def online_ids(self) -> List[str]:
+        return list(self.entries.keys())
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Online users list; rebuilt only when membership changes"""
+        if self._snapshot is None:
+            self._snapshot = [entry.profile for entry in self.entries.values()]
+        return self._snapshot
+
+    # ---- local events ----
+
+    def user_connected(self, user: Dict[str, Any]) -> bool:
+        """Record a new local socket. Returns True if the user just came online."""
+        user_id = user["id"]
+        was_online = user_id in self.entries
+        profile = presence_profile(user)
+        profile["last_seen"] = datetime.utcnow()
+        self._announce(user_id, profile)
+        self.flusher.record(user_id, True)
+        return not was_online
+
+    def user_disconnected(self, user_id: str) -> bool:
+        """Record a closed local socket. Returns True if the user just went offline everywhere."""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return False
+        self._announce(user_id, entry.profile)
+        went_offline = user_id not in self.entries
+        self.flusher.record(user_id, False if went_offline else None)
+        return went_offline
+
+    def heartbeat(self, user_id: str):
+        entry = self.entries.get(user_id)
+        if entry is not None:
+            entry.profile["last_seen"] = datetime.utcnow()
+        self.flusher.record(user_id)
+
+    def refresh_profile(self, user_id: str, changes: Dict[str, Any]):
+        """Pick up avatar/name changes for an online user"""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return
+        profile = dict(entry.profile)
+        profile.update({field: value for field, value in changes.items() if field in PRESENCE_PROFILE_FIELDS})
+        self._announce(user_id, profile)
+
+    def _announce(self, user_id: str, profile: Dict[str, Any]):
+        connections = len(self.manager.user_connection_list(user_id))
+        self.manager.publish({
+            "op": "presence",
+            "node_id": self.node_id,
+            "user_id": user_id,
+            "connections": connections,
+            "profile": profile,
+        })
+
+    # ---- envelopes from any worker (including this one) ----
+
+    def _set_node_count(self, user_id: str, node_id: str, connections: int, profile: Optional[Dict[str, Any]]):
+        entry = self.entries.get(user_id)
+        if connections > 0:
+            if entry is None:
+                entry = self.entries[user_id] = PresenceEntry(profile or {"id": user_id})
+                self._changed(user_id, online=True, joined=True)
+            elif profile is not None and profile is not entry.profile:
+                if _public(profile) != _public(entry.profile):
+                    self._changed(user_id, online=True)
+                entry.profile = profile
+                self._snapshot = None
+            entry.nodes[node_id] = [connections, time.monotonic()]
+        elif entry is not None:
+            entry.nodes.pop(node_id, None)
+            if not entry.nodes:
+                del self.entries[user_id]
+                self._changed(user_id, online=False)
+
+    def _changed(self, user_id: str, online: bool, joined: bool = False):
+        """Queue a join, profile change or leave for the next presence_delta tick"""
+        self._snapshot = None
+        if online:
+            if joined and user_id not in self._removed:
+                self._joined.add(user_id)
+            self._removed.discard(user_id)
+            self._added.add(user_id)
+        else:
+            self._added.discard(user_id)
+            if user_id in self._joined:
+                # Joined and left within one tick - clients never need to hear about it
+                self._joined.discard(user_id)
+            else:
+                self._removed.add(user_id)
+
+    def _apply_presence(self, envelope: Dict[str, Any]):
+        self._set_node_count(envelope["user_id"], envelope["node_id"], envelope["connections"], envelope.get("profile"))
+
+    def _apply_sync(self, envelope: Dict[str, Any]):
+        node_id = envelope["node_id"]
+        if node_id == self.node_id:
+            return
+        announced = set()
+        for item in envelope["users"]:
+            announced.add(item["profile"]["id"])
+            self._set_node_count(item["profile"]["id"], node_id, item["connections"], item["profile"])
+        # Users the worker no longer reports
+        for user_id, entry in list(self.entries.items()):
+            if node_id in entry.nodes and user_id not in announced:
+                self._set_node_count(user_id, node_id, 0, None)
+
+    # ---- maintenance ----
+
+    def sweep(self) -> List[str]:
+        """Drop users held only by workers that stopped announcing. Returns users that went offline."""
+        now = time.monotonic()
+        gone = []
+        for user_id, entry in list(self.entries.items()):
+            for node_id, (_, refreshed_at) in list(entry.nodes.items()):
+                if node_id != self.node_id and now - refreshed_at > PRESENCE_NODE_TTL:
+                    entry.nodes.pop(node_id)
+            if not entry.nodes:
+                del self.entries[user_id]
+                self._changed(user_id, online=False)
+                gone.append(user_id)
+        return gone
+
+    def _publish_sync(self):
+        users = []
+        for user_id in list(self.manager.user_index.keys()):
+            entry = self.entries.get(user_id)
+            if entry is not None:
+                users.append({"connections": len(self.manager.user_connection_list(user_id)), "profile": entry.profile})
+        self.manager.publish({"op": "presence_sync", "node_id": self.node_id, "users": users})
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(PRESENCE_SYNC_INTERVAL)
+            try:
+                self._publish_sync()
+            except Exception as e:
+                logger.error(f"Error publishing presence sync: {e}")
+
+    def flush_delta(self) -> int:
+        """Send pending joins/leaves to this worker's sockets as one frame. Returns sockets queued."""
+        if not self._added and not self._removed:
+            self._joined.clear()
+            return 0
+        added, self._added = self._added, set()
+        removed, self._removed = self._removed, set()
+        self._joined = set()
+        users = [self.entries[user_id].profile for user_id in added if user_id in self.entries]
+        frame = Frame({
+            "type": "presence_delta",
+            "added": [profile["id"] for profile in users],
+            "removed": list(removed),
+            "users": users,
+            "online_count": self.count,
+        })
+        return self.manager.broadcast_local(frame)
+
+    async def _delta_loop(self):
+        while True:
+            await asyncio.sleep(PRESENCE_DELTA_INTERVAL)
+            try:
+                self.flush_delta()
+            except Exception as e:
+                logger.error(f"Error sending presence delta: {e}")
+
+    async def start(self):
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+        if self._delta_task is None:
+            self._delta_task = asyncio.create_task(self._delta_loop())
+        await self.flusher.start()
+
+    async def stop(self):
+        for task in (self._sync_task, self._delta_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._sync_task = None
+        self._delta_task = None
+        await self.flusher.stop()
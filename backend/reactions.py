@@ -0,0 +1,118 @@
+"""Message reaction counts, denormalized onto the messages they belong to.
+
+Each reaction is still one row in db.reactions (the unique
+(message_id, user_id, reaction_type) index makes a double reaction a
+DuplicateKeyError), but the per-type totals are kept on the message as
+`reaction_counts.<type>` and moved with $inc by the add/remove endpoints, so
+showing counts for a page of messages is one $in query instead of counting
+reaction rows per message. Reactor profiles are only loaded on request, in a
+single users query. rebuild_reaction_counts() recomputes the totals from the
+reaction rows - once at start-up for reactions older than the counts, and by
+admins if they ever drift.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# db.counters document recording that the counts have been rebuilt
+REACTION_COUNTS_MARKER = "reaction_counts"
+REACTION_SUMMARY_MAX_MESSAGES = 200
+REACTION_REBUILD_BATCH_SIZE = 1000
+REACTOR_PROJECTION = {"_id": 0, "id": 1, "username": 1, "screen_name": 1, "avatar_url": 1}
+
+
+def validate_reaction_type(reaction_type: Optional[str]) -> str:
+    """Reaction types become field names under reaction_counts"""
+    if not reaction_type or len(reaction_type) > 32 or "." in reaction_type or reaction_type.startswith("$"):
+        raise HTTPException(status_code=400, detail="Invalid reaction type")
+    return reaction_type
+
+
+async def load_reactors(db, message_ids: List[str]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """message_id -> reaction_type -> reactor profiles, with all users fetched in one $in query"""
+    if not message_ids:
+        return {}
+    reactions = await db.reactions.find(
+        {"message_id": {"$in": message_ids}},
+        {"_id": 0, "message_id": 1, "user_id": 1, "reaction_type": 1, "created_at": 1}
+    ).to_list(None)
+    user_ids = list({reaction["user_id"] for reaction in reactions})
+    users = {}
+    if user_ids:
+        users = {
+            user["id"]: user
+            for user in await db.users.find({"id": {"$in": user_ids}}, REACTOR_PROJECTION).to_list(len(user_ids))
+        }
+
+    reactors: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    for reaction in reactions:
+        user = users.get(reaction["user_id"])
+        if not user:
+            continue  # Deleted account
+        reactors.setdefault(reaction["message_id"], {}).setdefault(reaction["reaction_type"], []).append({
+            "user_id": user["id"],
+            "username": user["username"],
+            "screen_name": user.get("screen_name"),
+            "avatar_url": user.get("avatar_url"),
+            "created_at": reaction["created_at"],
+        })
+    return reactors
+
+
+async def reaction_summary(db, message_ids: List[str], user_id: Optional[str] = None, expand: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Counts per message, the types `user_id` gave, and (with expand) who reacted"""
+    message_ids = list(dict.fromkeys(message_ids))[:REACTION_SUMMARY_MAX_MESSAGES]
+    if not message_ids:
+        return {}
+
+    counts_query = db.messages.find(
+        {"id": {"$in": message_ids}}, {"_id": 0, "id": 1, "reaction_counts": 1}
+    ).to_list(len(message_ids))
+    if user_id:
+        mine_query = db.reactions.find(
+            {"message_id": {"$in": message_ids}, "user_id": user_id},
+            {"_id": 0, "message_id": 1, "reaction_type": 1}
+        ).to_list(None)
+        messages, mine = await asyncio.gather(counts_query, mine_query)
+    else:
+        messages, mine = await counts_query, []
+
+    summary = {
+        message["id"]: {
+            "counts": {reaction_type: count for reaction_type, count in (message.get("reaction_counts") or {}).items() if count > 0},
+            "mine": [],
+        }
+        for message in messages
+    }
+    for reaction in mine:
+        if reaction["message_id"] in summary:
+            summary[reaction["message_id"]]["mine"].append(reaction["reaction_type"])
+    if expand:
+        reactors = await load_reactors(db, [message_id for message_id, entry in summary.items() if entry["counts"]])
+        for message_id, entry in summary.items():
+            entry["reactors"] = reactors.get(message_id, {})
+    return summary
+
+
+async def rebuild_reaction_counts(db, batch_size: int = REACTION_REBUILD_BATCH_SIZE) -> int:
+    """Recompute reaction_counts for every reacted-to message from db.reactions; returns messages updated"""
+    rows = await db.reactions.aggregate([
+        {"$group": {"_id": {"message_id": "$message_id", "reaction_type": "$reaction_type"}, "count": {"$sum": 1}}}
+    ]).to_list(None)
+    counts: Dict[str, Dict[str, int]] = {}
+    for row in rows:
+        counts.setdefault(row["_id"]["message_id"], {})[row["_id"]["reaction_type"]] = row["count"]
+
+    operations = [UpdateOne({"id": message_id}, {"$set": {"reaction_counts": message_counts}}) for message_id, message_counts in counts.items()]
+    for start in range(0, len(operations), batch_size):
+        await db.messages.bulk_write(operations[start:start + batch_size], ordered=False)
+    await db.counters.update_one({"_id": REACTION_COUNTS_MARKER}, {"$set": {"rebuilt_at": datetime.utcnow()}}, upsert=True)
+    logger.info(f"❤️ Reaction counts rebuilt for {len(operations)} messages")
+    return len(operations)
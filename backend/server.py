@@ -17,8 +17,10 @@ from typing import Optional, List, Dict, Any, Union
 import asyncio
 import motor.motor_asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, BackgroundTasks, Query, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import hashlib
@@ -65,6 +67,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Before-Cursor", "X-After-Cursor"],
 )
 
 # Generate referral code for new users
@@ -118,12 +121,29 @@ from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 import aiohttp
 import re
-import base64
 import httpx
 import asyncio
 import sys
 from contextlib import asynccontextmanager
 from cash_prize import create_pending_cash_prize
+from websocket_manager import ConnectionManager, GROUP_MEMBERS, TOPIC_CHAT_GLOBAL, ticker_topic
+from backplane import create_backplane
+from presence import PresenceRegistry
+from event_stream import EventStream
+from sse import SSEChannel
+from frames import ENCODING_JSON, negotiate_encoding
+from message_cache import RecentMessageCache, listing_view
+from reactions import REACTION_COUNTS_MARKER, load_reactors, reaction_summary, rebuild_reaction_counts, validate_reaction_type
+from fcm_tokens import FCMTokenRegistry
+from notification_counters import UnreadCounters
+from notification_queue import NotificationQueue
+from user_directory import USER_SEARCH_MAX_LIMIT, UserDirectory
+from trending import TRENDING_WINDOWS, TrendingTickers
+from image_pipeline import ImagePipeline
+from message_schema import MESSAGE_SCHEMA_VERSION, MessageSchemaMigration, canonical_message_doc, extract_stock_tickers, normalize_message_doc
+from cursors import CursorKey, cursor_of, decode_cursor, encode_cursor, decode_ranked_cursor, encode_ranked_cursor, keyset_filter
+from message_search import SEARCH_MAX_LIMIT, SORT_NEWEST, SORT_RELEVANCE, build_search_pipeline, make_snippet, search_index_spec, search_terms
+from blob_store import BLOB_INLINE_TYPES, BLOB_MAX_IMAGE_BYTES, blob_url, create_blob_store, decode_data_url, migrate_inline_images, parse_range
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -259,6 +279,8 @@ async def check_expired_trials():
                     {"id": user["id"]},
                     {"$set": {"status": UserStatus.TRIAL_EXPIRED}}
                 )
+                manager.update_user(user["id"], status=UserStatus.TRIAL_EXPIRED)
+                user_directory.update(user["id"], {"status": UserStatus.TRIAL_EXPIRED.value})
                 
                 # Send upgrade email if not already sent
                 if not user.get("trial_upgrade_email_sent", False):
@@ -277,7 +299,10 @@ async def check_expired_trials():
 async def lifespan(app: FastAPI):
     # Create indexes for performance
     try:
-        await db.messages.create_index([("timestamp", -1)])
+        # Keyset pagination: (timestamp, id) cursors for history, polling and resync
+        await db.messages.create_index([("timestamp", -1), ("id", -1)])
+        # Per-ticker timeline: multikey on the extracted $TICKERS, then the same keyset order
+        await db.messages.create_index([("highlighted_tickers", 1), ("timestamp", -1), ("id", -1)])
         await db.users.create_index("id", unique=True)
         await db.users.create_index("username")
         await db.users.create_index("email")
@@ -285,6 +310,18 @@ async def lifespan(app: FastAPI):
         logger.info("Ensured messages timestamp index exists")
     except Exception as e:
         logger.warning(f"Could not create index: {e}")
+    try:
+        # Full-text search over text messages only (partial index keeps image payloads out)
+        search_index = search_index_spec()
+        await db.messages.create_index(search_index.pop("keys"), **search_index)
+    except Exception as e:
+        # A collection holds one text index; an existing one with other options must be dropped first
+        logger.warning(f"Could not create message search text index (another text index on messages?): {e}")
+    try:
+        # One reaction per (message, user, type); also serves the per-message and "did I react" lookups
+        await db.reactions.create_index([("message_id", 1), ("user_id", 1), ("reaction_type", 1)], unique=True)
+    except Exception as e:
+        logger.warning(f"Could not create reactions index (duplicate reactions?): {e}")
     
     # Create default admin if none exists
     admin_exists = await db.users.find_one({"is_admin": True})
@@ -311,11 +348,40 @@ async def lifespan(app: FastAPI):
         await db.users.insert_one(admin_user)
         logger.info("Created default admin user: admin / admin123")
     
+    # Connect to the WebSocket backplane and start presence sync
+    await manager.start()
+    await events.start()
+    try:
+        await message_cache.load()
+    except Exception as e:
+        logger.error(f"Message cache not loaded, serving messages from MongoDB: {e}")
+    await presence.start()
+    await user_directory.start()
+    await fcm_token_registry.start()
+    fcm_dispatcher = setup_fcm_dispatcher()
+    await notification_queue.start()
+    await unread_counters.start()
+    await trending.start()
+    # One-time (resumable) normalization of legacy message documents
+    migration_task = asyncio.create_task(message_migration.run())
+    asyncio.create_task(ensure_reaction_counts())
+    
     # Start background cleanup task
     cleanup_task = asyncio.create_task(periodic_cleanup())
     logger.info("Started periodic stale session cleanup (every 10 minutes)")
     yield
     # Clean up on shutdown
+    await presence.stop()
+    await user_directory.stop()
+    await notification_queue.stop()
+    await unread_counters.stop()
+    await fcm_token_registry.stop()
+    await trending.stop()
+    await manager.close_all()
+    image_pipeline.shutdown()
+    if fcm_dispatcher:
+        fcm_dispatcher.shutdown()
+    migration_task.cancel()
     cleanup_task.cancel()
     try:
         await cleanup_task
@@ -333,11 +399,13 @@ class FCMToken(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     token: str
+    device_id: Optional[str] = None  # One document per device; clients without one are keyed by token
+    platform: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 @api_router.post("/fcm/register-token")
-async def register_fcm_token(token_data: Dict[str, str]):
+async def register_fcm_token(token_data: Dict[str, Optional[str]]):
     """Register FCM token for a user"""
     user_id = token_data.get("user_id")
     token = token_data.get("token")
@@ -346,19 +414,8 @@ async def register_fcm_token(token_data: Dict[str, str]):
         raise HTTPException(status_code=400, detail="user_id and token are required")
     
     try:
-        # Check if token already exists for this user
-        existing_token = await db.fcm_tokens.find_one({"user_id": user_id})
-        
-        if existing_token:
-            # Update existing token
-            await db.fcm_tokens.update_one(
-                {"user_id": user_id},
-                {"$set": {"token": token, "updated_at": datetime.utcnow()}}
-            )
-        else:
-            # Create new token entry
-            fcm_token = FCMToken(user_id=user_id, token=token)
-            await db.fcm_tokens.insert_one(fcm_token.dict())
+        # Atomic upsert per device - a user's other devices keep their tokens
+        await fcm_token_registry.register(user_id, token, token_data.get("device_id"), token_data.get("platform"))
         
         return {"message": "Token registered successfully"}
     except Exception as e:
@@ -371,15 +428,25 @@ async def fcm_status():
     try:
         from fcm_service import fcm_service
         has_creds = bool(os.getenv("FIREBASE_ADMIN_CREDENTIALS"))
-        token_count = await db.fcm_tokens.count_documents({})
         return {
             "initialized": fcm_service.initialized,
             "credentials_configured": has_creds,
-            "registered_tokens": token_count
+            "registered_tokens": fcm_token_registry.count,
+            "dispatcher": fcm_service.get_stats()
         }
     except Exception as e:
         return {"initialized": False, "error": str(e)}
 
+def setup_fcm_dispatcher():
+    try:
+        from fcm_service import fcm_service
+        # Tokens FCM reports as dead are deleted from MongoDB and every worker's cache
+        fcm_service.set_token_pruner(fcm_token_registry.remove_tokens)
+        return fcm_service
+    except Exception as e:
+        logger.warning(f"FCM service unavailable - push notifications disabled: {e}")
+        return None
+
 @api_router.post("/fcm/test-notification")
 async def test_notification(test_data: Dict[str, str]):
     """Send test notification"""
@@ -418,13 +485,8 @@ async def send_notification_to_admins(title: str, body: str, data: Optional[Dict
             logger.warning("FCM service not initialized - admin notifications disabled")
             return
         
-        # Get all admin users
-        admin_users = await db.users.find({"is_admin": True}).to_list(1000)
-        admin_user_ids = [user["id"] for user in admin_users]
-        
-        # Get FCM tokens for admin users
-        admin_tokens = await db.fcm_tokens.find({"user_id": {"$in": admin_user_ids}}).to_list(1000)
-        token_list = [token["token"] for token in admin_tokens]
+        # Admins and their devices, both from memory
+        token_list = fcm_token_registry.tokens_for_users(user_directory.admin_ids())
         
         if token_list:
             result = await fcm_service.send_to_multiple(
@@ -448,25 +510,28 @@ async def send_notification_to_user(user_id: str, title: str, body: str, data: O
             logger.warning("FCM service not initialized - user notifications disabled")
             return False
         
-        # Get FCM token for user
-        user_token = await db.fcm_tokens.find_one({"user_id": user_id})
+        # Every device the user registered
+        tokens = fcm_token_registry.tokens_for(user_id)
         
-        if user_token:
+        if len(tokens) == 1:
             success = await fcm_service.send_notification(
-                token=user_token["token"],
+                token=tokens[0],
                 title=title,
                 body=body,
                 data=data
             )
             logger.info(f"Sent notification to user {user_id}: {success}")
             return success
+        if tokens:
+            result = await fcm_service.send_to_multiple(tokens=tokens, title=title, body=body, data=data)
+            logger.info(f"Sent notification to {result.get('success_count', 0)}/{len(tokens)} devices of user {user_id}")
+            return result.get("success_count", 0) > 0
     except Exception as e:
         logger.error(f"Error sending notification to user {user_id}: {str(e)}")
         return False
 
-async def create_user_notification(user_id: str, notification_type: str, title: str, message: str, data: Dict[str, Any] = None):
-    """Create a notification for a user"""
-    notification = {
+def build_user_notification(user_id: str, notification_type: str, title: str, message: str, data: Dict[str, Any] = None, created_at: datetime = None) -> Dict[str, Any]:
+    return {
         "id": str(uuid.uuid4()),
         "user_id": user_id,
         "type": notification_type,
@@ -474,216 +539,213 @@ async def create_user_notification(user_id: str, notification_type: str, title:
         "message": message,
         "data": data or {},
         "read": False,
-        "created_at": datetime.utcnow(),
+        "created_at": created_at or datetime.utcnow(),
         "expires_at": None
     }
-    
-    await db.notifications.insert_one(notification)
-    
-    # Prepare notification for WebSocket (convert datetime to string)
-    websocket_notification = notification.copy()
-    websocket_notification["created_at"] = notification["created_at"].isoformat()
-    
-    # Send real-time notification via WebSocket if user is online
-    if user_id in manager.user_connections:
-        try:
-            await manager.user_connections[user_id].send_text(json.dumps({
-                "type": "notification",
-                "notification": websocket_notification
-            }))
-        except:
-            pass  # Ignore WebSocket errors
-    
-    # Send FCM notification
-    await send_notification_to_user(user_id, title, message, data)
-    
+
+async def create_user_notification(user_id: str, notification_type: str, title: str, message: str, data: Dict[str, Any] = None):
+    """Create a notification for a user (stored, pushed over WebSocket and sent via FCM by the notification queue)"""
+    notification = build_user_notification(user_id, notification_type, title, message, data)
+    await notification_queue.enqueue(notification)
     return notification
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.user_connections: Dict[str, WebSocket] = {}
+async def create_user_notifications(user_ids: List[str], notification_type: str, title: str, message: str, data: Dict[str, Any] = None):
+    """Create the same notification for several users"""
+    created_at = datetime.utcnow()
+    notifications = [build_user_notification(user_id, notification_type, title, message, data, created_at) for user_id in user_ids]
+    for notification in notifications:
+        await notification_queue.enqueue(notification)
+    return notifications
 
-    async def connect(self, websocket: WebSocket, user_id: str):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        self.user_connections[user_id] = websocket
+# WebSocket connection manager (per-connection queues, see websocket_manager.py).
+# Deliveries go through the backplane so they reach sockets on every worker:
+# set WS_BACKPLANE_URL=unix:///tmp/cashout-backplane.sock (or tcp://host:port) and run
+# `python backplane.py --listen <same url>` when running more than one worker.
+manager = ConnectionManager(create_backplane())
 
-    def disconnect(self, websocket: WebSocket, user_id: str):
-        self.active_connections.remove(websocket)
-        if user_id in self.user_connections:
-            del self.user_connections[user_id]
+# Chat events (messages, deletions) carry a global seq; reconnecting clients get missed ones replayed
+events = EventStream(db, manager)
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+# In-memory presence registry: serves the online users list without DB queries
+presence = PresenceRegistry(db, manager)
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                pass
+# In-memory username index: @mentions and user autocomplete without DB queries
+user_directory = UserDirectory(db, manager)
 
-    async def send_admin_notification(self, message: str):
-        """Send notifications to all connected admins"""
-        admin_users = await db.users.find({"is_admin": True}).to_list(1000)
-        admin_ids = [user["id"] for user in admin_users]
-        
-        for user_id in admin_ids:
-            if user_id in self.user_connections:
-                try:
-                    await self.user_connections[user_id].send_text(message)
-                except:
-                    pass
-
-    async def send_session_invalidation(self, user_id: str, new_session_id: str):
-        """Send session invalidation message to user's old sessions"""
-        if user_id in self.user_connections:
-            try:
-                # Send message but don't close connection immediately
-                await self.user_connections[user_id].send_text(json.dumps({
-                    "type": "session_invalidated",
-                    "message": "Your session has been terminated due to login from another location",
-                    "new_session_id": new_session_id
-                }))
-                print(f"Sent session invalidation message to user {user_id}")
-            except Exception as e:
-                print(f"Error sending session invalidation message to user {user_id}: {e}")
-                # Force remove the connection even if sending fails
-                if user_id in self.user_connections:
-                    del self.user_connections[user_id]
+# Device tokens for push notifications, cached in memory (see fcm_tokens.py)
+fcm_token_registry = FCMTokenRegistry(db, manager)
 
-manager = ConnectionManager()
+# Unread notification badge counts, kept on the user document (see notification_counters.py)
+unread_counters = UnreadCounters(db, manager)
+
+# Notifications are stored and pushed in batches by background workers (see notification_queue.py)
+notification_queue = NotificationQueue(db, manager, fcm_token_registry, unread_counters)
 
 # ONLINE USERS FIX: Add automatic stale session cleanup
 async def cleanup_stale_sessions():
-    """Clean up stale sessions (users marked online but inactive for >30 minutes)"""
+    """Reconcile presence: drop users held by dead workers, fix stale is_online flags in the DB"""
     try:
-        thirty_minutes_ago = datetime.utcnow() - timedelta(minutes=30)
+        # Users whose only sockets were on a worker that stopped announcing
+        # (clients hear about them in the next presence_delta)
+        gone = presence.sweep()
+        if gone:
+            logger.info(f"🧹 Dropped {len(gone)} users held by unresponsive workers")
         
-        # Find stale sessions
-        stale_sessions = await db.users.find({
-            "is_online": True,
-            "last_seen": {"$lt": thirty_minutes_ago}
-        }).to_list(1000)
-        
-        if stale_sessions:
-            stale_ids = [user['id'] for user in stale_sessions]
-            result = await db.users.update_many(
-                {"id": {"$in": stale_ids}},
-                {"$set": {"is_online": False}}
-            )
+        # DB rows still flagged online but not present anywhere (crashes, missed disconnects)
+        thirty_minutes_ago = datetime.utcnow() - timedelta(minutes=30)
+        result = await db.users.update_many(
+            {
+                "is_online": True,
+                "last_seen": {"$lt": thirty_minutes_ago},
+                "id": {"$nin": presence.online_ids()}
+            },
+            {"$set": {"is_online": False}}
+        )
+        if result.modified_count:
             logger.info(f"🧹 Cleaned up {result.modified_count} stale sessions")
-            
-            # Broadcast user_left for each stale session
-            for user in stale_sessions:
-                await manager.broadcast(json.dumps({
-                    "type": "user_left",
-                    "user_id": user['id']
-                }, default=str))
                 
     except Exception as e:
         logger.error(f"Error cleaning up stale sessions: {e}")
 
-# WebSocket endpoint for real-time chat
-@app.websocket("/api/ws/{user_id}/{session_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: str, session_id: str):
-    # ONLINE USERS FIX: Clean up stale sessions before connecting
-    await cleanup_stale_sessions()
-    
-    # Validate user and session
-    user = await db.users.find_one({"id": user_id, "active_session_id": session_id})
+def message_topics(message: dict) -> List[str]:
+    """Topics a chat event goes to: the global channel plus each highlighted ticker"""
+    topics = [TOPIC_CHAT_GLOBAL]
+    for ticker in message.get("highlighted_tickers") or []:
+        symbol = ticker.get("symbol") if isinstance(ticker, dict) else ticker
+        if isinstance(symbol, str) and symbol:
+            topics.append(ticker_topic(symbol))
+    return topics
+
+# Fields needed to register a realtime client (presence profile + group indexes)
+REALTIME_USER_PROJECTION = {"_id": 0, "id": 1, "username": 1, "real_name": 1, "screen_name": 1, "is_admin": 1, "avatar_url": 1, "status": 1}
+
+async def get_realtime_user(user_id: str, session_id: str, transport: str) -> Optional[dict]:
+    """User doc for a WebSocket/SSE client if the session is the active one, else None (logged)"""
+    user = await db.users.find_one({"id": user_id, "active_session_id": session_id}, REALTIME_USER_PROJECTION)
     if not user:
         # Log why the connection was rejected
         user_check = await db.users.find_one({"id": user_id}, {"_id": 0, "username": 1, "active_session_id": 1})
         if user_check:
-            logger.warning(f"❌ WS rejected for user {user_check.get('username')}: session mismatch. Expected: {user_check.get('active_session_id')}, Got: {session_id}")
+            logger.warning(f"❌ {transport} rejected for user {user_check.get('username')}: session mismatch. Expected: {user_check.get('active_session_id')}, Got: {session_id}")
         else:
-            logger.warning(f"❌ WS rejected: user_id {user_id} not found in database")
-        await websocket.close(code=1008, reason="Invalid user or session")
-        return
-    
-    logger.info(f"✅ WS connected: {user.get('username')} (user_id: {user_id})")
-    await manager.connect(websocket, user_id)
+            logger.warning(f"❌ {transport} rejected: user_id {user_id} not found in database")
+    return user
+
+async def attach_realtime_client(transport, user: dict, session_id: str, last_seq: Optional[int], topics: Optional[str] = None,
+                                 encoding: str = ENCODING_JSON):
+    """Register a WebSocket (or SSE channel), mark the user online and bring the client up to date"""
+    connection = await manager.connect(transport, user, session_id, encoding)
+    if topics:
+        # Explicit chat/ticker topics (comma separated) replace the default chat:global feed
+        manager.unsubscribe(connection, [TOPIC_CHAT_GLOBAL])
+        manager.subscribe(connection, topics.split(","))
     
-    # Update user as online
-    await db.users.update_one(
-        {"id": user_id},
-        {
-            "$set": {
-                "is_online": True,
-                "last_seen": datetime.utcnow()
-            }
-        }
-    )
+    # Mark online in memory (DB is_online/last_seen is written in the background).
+    # Other clients learn about the join from the next batched presence_delta frame.
+    presence.user_connected(user)
     
     # Send current online users list to the newly connected user
-    online_users = await db.users.find({"is_online": True}).to_list(1000)
-    # Remove sensitive data from user objects
-    clean_users = []
-    for user_data in online_users:
-        clean_user = {
-            "id": user_data["id"],
-            "username": user_data["username"],
-            "real_name": user_data.get("real_name"),
-            "screen_name": user_data.get("screen_name"),
-            "is_admin": user_data.get("is_admin", False),
-            "avatar_url": user_data.get("avatar_url"),
-            "last_seen": user_data.get("last_seen")
-        }
-        clean_users.append(clean_user)
-    
     await manager.send_personal_message(json.dumps({
         "type": "online_users",
-        "users": clean_users
-    }, default=str), websocket)
-    
-    # Notify all other users that this user joined
-    user_join_data = {
-        "id": user["id"],
-        "username": user["username"],
-        "real_name": user.get("real_name"),
-        "screen_name": user.get("screen_name"),
-        "is_admin": user.get("is_admin", False),
-        "avatar_url": user.get("avatar_url")
-    }
+        "users": presence.snapshot()
+    }, default=str), connection)
+    
+    # Resuming client: replay exactly the chat events it missed while disconnected
+    if last_seq is not None:
+        missed = events.replay(last_seq, connection.topics)
+        if missed is not None:
+            for frame in missed:
+                connection.enqueue(frame)
+        else:
+            # Gap is older than the replay buffer - resend the latest messages from the DB
+            latest_messages = await load_message_page(50)
+            connection.enqueue(json.dumps({
+                "type": "resync",
+                "seq": events.latest_seq,
+                "messages": [message.dict() for message in latest_messages]
+            }, default=str))
+    return connection
+
+def detach_realtime_client(connection):
+    # Presence follows through the manager's disconnect listener: the user goes out in the
+    # next presence_delta if this was their last socket anywhere
+    manager.disconnect(connection)
+
+# WebSocket endpoint for real-time chat
+@app.websocket("/api/ws/{user_id}/{session_id}")
+async def websocket_endpoint(websocket: WebSocket, user_id: str, session_id: str, last_seq: Optional[int] = None,
+                             topics: Optional[str] = None, encoding: Optional[str] = None):
+    # Validate user and session
+    user = await get_realtime_user(user_id, session_id, "WS")
+    if not user:
+        await websocket.close(code=1008, reason="Invalid user or session")
+        return
     
-    await manager.broadcast(json.dumps({
-        "type": "user_joined",
-        "user": user_join_data
-    }, default=str))
+    logger.info(f"✅ WS connected: {user.get('username')} (user_id: {user_id})")
+    # ?encoding=msgpack / json+deflate / msgpack+deflate switches to binary frames (see frames.py)
+    connection = await attach_realtime_client(websocket, user, session_id, last_seq, topics, negotiate_encoding(encoding))
     
     try:
         while True:
             # Keep connection alive and handle heartbeat
             data = await websocket.receive_text()
+            connection.touch()
             try:
                 message = json.loads(data)
-                if message.get("type") == "heartbeat":
-                    # Respond to heartbeat
-                    await websocket.send_text(json.dumps({"type": "heartbeat_ack"}))
-            except:
+                if message.get("type") == "pong":
+                    # Answer to the server's health ping (see ConnectionManager.check_health)
+                    connection.record_pong(message.get("ts"))
+                    presence.heartbeat(user_id)
+                elif message.get("type") == "heartbeat":
+                    presence.heartbeat(user_id)
+                    # Respond to heartbeat through the writer queue to keep frame order
+                    connection.enqueue(json.dumps({"type": "heartbeat_ack"}))
+                elif message.get("type") in ("subscribe", "unsubscribe"):
+                    # {"type": "subscribe", "topics": ["ticker:TSLA"]} - chat:*, ticker:*, own user:<id>, admin (admins only)
+                    if message["type"] == "subscribe":
+                        manager.subscribe(connection, message.get("topics") or [])
+                    else:
+                        manager.unsubscribe(connection, message.get("topics") or [])
+                    connection.enqueue(json.dumps({"type": "subscriptions", "topics": sorted(connection.topics)}))
+            except (ValueError, AttributeError, TypeError):
                 pass  # Ignore invalid JSON messages
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, user_id)
-        
-        # Update user as offline
-        await db.users.update_one(
-            {"id": user_id},
-            {
-                "$set": {
-                    "is_online": False,
-                    "last_seen": datetime.utcnow()
-                }
-            }
-        )
-        
-        # Notify all users that this user left
-        await manager.broadcast(json.dumps({
-            "type": "user_left",
-            "user_id": user_id
-        }, default=str))
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the socket was closed server-side (slow consumer or failed send)
+        pass
+    finally:
+        # Any exit (including cancellation on shutdown) drops the connection from every index
+        detach_realtime_client(connection)
+
+# Server-Sent Events fallback for clients that cannot open a WebSocket
+@api_router.get("/stream/{user_id}/{session_id}")
+async def event_stream_endpoint(request: Request, user_id: str, session_id: str, last_seq: Optional[int] = None, topics: Optional[str] = None):
+    """Same deliveries as the WebSocket (messages, deletions, notifications, session invalidation)
+    over one long-lived text/event-stream response. Browsers resume with the Last-Event-ID header."""
+    user = await get_realtime_user(user_id, session_id, "SSE")
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid user or session")
+    
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        last_seq = int(last_event_id)
+    
+    channel = SSEChannel()
+    connection = await attach_realtime_client(channel, user, session_id, last_seq, topics)
+    logger.info(f"✅ SSE connected: {user.get('username')} (user_id: {user_id})")
+    
+    async def body():
+        try:
+            async for chunk in channel.stream():
+                yield chunk
+        finally:
+            # Client went away (generator cancelled) or the server closed the channel
+            detach_realtime_client(connection)
+    
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Define Enums
 class UserStatus(str, Enum):
@@ -887,6 +949,7 @@ class Message(BaseModel):
     reply_to_id: Optional[str] = None  # NEW: ID of message being replied to
     reply_to: Optional[dict] = None  # NEW: Original message data for display
     text_content: Optional[str] = None  # Text accompanying an image message
+    image: Optional[Dict[str, Any]] = None  # Blob URLs of the original/display/thumbnail variants plus dimensions
 
 class MessageCreate(BaseModel):
     content: str
@@ -895,6 +958,114 @@ class MessageCreate(BaseModel):
     reply_to_id: Optional[str] = None  # NEW: Support for replies
     text_content: Optional[str] = None  # Text accompanying an image message
 
+async def save_and_publish_message(message: Message) -> dict:
+    """Insert a chat message and broadcast it to its topics, dumping the model only once"""
+    message_doc = canonical_message_doc(message)
+    await db.messages.insert_one(message_doc)
+    message_doc.pop("_id", None)  # Added by insert_one
+    await events.publish("message", message_doc, message_topics(message_doc))
+    return message_doc
+
+async def purge_messages(query: dict) -> int:
+    """Bulk-delete chat messages and tell every worker's cache and every client which ones went"""
+    message_ids = await db.messages.distinct("id", query)
+    if not message_ids:
+        return 0
+    result = await db.messages.delete_many({"id": {"$in": message_ids}})
+    await events.publish("messages_purged", {"ids": message_ids})
+    return result.deleted_count
+
+def build_cached_message(message: dict, trusted: bool = True) -> Optional[Message]:
+    """Message from a stored document. Documents at the current schema version (from MongoDB) are
+    used as is; anything else is normalized and validated first."""
+    if trusted and message.get("schema_version") == MESSAGE_SCHEMA_VERSION:
+        return Message.model_construct(**message)
+    try:
+        return Message(**normalize_message_doc(message))
+    except Exception as e:
+        logger.warning(f"Skipping invalid message {message.get('id', 'unknown')}: {e}")
+        return None
+
+def parse_message_timestamp(value: str) -> Optional[datetime]:
+    """ISO timestamp from a ?before= cursor as naive UTC (how messages are stored), None if unparsable"""
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+async def ensure_chat_access(user_id: str):
+    """TRIAL SYSTEM: expired trials may not read the chat"""
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "status": 1})
+    if user and user.get("status") == UserStatus.TRIAL_EXPIRED:
+        raise HTTPException(
+            status_code=403, 
+            detail="Chat viewing restricted. Your trial has expired. Upgrade your account to view trader discussions."
+        )
+
+# Newest chat messages in memory for GET /messages and /messages/welcome, kept current on
+# every worker from the chat event stream
+message_cache = RecentMessageCache(db, build_cached_message)
+
+def update_message_cache(event_type: str, data: dict):
+    if event_type == "message":
+        # Timestamps arrive as strings through the broker, so event payloads are always validated
+        message = build_cached_message(dict(data), trusted=False)
+        if message is not None:
+            message_cache.add(message)
+    elif event_type == "message_deleted":
+        message_cache.remove(data["id"])
+    elif event_type == "messages_purged":
+        for message_id in data["ids"]:
+            message_cache.remove(message_id)
+
+events.add_listener(update_message_cache)
+
+# Most-mentioned cashtags per window, counted as chat messages and bot alerts are published
+trending = TrendingTickers(db, manager)
+
+def update_trending(event_type: str, data: dict):
+    if event_type == "message":
+        trending.record(data)
+
+events.add_listener(update_trending)
+
+# Normalizes pre-schema_version messages in the background so reads can trust stored documents
+message_migration = MessageSchemaMigration(db, lambda doc: Message(**doc))
+
+# Chat image bytes, content-addressed by SHA-256; messages keep only /api/blobs/<sha256>
+blob_store = create_blob_store(db)
+
+# Uploads are validated and re-encoded in worker processes, never on the event loop
+image_pipeline = ImagePipeline()
+
+async def process_uploaded_image(file_content: bytes) -> Dict[str, Any]:
+    """Sniff, strip and resize an upload off the event loop, store every variant and return their URLs"""
+    if len(file_content) > BLOB_MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=400, detail="Image too large")
+    try:
+        result = await image_pipeline.process(file_content)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    image = {"width": result["width"], "height": result["height"], "thumbnail_size": result["thumbnail_size"]}
+    for name, (data, content_type) in result["variants"].items():
+        image[name] = blob_url(await blob_store.put(data, content_type))
+    return image
+
+async def store_image_content(content: str):
+    """(content, image) for an image message: inline data URLs are processed and replaced by the original's blob URL"""
+    if not content.startswith("data:"):
+        return content, None
+    try:
+        data, _ = decode_data_url(content)  # The declared type is not trusted; the pipeline sniffs it
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    image = await process_uploaded_image(data)
+    return image["original"], image
+
 class Team(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -1250,14 +1421,8 @@ async def share_achievement_in_chat(user_id: str, achievement: dict):
             screen_name=user.get("screen_name")
         )
         
-        # Save message to database
-        await db.messages.insert_one(message.dict())
-        
-        # Broadcast to all connected users
-        await manager.broadcast(json.dumps({
-            "type": "message",
-            "data": message.dict()
-        }, default=str))
+        # Save message to database and broadcast to all connected users
+        await save_and_publish_message(message)
         
     except Exception as e:
         logger.error(f"Error sharing achievement in chat: {e}")
@@ -1417,47 +1582,30 @@ def format_pnl_display(pnl):
         return f"{pnl:.2f}"
 
 # Utility function to extract stock tickers from message
-def extract_stock_tickers(content: str) -> List[str]:
-    """Extract stock tickers that start with $ from message content"""
-    pattern = r'\$([A-Z]{1,5})'
-    matches = re.findall(pattern, content.upper())
-    return matches
-
 async def handle_message_mentions(message_content: str, sender_user: dict, message_id: str):
-    """Handle @username mentions in messages"""
+    """Handle @username mentions in messages (resolved from the in-memory user directory)"""
     try:
-        import re
-        mention_pattern = r'@(\w+)'
-        mentioned_usernames = re.findall(mention_pattern, message_content)
+        # Exclude self-mentions
+        mentioned_users = [user for user in user_directory.resolve_mentions(message_content) if user["id"] != sender_user["id"]]
+        if not mentioned_users:
+            return
         
-        if mentioned_usernames:
-            # Remove duplicates and exclude self-mentions
-            mentioned_usernames = list(set(mentioned_usernames))
-            sender_username = sender_user.get("username")
-            
-            for mentioned_username in mentioned_usernames:
-                if mentioned_username.lower() != sender_username.lower():  # Case-insensitive comparison
-                    # Find the mentioned user (case-insensitive)
-                    mentioned_user = await db.users.find_one({
-                        "username": {"$regex": f"^{mentioned_username}$", "$options": "i"}
-                    })
-                    if mentioned_user:
-                        sender_name = sender_user.get("screen_name") or sender_user.get("username")
-                        await create_user_notification(
-                            user_id=mentioned_user["id"],
-                            notification_type="mention",
-                            title="You were mentioned! 👋",
-                            message=f"{sender_name} mentioned you in chat: \"{message_content[:100]}{'...' if len(message_content) > 100 else ''}\"",
-                            data={
-                                "mentioner_id": sender_user["id"],
-                                "mentioner_name": sender_name,
-                                "mentioner_avatar": sender_user.get("avatar_url"),
-                                "message_id": message_id,
-                                "message_content": message_content,
-                                "action": "mention"
-                            }
-                        )
-                        logger.info(f"Created mention notification for {mentioned_user['username']} from {sender_name}")
+        sender_name = sender_user.get("screen_name") or sender_user.get("username")
+        await create_user_notifications(
+            user_ids=[user["id"] for user in mentioned_users],
+            notification_type="mention",
+            title="You were mentioned! 👋",
+            message=f"{sender_name} mentioned you in chat: \"{message_content[:100]}{'...' if len(message_content) > 100 else ''}\"",
+            data={
+                "mentioner_id": sender_user["id"],
+                "mentioner_name": sender_name,
+                "mentioner_avatar": sender_user.get("avatar_url"),
+                "message_id": message_id,
+                "message_content": message_content,
+                "action": "mention"
+            }
+        )
+        logger.info(f"Created mention notifications for {', '.join(user['username'] for user in mentioned_users)} from {sender_name}")
                         
     except Exception as e:
         logger.error(f"Error handling message mentions: {e}")
@@ -1480,15 +1628,6 @@ async def migrate_password_if_needed(user_id: str, password: str, stored_hash: s
         new_hash = hash_password(password)
         await db.users.update_one({"id": user_id}, {"$set": {"hashed_password": new_hash}})
 
-def process_uploaded_image(file_content: bytes, max_size: int = 1024 * 1024) -> str:
-    """Process uploaded image and return base64 data URL"""
-    if len(file_content) > max_size:
-        raise HTTPException(status_code=400, detail="Image too large (max 1MB)")
-    
-    # Convert to base64 data URL
-    base64_content = base64.b64encode(file_content).decode('utf-8')
-    return f"data:image/jpeg;base64,{base64_content}"
-
 async def get_current_stock_price(symbol: str) -> float:
     """Get current stock price from API or mock data"""
     try:
@@ -1895,14 +2034,16 @@ async def register_user(request: Request, user_data: UserCreate, background_task
         logger.info(f"🔄 REJECTED USER RE-REGISTERING: {user_data.username} - Removing old rejected account")
         # Clean up old rejected user data
         await db.users.delete_one({"username": user_data.username})
-        await db.messages.delete_many({"user_id": existing_user["id"]})
+        user_directory.remove(existing_user["id"])
+        await purge_messages({"user_id": existing_user["id"]})
         await db.notifications.delete_many({"user_id": existing_user["id"]})
         
     if existing_email and existing_email.get("status") == UserStatus.REJECTED and existing_email["id"] != existing_user.get("id", ""):
         logger.info(f"🔄 REJECTED EMAIL RE-REGISTERING: {user_data.email} - Removing old rejected account")
         # Clean up old rejected user data by email
         await db.users.delete_one({"email": user_data.email})
-        await db.messages.delete_many({"user_id": existing_email["id"]})
+        user_directory.remove(existing_email["id"])
+        await purge_messages({"user_id": existing_email["id"]})
         await db.notifications.delete_many({"user_id": existing_email["id"]})
     
     # Create new user with pending status (in production, hash the password!)
@@ -1963,6 +2104,7 @@ async def register_user(request: Request, user_data: UserCreate, background_task
     
     # Insert user into database
     await db.users.insert_one(user.dict())
+    user_directory.upsert(user.dict())
     
     # Handle referral if provided
     if referral_code:
@@ -2008,6 +2150,8 @@ async def login_user(login_data: UserLogin):
                 {"$set": {"status": UserStatus.TRIAL_EXPIRED.value}}
             )
             user_obj.status = UserStatus.TRIAL_EXPIRED
+            manager.update_user(user_obj.id, status=UserStatus.TRIAL_EXPIRED)
+            user_directory.update(user_obj.id, {"status": UserStatus.TRIAL_EXPIRED.value})
             logger.info(f"⏰ TRIAL EXPIRED: {user_obj.username} - Converting to limited access")
             
             # Schedule upgrade email if not sent
@@ -2180,45 +2324,50 @@ async def process_login_rewards_async(user_id: str, streak: int, xp_added: int):
 
 @api_router.get("/users/online")
 async def get_online_users():
-    """Get currently online users for HTTP polling fallback"""
-    try:
-        online_users = await db.users.find(
-            {"is_online": True},
-            {"_id": 0, "id": 1, "username": 1, "real_name": 1, "screen_name": 1, "is_admin": 1, "avatar_url": 1, "last_seen": 1}
-        ).to_list(100)
-        return online_users
-    except Exception as e:
-        logger.error(f"Error getting online users: {e}")
-        return []
+    """Get currently online users for HTTP polling fallback (served from memory)"""
+    return presence.snapshot()
 
 @api_router.get("/users/online-count")
 async def get_online_count():
-    """Get current online user count for debugging"""
-    try:
-        # Clean up stale sessions first
-        await cleanup_stale_sessions()
-        
-        # Get fresh count
-        online_count = await db.users.count_documents({"is_online": True})
-        online_users = await db.users.find(
-            {"is_online": True}, 
-            {"username": 1, "real_name": 1, "last_seen": 1, "active_session_id": 1}
-        ).to_list(100)
-        
-        return {
-            "online_count": online_count,
-            "online_users": [
-                {
-                    "username": user["username"],
-                    "real_name": user.get("real_name"),
-                    "last_seen": user.get("last_seen"),
-                    "has_session": bool(user.get("active_session_id"))
-                } for user in online_users
-            ]
-        }
-    except Exception as e:
-        logger.error(f"Error getting online count: {e}")
-        raise HTTPException(status_code=500, detail="Failed to get online count")
+    """Get current online user count for debugging (served from memory)"""
+    return {
+        "online_count": presence.count,
+        "online_users": [
+            {
+                "username": profile.get("username"),
+                "real_name": profile.get("real_name"),
+                "last_seen": profile.get("last_seen"),
+                "has_session": True
+            } for profile in presence.snapshot()
+        ]
+    }
+
+@api_router.get("/admin/websocket-stats")
+async def get_websocket_stats(admin_id: str):
+    """WebSocket metrics: connections, queue depth, drops, broadcast latency, ping RTT and evictions - admin only"""
+    admin = await db.users.find_one({"id": admin_id})
+    if not admin or not admin.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    stats = manager.get_stats()
+    stats["presence"] = {"online": presence.count, "flusher": presence.flusher.get_stats()}
+    stats["events"] = events.get_stats()
+    stats["message_cache"] = message_cache.get_stats()
+    stats["trending"] = trending.get_stats()
+    stats["user_directory"] = user_directory.get_stats()
+    stats["notification_queue"] = notification_queue.get_stats()
+    stats["unread_reconcile"] = unread_counters.get_stats()
+    stats["fcm_tokens"] = fcm_token_registry.get_stats()
+    return stats
+
+@api_router.get("/admin/message-schema-migration")
+async def get_message_schema_migration(admin_id: str):
+    """Progress and rows/sec of the background message normalization - admin only"""
+    admin = await db.users.find_one({"id": admin_id})
+    if not admin or not admin.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return message_migration.get_stats()
 
 @api_router.get("/users/{user_id}/session-status")
 async def check_session_status(user_id: str, session_id: str):
@@ -2247,6 +2396,11 @@ async def logout_user(user_id: str):
     )
     return {"message": "Logged out successfully"}
 
+@api_router.get("/users/search")
+async def search_users(prefix: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=USER_SEARCH_MAX_LIMIT)):
+    """Username autocomplete (case-insensitive prefix match, served from the user directory)"""
+    return user_directory.search(prefix, limit)
+
 @api_router.get("/users", response_model=List[User])
 async def get_users():
     """Get all active users (approved and trial users)"""
@@ -2322,6 +2476,8 @@ async def approve_user(approval: UserApproval, background_tasks: BackgroundTasks
     # Get updated user
     user = await db.users.find_one({"id": approval.user_id})
     status_text = "approved" if approval.approved else "rejected"
+    manager.update_user(user["id"], user.get("is_admin", False), user.get("status"))
+    user_directory.update(user["id"], {"is_admin": user.get("is_admin", False), "status": user.get("status")})
     
     # Send email notification to user about approval/rejection
     user_name = user_to_approve.get('real_name', user_to_approve.get('username'))
@@ -2415,6 +2571,8 @@ async def change_user_role(role_change: Dict[str, Any], background_tasks: Backgr
     
     # Get updated user
     updated_user = await db.users.find_one({"id": user_id})
+    manager.update_user(user_id, update_data["is_admin"])
+    user_directory.update(user_id, {"is_admin": update_data["is_admin"]})
     
     # Send email notification to user about role change
     user_name = target_user.get('real_name', target_user.get('username'))
@@ -2931,6 +3089,9 @@ async def update_user_role(user_id: str, role_update: UserRoleUpdate):
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    manager.update_user(user_id, update_data["is_admin"])
+    user_directory.update(user_id, {"is_admin": update_data["is_admin"]})
+    
     return {"message": "User role updated successfully"}
 
 @api_router.delete("/users/{user_id}")
@@ -2957,7 +3118,7 @@ async def remove_user(user_id: str, admin_id: str):
     # COMPREHENSIVE CLEANUP: Remove all user-related data
     try:
         # 1. Delete user messages
-        messages_deleted = await db.messages.delete_many({"user_id": user_id})
+        messages_deleted = await purge_messages({"user_id": user_id})
         
         # 2. Delete user notifications
         notifications_deleted = await db.notifications.delete_many({"user_id": user_id})
@@ -2967,7 +3128,7 @@ async def remove_user(user_id: str, admin_id: str):
         positions_deleted = await db.positions.delete_many({"user_id": user_id})
         
         # 4. Delete FCM tokens
-        fcm_deleted = await db.fcm_tokens.delete_many({"user_id": user_id})
+        fcm_deleted = await fcm_token_registry.remove_user(user_id)
         
         # 5. Remove user from other users' followers/following lists
         await db.users.update_many(
@@ -2987,10 +3148,11 @@ async def remove_user(user_id: str, admin_id: str):
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="User deletion failed")
+        user_directory.remove(user_id)
         
         # Log the removal with details
         logger.info(f"🗑️ USER REMOVED by admin {admin['username']}: {username} (Status: {user_status}, Plan: {membership_plan})")
-        logger.info(f"📊 Cleanup stats - Messages: {messages_deleted.deleted_count}, Notifications: {notifications_deleted.deleted_count}, Trades: {trades_deleted.deleted_count}, FCM: {fcm_deleted.deleted_count}")
+        logger.info(f"📊 Cleanup stats - Messages: {messages_deleted}, Notifications: {notifications_deleted.deleted_count}, Trades: {trades_deleted.deleted_count}, FCM: {fcm_deleted}")
         
         # Notify other admins about the removal
         await manager.send_admin_notification(json.dumps({
@@ -3014,11 +3176,11 @@ async def remove_user(user_id: str, admin_id: str):
                 "removed_by": admin['username']
             },
             "cleanup_stats": {
-                "messages_deleted": messages_deleted.deleted_count,
+                "messages_deleted": messages_deleted,
                 "notifications_deleted": notifications_deleted.deleted_count,
                 "trades_deleted": trades_deleted.deleted_count,
                 "positions_deleted": positions_deleted.deleted_count,
-                "fcm_tokens_deleted": fcm_deleted.deleted_count,
+                "fcm_tokens_deleted": fcm_deleted,
                 "cash_prizes_deleted": prizes_deleted.deleted_count
             }
         }
@@ -3120,6 +3282,9 @@ async def update_user_profile(user_id: str, profile_update: ProfileUpdate):
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    presence.refresh_profile(user_id, update_data)
+    user_directory.update(user_id, update_data)
+    
     # Award XP for profile completion
     if profile_update.avatar_url or profile_update.bio or profile_update.profile_banner:
         await award_xp(user_id, "profile_update", 25)
@@ -3322,6 +3487,8 @@ async def convert_trial_to_member(user_id: str, admin_id: str):
         }}
     )
     
+    manager.update_user(user_id, status=UserStatus.APPROVED)
+    user_directory.update(user_id, {"status": UserStatus.APPROVED.value})
     logger.info(f"🎉 TRIAL CONVERTED TO MEMBER: {user['username']} by admin {admin['username']}")
     
     # Send approval confirmation and welcome email
@@ -3438,12 +3605,13 @@ async def bulk_remove_trial_users(admin_id: str, user_ids: list):
                 continue
             
             # Perform the removal (simplified cleanup for bulk operation)
-            await db.messages.delete_many({"user_id": user_id})
+            await purge_messages({"user_id": user_id})
             await db.notifications.delete_many({"user_id": user_id})
-            await db.fcm_tokens.delete_many({"user_id": user_id})
+            await fcm_token_registry.remove_user(user_id)
             result = await db.users.delete_one({"id": user_id})
             
             if result.deleted_count > 0:
+                user_directory.remove(user_id)
                 removed_users.append({
                     "user_id": user_id,
                     "username": user.get("username"),
@@ -3506,7 +3674,8 @@ async def allow_rejected_user_reregistration(user_id: str, admin_id: str):
     
     # Remove the rejected user account to allow re-registration
     await db.users.delete_one({"id": user_id})
-    await db.messages.delete_many({"user_id": user_id})
+    user_directory.remove(user_id)
+    await purge_messages({"user_id": user_id})
     await db.notifications.delete_many({"user_id": user_id})
     
     logger.info(f"🔓 ADMIN ALLOWED RE-REGISTRATION: {username} by admin {admin['username']}")
@@ -3583,14 +3752,8 @@ async def share_cash_prize_in_chat(user_id: str, cash_prize: dict):
             screen_name=user.get("screen_name")
         )
         
-        # Save message to database
-        await db.messages.insert_one(message.dict())
-        
-        # Broadcast to all connected users
-        await manager.broadcast(json.dumps({
-            "type": "message",
-            "data": message.dict()
-        }, default=str))
+        # Save message to database and broadcast to all connected users
+        await save_and_publish_message(message)
         
     except Exception as e:
         logger.error(f"Error sharing cash prize in chat: {e}")
@@ -3779,13 +3942,15 @@ async def get_user_notifications(user_id: str, limit: int = 50, offset: int = 0)
     if notifications:
         notification_ids = [notif["id"] for notif in notifications if not notif.get("read", False)]
         if notification_ids:
-            await db.notifications.update_many(
+            result = await db.notifications.update_many(
                 {
                     "id": {"$in": notification_ids},
-                    "user_id": user_id
+                    "user_id": user_id,
+                    "read": False
                 },
                 {"$set": {"read": True, "read_at": datetime.utcnow()}}
             )
+            await unread_counters.adjust(user_id, -result.modified_count)
             logger.info(f"Auto-marked {len(notification_ids)} notifications as read for user {user_id}")
             
             # Update the notifications list to reflect read status
@@ -3799,13 +3964,16 @@ async def get_user_notifications(user_id: str, limit: int = 50, offset: int = 0)
 @api_router.put("/users/{user_id}/notifications/{notification_id}/read")
 async def mark_notification_as_read(user_id: str, notification_id: str):
     """Mark a notification as read"""
-    result = await db.notifications.update_one(
+    previous = await db.notifications.find_one_and_update(
         {"id": notification_id, "user_id": user_id},
-        {"$set": {"read": True}}
+        {"$set": {"read": True}},
+        projection={"_id": 0, "read": 1}
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Notification not found")
+    if not previous.get("read"):
+        await unread_counters.adjust(user_id, -1)
     
     return {"message": "Notification marked as read"}
 
@@ -3816,60 +3984,90 @@ async def mark_all_notifications_as_read(user_id: str):
         {"user_id": user_id, "read": False},
         {"$set": {"read": True}}
     )
+    await unread_counters.adjust(user_id, -result.modified_count)
     
     return {"message": f"Marked {result.modified_count} notifications as read"}
 
 @api_router.delete("/users/{user_id}/notifications/{notification_id}")
 async def delete_notification(user_id: str, notification_id: str):
     """Delete a notification"""
-    result = await db.notifications.delete_one(
-        {"id": notification_id, "user_id": user_id}
+    deleted = await db.notifications.find_one_and_delete(
+        {"id": notification_id, "user_id": user_id},
+        projection={"_id": 0, "read": 1}
     )
     
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Notification not found")
+    if not deleted.get("read"):
+        await unread_counters.adjust(user_id, -1)
     
     return {"message": "Notification deleted"}
 
 @api_router.get("/users/{user_id}/notifications/unread-count")
 async def get_unread_notification_count(user_id: str):
-    """Get count of unread notifications for a user"""
-    count = await db.notifications.count_documents(
-        {"user_id": user_id, "read": False}
-    )
+    """Get count of unread notifications for a user (denormalized counter, see notification_counters.py)"""
+    count = await unread_counters.get(user_id)
+    if count is None:
+        raise HTTPException(status_code=404, detail="User not found")
     
-    return {"message": f"Unread notification count: {count}"}
+    return {"count": count, "message": f"Unread notification count: {count}"}
+
+@api_router.post("/admin/reconcile-unread-counts")
+async def reconcile_unread_counts(admin_id: str):
+    """Recompute unread notification counters from the notifications collection - admin only"""
+    admin = await db.users.find_one({"id": admin_id})
+    if not admin or not admin.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return await unread_counters.reconcile()
+
+# Message Reaction Endpoints (counts are denormalized onto messages, see reactions.py)
+async def update_reaction_count(message_id: str, reaction_type: str, user_id: str, delta: int) -> int:
+    """Atomically adjust one message's reaction count and broadcast the new value"""
+    updated = await db.messages.find_one_and_update(
+        {"id": message_id},
+        {"$inc": {f"reaction_counts.{reaction_type}": delta}},
+        projection={"_id": 0, "reaction_counts": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    count = max(0, ((updated or {}).get("reaction_counts") or {}).get(reaction_type, 0))
+    # Absolute count, so a client that sees a delta twice still shows the right number
+    await events.publish("reaction", {
+        "message_id": message_id,
+        "reaction_type": reaction_type,
+        "count": count,
+        "user_id": user_id,
+        "action": "add" if delta > 0 else "remove"
+    })
+    return count
+
+async def ensure_reaction_counts():
+    """Backfill counts once for reactions made before they were denormalized"""
+    try:
+        if not await db.counters.find_one({"_id": REACTION_COUNTS_MARKER}):
+            await rebuild_reaction_counts(db)
+    except Exception as e:
+        logger.error(f"Could not rebuild reaction counts: {e}")
 
-# Message Reaction Endpoints
 @api_router.post("/messages/{message_id}/react")
 async def add_message_reaction(message_id: str, reaction_data: dict, background_tasks: BackgroundTasks):
     """Add a reaction to a message"""
     user_id = reaction_data.get("user_id")
-    reaction_type = reaction_data.get("reaction_type", "heart")  # Default to heart
+    reaction_type = validate_reaction_type(reaction_data.get("reaction_type", "heart"))  # Default to heart
     
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID required")
     
     # Get the message and user
-    message = await db.messages.find_one({"id": message_id})
-    user = await db.users.find_one({"id": user_id})
+    message = await db.messages.find_one({"id": message_id}, {"_id": 0, "user_id": 1, "content": 1, "content_type": 1})
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "id": 1, "username": 1, "screen_name": 1, "avatar_url": 1})
     
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Check if user already reacted to this message
-    existing_reaction = await db.reactions.find_one({
-        "message_id": message_id,
-        "user_id": user_id,
-        "reaction_type": reaction_type
-    })
-    
-    if existing_reaction:
-        raise HTTPException(status_code=400, detail="Already reacted to this message")
-    
-    # Create reaction
+    # Create reaction - the unique (message_id, user_id, reaction_type) index rejects doubles atomically
     reaction = {
         "id": str(uuid.uuid4()),
         "message_id": message_id,
@@ -3878,7 +4076,11 @@ async def add_message_reaction(message_id: str, reaction_data: dict, background_
         "created_at": datetime.utcnow()
     }
     
-    await db.reactions.insert_one(reaction)
+    try:
+        await db.reactions.insert_one(reaction)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Already reacted to this message")
+    count = await update_reaction_count(message_id, reaction_type, user_id, 1)
     
     # Award XP for giving reaction
     await award_xp(user_id, "heart_reaction", 2)
@@ -3886,29 +4088,31 @@ async def add_message_reaction(message_id: str, reaction_data: dict, background_
     # Create notification for the message author (if not reacting to own message)
     if message["user_id"] != user_id:
         reactor_name = user.get("screen_name") or user.get("username")
-        reaction_emoji = "❤️" if reaction_type == "heart" else "👍"
+        reaction_emoji = {"heart": "❤️", "like": "👍"}.get(reaction_type, reaction_type)
+        content = message["content"] if message.get("content_type") != "image" else "📷 Image"
         
         await create_user_notification(
             user_id=message["user_id"],
             notification_type="reaction",
             title="New Reaction",
-            message=f"{reactor_name} reacted {reaction_emoji} to your message: \"{message['content'][:50]}{'...' if len(message['content']) > 50 else ''}\"",
+            message=f"{reactor_name} reacted {reaction_emoji} to your message: \"{content[:50]}{'...' if len(content) > 50 else ''}\"",
             data={
                 "reactor_id": user_id,
                 "reactor_name": reactor_name,
                 "reactor_avatar": user.get("avatar_url"),
                 "message_id": message_id,
                 "reaction_type": reaction_type,
-                "message_content": message["content"],
+                "message_content": content,
                 "action": "reaction"
             }
         )
     
-    return {"message": "Reaction added successfully"}
+    return {"message": "Reaction added successfully", "count": count}
 
 @api_router.delete("/messages/{message_id}/react")
 async def remove_message_reaction(message_id: str, user_id: str, reaction_type: str = "heart"):
     """Remove a reaction from a message"""
+    reaction_type = validate_reaction_type(reaction_type)
     result = await db.reactions.delete_one({
         "message_id": message_id,
         "user_id": user_id,
@@ -3917,33 +4121,35 @@ async def remove_message_reaction(message_id: str, user_id: str, reaction_type:
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Reaction not found")
+    count = await update_reaction_count(message_id, reaction_type, user_id, -1)
     
-    return {"message": "Reaction removed successfully"}
+    return {"message": "Reaction removed successfully", "count": count}
 
 @api_router.get("/messages/{message_id}/reactions")
 async def get_message_reactions(message_id: str):
     """Get all reactions for a message"""
-    reactions = await db.reactions.find({"message_id": message_id}).to_list(1000)
-    
-    # Group reactions by type and get user info
-    reaction_summary = {}
-    for reaction in reactions:
-        reaction_type = reaction["reaction_type"]
-        if reaction_type not in reaction_summary:
-            reaction_summary[reaction_type] = []
-        
-        # Get user info for the reaction
-        user = await db.users.find_one({"id": reaction["user_id"]})
-        if user:
-            reaction_summary[reaction_type].append({
-                "user_id": user["id"],
-                "username": user["username"],
-                "screen_name": user.get("screen_name"),
-                "avatar_url": user.get("avatar_url"),
-                "created_at": reaction["created_at"]
-            })
+    reactors = await load_reactors(db, [message_id])
+    return reactors.get(message_id, {})
+
+class ReactionSummaryRequest(BaseModel):
+    message_ids: List[str]
+    user_id: Optional[str] = None
+    expand: bool = False  # Include who reacted
+
+@api_router.post("/messages/reactions/summary")
+async def get_reaction_summary(request: ReactionSummaryRequest):
+    """Reaction counts (and which ones the user gave) for a page of messages.
+    Counts come from the messages themselves; reactor profiles only with expand=true."""
+    return await reaction_summary(db, request.message_ids, request.user_id, request.expand)
+
+@api_router.post("/admin/rebuild-reaction-counts")
+async def rebuild_reaction_counts_endpoint(admin_id: str):
+    """Recompute denormalized reaction counts from db.reactions - admin only"""
+    admin = await db.users.find_one({"id": admin_id})
+    if not admin or not admin.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    return reaction_summary
+    return {"messages_updated": await rebuild_reaction_counts(db)}
 
 @api_router.get("/users/{user_id}/followers")
 async def get_user_followers(user_id: str):
@@ -4048,14 +4254,8 @@ async def create_bot_message(message_data: dict):
                 reply_to=None
             )
             
-            # Insert into database
-            await db.messages.insert_one(chat_message.dict())
-            
-            # Broadcast bot message to all connected users via WebSocket
-            await manager.broadcast(json.dumps({
-                "type": "message",
-                "data": chat_message.dict()
-            }, default=str))
+            # Insert into database and broadcast bot message to all connected users via WebSocket
+            await save_and_publish_message(chat_message)
             
             logger.info(f"Bot message created and broadcast: {formatted_message}")
             
@@ -4118,6 +4318,7 @@ async def get_or_create_bot_user():
         }
         
         await db.users.insert_one(bot_user)
+        user_directory.upsert(bot_user)
         logger.info("CashOutAi Bot user created")
     
     return bot_user
@@ -4364,10 +4565,15 @@ async def create_message(message_data: MessageCreate, background_tasks: Backgrou
                 "content_type": reply_to_message.get("content_type", "text")
             }
     
+    # Images are stored once in the blob store; the message only references them
+    content, image = message_data.content, None
+    if message_data.content_type == "image":
+        content, image = await store_image_content(content)
+    
     message = Message(
         user_id=message_data.user_id,
         username=user["username"],
-        content=message_data.content,
+        content=content,
         content_type=message_data.content_type,
         is_admin=user.get("is_admin", False),
         avatar_url=user.get("avatar_url"),
@@ -4376,16 +4582,12 @@ async def create_message(message_data: MessageCreate, background_tasks: Backgrou
         highlighted_tickers=tickers,
         reply_to_id=message_data.reply_to_id,
         reply_to=reply_to_data,
-        text_content=message_data.text_content
+        text_content=message_data.text_content,
+        image=image
     )
     
-    await db.messages.insert_one(message.dict())
-    
-    # Broadcast message to all connected users IMMEDIATELY
-    await manager.broadcast(json.dumps({
-        "type": "message",
-        "data": message.dict()
-    }, default=str))
+    # Save and broadcast message to all connected users IMMEDIATELY
+    await save_and_publish_message(message)
     
     # Move ALL heavy operations to background tasks
     background_tasks.add_task(post_message_tasks, message_data, message, user, reply_to_data)
@@ -4431,8 +4633,7 @@ async def post_message_tasks(message_data, message, user, reply_to_data):
                     "status": UserStatus.APPROVED
                 }).to_list(1000)
                 other_user_ids = [u["id"] for u in other_users]
-                tokens = await db.fcm_tokens.find({"user_id": {"$in": other_user_ids}}).to_list(1000)
-                token_list = [t["token"] for t in tokens]
+                token_list = fcm_token_registry.tokens_for_users(other_user_ids)
                 
                 if token_list:
                     sender_name = user.get("screen_name") or user.get("real_name") or user["username"]
@@ -4455,20 +4656,14 @@ async def post_message_tasks(message_data, message, user, reply_to_data):
             except Exception as e:
                 print(f"FCM notification error: {e}")
             
-            # Admin WebSocket notifications
+            # Admin WebSocket notifications to connected members (in-memory group index)
             try:
-                non_admin_users = await db.users.find({"is_admin": {"$ne": True}, "is_online": True}).to_list(1000)
-                for nau in non_admin_users:
-                    if nau["id"] in manager.user_connections:
-                        try:
-                            await manager.user_connections[nau["id"]].send_text(json.dumps({
-                                "type": "admin_notification",
-                                "message": f"Admin {user.get('real_name') or user['username']}: {message_data.content}",
-                                "admin_username": user['username'],
-                                "content": message_data.content
-                            }, default=str))
-                        except:
-                            pass
+                manager.send_to_group(GROUP_MEMBERS, json.dumps({
+                    "type": "admin_notification",
+                    "message": f"Admin {user.get('real_name') or user['username']}: {message_data.content}",
+                    "admin_username": user['username'],
+                    "content": message_data.content
+                }, default=str))
             except Exception as e:
                 print(f"Admin WS notification error: {e}")
     except Exception as e:
@@ -4481,15 +4676,12 @@ async def delete_message(message_id: str, user_id: str):
     if not user or not user.get("is_admin"):
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    result = await db.messages.delete_one({"id": message_id})
-    if result.deleted_count == 0:
+    deleted = await db.messages.find_one_and_delete({"id": message_id}, {"_id": 0, "highlighted_tickers": 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Message not found")
     
-    # Broadcast deletion to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "message_deleted",
-        "data": {"id": message_id}
-    }))
+    # Broadcast deletion to everyone who could have received the message
+    await events.publish("message_deleted", {"id": message_id}, message_topics(deleted))
     
     return {"message": "Message deleted", "id": message_id}
 
@@ -4500,68 +4692,174 @@ async def cleanup_debug_messages(user_id: str):
     if not user or not user.get("is_admin"):
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    result = await db.messages.delete_many({"content": {"$regex": "DEBUG:"}})
-    return {"message": f"Deleted {result.deleted_count} debug message(s)"}
-
-@api_router.get("/messages", response_model=List[Message])
-async def get_messages(limit: int = 50, user_id: Optional[str] = None, before: Optional[str] = None):
-    # TRIAL SYSTEM: Check user access for chat viewing
-    if user_id:
-        user = await db.users.find_one({"id": user_id})
-        if user and user.get("status") == UserStatus.TRIAL_EXPIRED:
-            raise HTTPException(
-                status_code=403, 
-                detail="Chat viewing restricted. Your trial has expired. Upgrade your account to view trader discussions."
-            )
-    
-    query = {}
-    if before:
-        query["timestamp"] = {"$lt": before}
-    
-    projection = {"_id": 0}
-    messages = await db.messages.find(query, projection).sort("timestamp", -1).limit(limit).to_list(limit)
+    deleted_count = await purge_messages({"content": {"$regex": "DEBUG:"}})
+    return {"message": f"Deleted {deleted_count} debug message(s)"}
+
+async def load_message_page(limit: int, before: Optional[CursorKey] = None, after: Optional[CursorKey] = None,
+                            match: Optional[dict] = None) -> List[Message]:
+    """One page of listing messages, oldest first: the newest before `before`, or the oldest after `after`.
+    `match` narrows the page (e.g. to one ticker) and must be served by an index ending in (timestamp, id)."""
+    # PERFORMANCE: recent pages of the whole chat come straight from the in-memory message cache
+    if match is None:
+        cached = message_cache.after(after, limit) if after else message_cache.recent(limit, before)
+        if cached is not None:
+            return cached
+    
+    # Keyset range on the (timestamp, id) index
+    query = keyset_filter(before=before, after=after)
+    if match:
+        query = {"$and": [match, query]} if query else match
+    direction = 1 if after else -1
+    messages = await db.messages.find(query, {"_id": 0}).sort([("timestamp", direction), ("id", direction)]).limit(limit).to_list(limit)
+    if not after:
+        messages.reverse()
     
     cleaned_messages = []
     for message in messages:
-        try:
+        message = build_cached_message(message)
+        if message is not None:
             # PERFORMANCE: For image messages, replace huge base64 content with placeholder
             # Frontend will lazy-load full image via /api/messages/{id}/image
-            if message.get('content_type') == 'image' and message.get('content', '').startswith('data:'):
-                message['content'] = f"__IMAGE__{message.get('id', '')}__"
-            
-            if 'highlighted_tickers' in message:
-                tickers = message['highlighted_tickers']
-                if isinstance(tickers, list) and tickers:
-                    if isinstance(tickers[0], dict):
-                        message['highlighted_tickers'] = [ticker.get('symbol', '') for ticker in tickers if isinstance(ticker, dict) and 'symbol' in ticker]
-                    elif not isinstance(tickers[0], str):
-                        message['highlighted_tickers'] = []
-                else:
-                    message['highlighted_tickers'] = []
+            cleaned_messages.append(listing_view(message))
+    return cleaned_messages
+
+def parse_message_cursor(value: str) -> CursorKey:
+    """Opaque cursor, or a bare ISO timestamp from older clients (everything strictly before it)"""
+    try:
+        return decode_cursor(value)
+    except ValueError:
+        timestamp = parse_message_timestamp(value)
+        if timestamp is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return timestamp, ""
+
+async def has_messages_after(after: CursorKey, match: Optional[dict] = None) -> bool:
+    """Answered from memory, or by a limit-1 index probe - no message bodies are read.
+    `match` narrows the probe like load_message_page's (e.g. to one ticker)."""
+    if match is None:
+        cached = message_cache.has_after(after)
+        if cached is not None:
+            return cached
+    query = keyset_filter(after=after)
+    if match:
+        query = {"$and": [match, query]}
+    newer = await db.messages.find(query, {"_id": 0, "timestamp": 1, "id": 1}).limit(1).to_list(1)
+    return bool(newer)
+
+@api_router.get("/messages", response_model=List[Message])
+async def get_messages(response: Response, limit: int = 50, user_id: Optional[str] = None, before: Optional[str] = None,
+                       after: Optional[str] = None, since: Optional[str] = None):
+    """Chat page, oldest first. `before` scrolls back through history; `after` (alias `since`) polls for
+    newer messages and answers 304 when there are none. Cursors for the next calls are returned in the
+    X-Before-Cursor / X-After-Cursor headers."""
+    # TRIAL SYSTEM: Check user access for chat viewing
+    if user_id:
+        await ensure_chat_access(user_id)
+    
+    after = after or since
+    before_key = parse_message_cursor(before) if before else None
+    after_key = parse_message_cursor(after) if after else None
+    if after_key and not await has_messages_after(after_key):
+        return Response(status_code=304, headers={"X-After-Cursor": after})
+    
+    messages = await load_message_page(limit, before_key, after_key)
+    if messages:
+        response.headers["X-Before-Cursor"] = cursor_of(messages[0])
+        response.headers["X-After-Cursor"] = cursor_of(messages[-1])
+    elif after:
+        response.headers["X-After-Cursor"] = after
+    return messages
+
+@api_router.get("/tickers/trending")
+async def get_trending_tickers(response: Response, window: str = "1h", limit: int = 10):
+    """Most-mentioned cashtags over the last 15m, 1h or 24h - served from in-memory counters.
+    Live changes arrive over the WebSocket as trending_delta frames."""
+    if window not in TRENDING_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(TRENDING_WINDOWS)}")
+    response.headers["Cache-Control"] = "public, max-age=5"
+    return {"window": window, "tickers": trending.top(window, max(1, limit))}
+
+@api_router.get("/tickers/{symbol}/messages", response_model=List[Message])
+async def get_ticker_messages(symbol: str, response: Response, limit: int = 50, user_id: Optional[str] = None,
+                              before: Optional[str] = None, after: Optional[str] = None, since: Optional[str] = None):
+    """Conversation about one $TICKER, oldest first, with the same cursors and headers as GET /messages"""
+    if user_id:
+        await ensure_chat_access(user_id)
+    
+    symbol = symbol.upper().lstrip("$")
+    if not re.fullmatch(r"[A-Z]{1,5}", symbol):
+        raise HTTPException(status_code=400, detail="Invalid ticker symbol")
+    limit = max(1, min(limit, 200))
+    
+    after = after or since
+    before_key = parse_message_cursor(before) if before else None
+    after_key = parse_message_cursor(after) if after else None
+    match = {"highlighted_tickers": symbol}
+    # Polling: a limit-1 probe on the (highlighted_tickers, timestamp, id) index decides the 304
+    if after_key and not await has_messages_after(after_key, match):
+        return Response(status_code=304, headers={"X-After-Cursor": after})
+    
+    messages = await load_message_page(limit, before_key, after_key, match=match)
+    if messages:
+        response.headers["X-Before-Cursor"] = cursor_of(messages[0])
+        response.headers["X-After-Cursor"] = cursor_of(messages[-1])
+    elif after:
+        response.headers["X-After-Cursor"] = after
+    return messages
+
+@api_router.get("/messages/search")
+async def search_messages(q: str, user_id: Optional[str] = None, author: Optional[str] = None, ticker: Optional[str] = None,
+                          since: Optional[str] = None, until: Optional[str] = None, sort: str = SORT_RELEVANCE,
+                          cursor: Optional[str] = None, limit: int = 20):
+    """Full-text search of chat messages, optionally by author (username), $ticker and time range.
+    Ranked by relevance (or newest first with sort=newest); pass next_cursor back as `cursor` for more."""
+    if user_id:
+        await ensure_chat_access(user_id)
+    
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Search query is required")
+    if sort not in (SORT_RELEVANCE, SORT_NEWEST):
+        raise HTTPException(status_code=400, detail="sort must be 'relevance' or 'newest'")
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    
+    since_timestamp = parse_message_timestamp(since) if since else None
+    until_timestamp = parse_message_timestamp(until) if until else None
+    if (since and not since_timestamp) or (until and not until_timestamp):
+        raise HTTPException(status_code=400, detail="Invalid time range")
+    ranked_after = before = None
+    if cursor:
+        try:
+            if sort == SORT_NEWEST:
+                before = decode_cursor(cursor)
             else:
-                message['highlighted_tickers'] = []
-            
-            message.setdefault('content_type', 'text')
-            message.setdefault('is_admin', False)
-            message.setdefault('avatar_url', None)
-            message.setdefault('real_name', None)
-            message.setdefault('screen_name', None)
-            message.setdefault('reply_to_id', None)
-            message.setdefault('reply_to', None)
-            message.setdefault('text_content', None)
-            
-            cleaned_messages.append(message)
-        except Exception as e:
-            logger.warning(f"Skipping invalid message: {e}")
-            continue
-    
-    cleaned_messages.reverse()
+                ranked_after = decode_ranked_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    pipeline = build_search_pipeline(q, limit, author=author, ticker=ticker, since=since_timestamp, until=until_timestamp,
+                                     sort=sort, ranked_after=ranked_after, before=before)
+    docs = await db.messages.aggregate(pipeline).to_list(limit + 1)
+    
+    terms = search_terms(q)
+    page = docs[:limit]
+    next_cursor = None
+    if len(docs) > limit:
+        last = page[-1]
+        if sort == SORT_NEWEST:
+            next_cursor = encode_cursor(last["timestamp"], last["id"])
+        else:
+            next_cursor = encode_ranked_cursor(last["score"], last["timestamp"], last["id"])
     
-    try:
-        return [Message(**message) for message in cleaned_messages]
-    except Exception as e:
-        logger.error(f"Error creating Message objects: {e}")
-        return []
+    results = []
+    for doc in page:
+        score = doc.pop("score", 0.0)
+        message = build_cached_message(doc)
+        if message is None:
+            continue
+        snippet, highlights = make_snippet(message.content, terms)
+        results.append({"message": message, "score": round(score, 4), "snippet": snippet, "highlights": highlights})
+    return {"results": results, "next_cursor": next_cursor}
 
 @api_router.get("/messages/{message_id}/image")
 async def get_message_image(message_id: str):
@@ -4573,56 +4871,78 @@ async def get_message_image(message_id: str):
         raise HTTPException(status_code=400, detail="Not an image message")
     return {"image_url": message.get("content", "")}
 
+@api_router.get("/blobs/{sha256}")
+async def get_blob(sha256: str, request: Request):
+    """Raw image bytes by content hash - immutable, so cached forever and revalidated by ETag"""
+    blob = await blob_store.stat(sha256)
+    if not blob:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    
+    etag = f'"{sha256}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+        # Blobs are never documents: no sniffing into HTML, no scripts or subresources if opened directly
+        "X-Content-Type-Options": "nosniff",
+        "Content-Security-Policy": "default-src 'none'",
+    }
+    media_type = blob.get("content_type")
+    if media_type not in BLOB_INLINE_TYPES:
+        media_type = "application/octet-stream"
+        headers["Content-Disposition"] = f'attachment; filename="{sha256}"'
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in if_none_match or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    
+    size = blob["size"]
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    # If-Range with a different validator means the client's partial copy is stale
+    if_range = request.headers.get("if-range")
+    if byte_range and if_range and if_range != etag:
+        byte_range = None
+    
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        blob_store.iter_range(sha256, start, end),
+        status_code=206 if byte_range else 200,
+        media_type=media_type,
+        headers=headers
+    )
+
+@api_router.post("/admin/migrate-inline-images")
+async def migrate_inline_images_endpoint(admin_id: str, batch_size: int = 100):
+    """Move base64 images still stored inside messages into the blob store - admin only, safe to re-run"""
+    admin = await db.users.find_one({"id": admin_id})
+    if not admin or not admin.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    stats = await migrate_inline_images(db, blob_store, batch_size)
+    # Cached listings were built from the inline content
+    await message_cache.load()
+    logger.info(f"🖼️ Inline image migration by {admin.get('username')}: {stats}")
+    return stats
+
 @api_router.get("/messages/welcome", response_model=List[Message])
 async def get_welcome_messages(user_id: Optional[str] = None):
     """Get recent message history for new users to provide context"""
     # TRIAL SYSTEM: Check user access for chat viewing
     if user_id:
-        user = await db.users.find_one({"id": user_id})
-        if user and user.get("status") == UserStatus.TRIAL_EXPIRED:
-            raise HTTPException(
-                status_code=403, 
-                detail="Chat viewing restricted. Your trial has expired. Upgrade your account to view trader discussions."
-            )
-    
-    # Get last 500 messages to provide good historical context for new users
-    messages = await db.messages.find().sort("timestamp", -1).limit(500).to_list(500)
-    
-    # Clean up messages for compatibility (same logic as regular get_messages)
-    cleaned_messages = []
-    for message in messages:
-        try:
-            # Fix highlighted_tickers format for compatibility
-            if 'highlighted_tickers' in message:
-                tickers = message['highlighted_tickers']
-                if isinstance(tickers, list) and tickers:
-                    if isinstance(tickers[0], dict):
-                        message['highlighted_tickers'] = [ticker.get('symbol', '') for ticker in tickers if isinstance(ticker, dict) and 'symbol' in ticker]
-                    elif not isinstance(tickers[0], str):
-                        message['highlighted_tickers'] = []
-                else:
-                    message['highlighted_tickers'] = []
-            else:
-                message['highlighted_tickers'] = []
-            
-            # Ensure all required fields exist with defaults
-            message.setdefault('content_type', 'text')
-            message.setdefault('avatar_url', None)
-            message.setdefault('is_admin', False)
-            message.setdefault('screen_name', message.get('username', 'Unknown'))
-            
-            # Ensure reply_to exists
-            message.setdefault('reply_to', None)
-            
-            cleaned_messages.append(Message(**message))
-            
-        except ValidationError as e:
-            logger.error(f"Validation error for message {message.get('id', 'unknown')}: {e}")
-            continue
-        except Exception as e:
-            logger.error(f"Error processing message {message.get('id', 'unknown')}: {e}")
-            continue
-    
+        await ensure_chat_access(user_id)
+    
+    # Last 500 messages to provide good historical context for new users (normally from memory).
+    # Image messages carry the lazy-load placeholder like GET /messages.
+    cleaned_messages = [
+        # Welcome history has always shown the username when there is no screen name
+        message if message.screen_name is not None else message.copy(update={"screen_name": message.username or "Unknown"})
+        for message in await load_message_page(500)
+    ]
     logger.info(f"📚 NEW USER WELCOME: Loaded {len(cleaned_messages)} historical messages")
     return cleaned_messages
 
@@ -4974,6 +5294,8 @@ async def update_user_profile(user_id: str, profile_data: ProfileUpdate):
     
     # Get updated user
     updated_user = await db.users.find_one({"id": user_id})
+    presence.refresh_profile(user_id, updated_user)
+    user_directory.upsert(updated_user)
     return User(**updated_user)
 
 @api_router.post("/upload-video")
@@ -0,0 +1,70 @@
+"""Server-Sent Events transport for clients that cannot hold a WebSocket"""
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
+from event_stream import frame_seq
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Comment line sent when idle so proxies keep the response open
+SSE_KEEPALIVE_INTERVAL = 15
+# Browsers wait this long before reconnecting a dropped EventSource
+SSE_RETRY_MS = 3000
+
+
+def format_sse(frame: str) -> str:
+    """One SSE event; sequenced chat events carry their seq as the event id for Last-Event-ID resume"""
+    seq = frame_seq(frame)
+    prefix = f"id: {seq}\n" if seq is not None else ""
+    return f"{prefix}data: {frame}\n\n"
+
+
+class SSEChannel:
+    """Stands in for a WebSocket so the ConnectionManager can deliver to an SSE response.
+
+    The ClientConnection writer calls send_text(); each frame waits in a
+    one-slot hand-off until the response generator picks it up, so a stalled
+    HTTP client backs up into the connection's bounded queue exactly like a
+    slow WebSocket (and is dropped by the same slow-consumer policy).
+    """
+
+    # No inbound side to answer pings; a gone client cancels the response instead
+    pingable = False
+
+    def __init__(self):
+        self._frames: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame: str):
+        if self.closed:
+            raise RuntimeError("SSE stream closed")
+        await self._frames.put(frame)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        if self.closed:
+            return
+        self.closed = True
+        # Wake the generator so the response ends
+        try:
+            self._frames.put_nowait(None)
+        except asyncio.QueueFull:
+            self._frames.get_nowait()
+            self._frames.put_nowait(None)
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Body of the text/event-stream response"""
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        while True:
+            try:
+                frame: Optional[str] = await asyncio.wait_for(self._frames.get(), SSE_KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if frame is None:
+                return
+            yield format_sse(frame)
@@ -0,0 +1,75 @@
+"""
+Unit tests for the cross-worker WebSocket backplane (no server or database needed)
+Tests for:
+1. In-process backplane between two connection managers
+2. Broker backplane over a Unix socket
+"""
+import asyncio
+import os
+import tempfile
+
+from backplane import InProcessBackplane, BrokerBackplane, BackplaneBroker
+from websocket_manager import ConnectionManager
+from test_websocket_manager import FakeWebSocket
+
+
+class TestInProcessBackplane:
+    """Managers sharing one in-process backplane behave like two workers"""
+
+    def test_broadcast_and_user_frames_cross_nodes(self):
+        async def scenario():
+            backplane = InProcessBackplane()
+            worker_a, worker_b = ConnectionManager(backplane), ConnectionManager(backplane)
+            on_a, on_b = FakeWebSocket(), FakeWebSocket()
+            await worker_a.connect(on_a, {"id": "alice"})
+            await worker_b.connect(on_b, {"id": "bob", "is_admin": True})
+            await worker_a.broadcast("hello")
+            worker_a.send_to_user("bob", "direct")
+            await worker_a.send_admin_notification("admins-only")
+            await asyncio.sleep(0.05)
+            await worker_a.close_all()
+            await worker_b.close_all()
+            return on_a, on_b
+
+        on_a, on_b = asyncio.run(scenario())
+        assert on_a.sent == ["hello"]
+        assert on_b.sent == ["hello", "direct", "admins-only"]
+        print("✅ Frames published on worker A reached sockets on worker B")
+
+
+class TestBrokerBackplane:
+    """Workers relaying through a local Unix-socket broker"""
+
+    def test_broadcast_through_unix_broker(self):
+        async def scenario():
+            path = os.path.join(tempfile.mkdtemp(), "backplane.sock")
+            url = f"unix://{path}"
+            broker = BackplaneBroker(url)
+            await broker.start()
+            worker_a = ConnectionManager(BrokerBackplane(url))
+            worker_b = ConnectionManager(BrokerBackplane(url))
+            await worker_a.start()
+            await worker_b.start()
+            for _ in range(50):
+                if len(broker.clients) == 2:
+                    break
+                await asyncio.sleep(0.02)
+            socket_b = FakeWebSocket()
+            await worker_b.connect(socket_b, {"id": "bob"})
+            await worker_a.broadcast("over-the-wire")
+            await worker_a.send_session_invalidation("bob", "new-session")
+            for _ in range(50):
+                if len(socket_b.sent) == 2:
+                    break
+                await asyncio.sleep(0.02)
+            stats = worker_a.get_stats()["backplane"]
+            await worker_a.close_all()
+            await worker_b.close_all()
+            await broker.stop()
+            return socket_b, stats
+
+        socket_b, stats = asyncio.run(scenario())
+        assert socket_b.sent[0] == "over-the-wire"
+        assert "session_invalidated" in socket_b.sent[1]
+        assert stats["connected"] and stats["published"] == 2
+        print("✅ Broadcast and session invalidation crossed the broker")
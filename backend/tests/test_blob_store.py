@@ -0,0 +1,172 @@
+"""
+Unit tests for the content-addressed image blob store (local backend, no database needed)
+Tests for:
+1. Identical bytes stored once under their SHA-256
+2. Range header parsing for partial responses
+3. Inline data URL migration stores sniffed image types only
+4. Blobs served with safe headers
+"""
+import io
+import asyncio
+import base64
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+from starlette.requests import Request
+
+import server
+
+from blob_store import BlobStore, LocalBlobStore, blob_sha_from_url, blob_url, decode_data_url, migrate_inline_images, parse_range
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if isinstance(condition, dict):
+            if "$regex" in condition and not str(doc.get(field, "")).startswith(condition["$regex"].lstrip("^")):
+                return False
+            if "$nin" in condition and doc.get(field) in condition["$nin"]:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length):
+        return self.docs
+
+
+class FakeCollection:
+    def __init__(self, docs=None):
+        self.docs = docs or []
+
+    async def find_one(self, query, projection=None):
+        return next((doc for doc in self.docs if matches(doc, query)), None)
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(doc) for doc in self.docs if matches(doc, query)])
+
+    async def update_one(self, query, update, upsert=False):
+        doc = await self.find_one(query)
+        if doc is None:
+            if not upsert:
+                return
+            doc = dict(query)
+            self.docs.append(doc)
+            doc.update(update.get("$setOnInsert", {}))
+        doc.update(update.get("$set", {}))
+
+
+def encoded(format):
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), (10, 20, 30)).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def data_url(content_type, data):
+    return f"data:{content_type};base64," + base64.b64encode(data).decode()
+
+
+async def read_all(store, sha256, start, end):
+    return b"".join([chunk async for chunk in store.iter_range(sha256, start, end)])
+
+
+class TestBlobStore:
+    """Images kept once, outside the message documents"""
+
+    def test_put_dedups_and_reads_ranges(self, tmp_path):
+        db = SimpleNamespace(blobs=FakeCollection())
+        store = LocalBlobStore(db, str(tmp_path))
+        data = bytes(range(256)) * 10
+
+        async def run():
+            first = await store.put(data, "image/png")
+            second = await store.put(data, "image/png")
+            return first, second, await read_all(store, first, 0, len(data) - 1), await read_all(store, first, 100, 199)
+
+        first, second, whole, part = asyncio.run(run())
+        assert first == second == hashlib.sha256(data).hexdigest()
+        assert len(db.blobs.docs) == 1 and db.blobs.docs[0]["size"] == len(data)
+        assert whole == data and part == data[100:200]
+        assert blob_sha_from_url(blob_url(first)) == first
+        assert blob_sha_from_url("/api/blobs/../../etc/passwd") is None
+        print("✅ Duplicate uploads share one blob and ranges read the right bytes")
+
+    def test_parse_range(self):
+        assert parse_range(None, 1000) is None
+        assert parse_range("bytes=0-99", 1000) == (0, 99)
+        assert parse_range("bytes=900-", 1000) == (900, 999)
+        assert parse_range("bytes=-100", 1000) == (900, 999)
+        assert parse_range("bytes=500-5000", 1000) == (500, 999)
+        assert parse_range("bytes=0-1,5-6", 1000) is None
+        for header in ("bytes=1000-", "bytes=5-1", "bytes=x-y"):
+            with pytest.raises(ValueError):
+                parse_range(header, 1000)
+        print("✅ Single ranges parsed, unsatisfiable ones rejected")
+
+    def test_migrate_inline_images(self, tmp_path):
+        png, jpeg = encoded("PNG"), encoded("JPEG")
+        html = b"<script>alert(document.cookie)</script>"
+        messages = FakeCollection([
+            {"id": "m1", "content_type": "image", "content": data_url("image/png", png)},
+            {"id": "m2", "content_type": "image", "content": data_url("image/png", png)},
+            {"id": "m3", "content_type": "image", "content": "data:broken"},
+            {"id": "m4", "content_type": "text", "content": "data: not an image"},
+            {"id": "m5", "content_type": "image", "content": data_url("text/html", html)},
+            {"id": "m6", "content_type": "image", "content": data_url("image/png", html)},
+            {"id": "m7", "content_type": "image", "content": data_url("image/gif", jpeg)},
+        ])
+        db = SimpleNamespace(blobs=FakeCollection(), messages=messages)
+        store = LocalBlobStore(db, str(tmp_path))
+
+        stats = asyncio.run(migrate_inline_images(db, store, batch_size=1))
+        sha256 = hashlib.sha256(png).hexdigest()
+        assert stats["migrated"] == 3 and stats["failed"] == 3
+        assert [doc["content"] for doc in messages.docs[:2]] == [blob_url(sha256)] * 2
+        assert messages.docs[2]["content"] == "data:broken"
+        # HTML never reaches the store, whatever type it declares
+        assert [doc["content"].startswith("data:") for doc in messages.docs[4:6]] == [True, True]
+        # Stored under the type the bytes really are
+        assert {doc["_id"]: doc["content_type"] for doc in db.blobs.docs} == {
+            sha256: "image/png", hashlib.sha256(jpeg).hexdigest(): "image/jpeg"}
+        assert decode_data_url(data_url("image/png", png)) == (png, "image/png")
+        print("✅ Inline images moved to the store under their sniffed type, the rest left in place")
+
+    def test_served_headers(self, tmp_path, monkeypatch):
+        db = SimpleNamespace(blobs=FakeCollection())
+        store = LocalBlobStore(db, str(tmp_path))
+        monkeypatch.setattr(server, "blob_store", store)
+        png = encoded("PNG")
+
+        async def run():
+            image = await store.put(png, "image/png")
+            legacy = await store.put(b"<html></html>", "text/html")  # Stored before types were sniffed
+            request = Request({"type": "http", "method": "GET", "headers": []})
+            return await server.get_blob(image, request), await server.get_blob(legacy, request)
+
+        image, legacy = asyncio.run(run())
+        for response in (image, legacy):
+            assert response.headers["x-content-type-options"] == "nosniff"
+            assert response.headers["content-security-policy"] == "default-src 'none'"
+        assert image.media_type == "image/png" and "content-disposition" not in image.headers
+        assert legacy.media_type == "application/octet-stream"
+        assert legacy.headers["content-disposition"].startswith("attachment")
+        print("✅ Only allowed image types served inline, always with nosniff and a locked-down CSP")
+
+    def test_incomplete_backend_rejected(self):
+        class WriteOnlyBlobStore(BlobStore):
+            async def _write(self, sha256, data):
+                pass
+
+        with pytest.raises(TypeError):
+            WriteOnlyBlobStore(SimpleNamespace())
+        print("✅ Backends missing byte I/O fail at construction")
@@ -0,0 +1,86 @@
+"""
+Unit tests for the sequenced event stream (no server or database needed)
+Tests for:
+1. Global sequence numbers on broadcast events
+2. Exact replay of missed events on resume
+3. Fallback signal when the gap is older than the buffer
+"""
+import json
+import asyncio
+
+from backplane import InProcessBackplane
+from event_stream import EventStream
+from websocket_manager import ConnectionManager
+from test_websocket_manager import FakeWebSocket
+
+
+class FakeCounters:
+    """Atomic counter shared by every worker, like db.counters"""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"], "seq": 0})
+        doc["seq"] += update["$inc"]["seq"]
+        return dict(doc)
+
+    async def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+
+class FakeDB:
+    def __init__(self, counters=None):
+        self.counters = counters or FakeCounters()
+
+
+class TestEventStream:
+    """Sequencing and replay"""
+
+    def test_resume_replays_exactly_the_missed_events(self):
+        async def scenario():
+            backplane = InProcessBackplane()
+            counters = FakeCounters()
+            manager_a, manager_b = ConnectionManager(backplane), ConnectionManager(backplane)
+            stream_a, stream_b = EventStream(FakeDB(counters), manager_a), EventStream(FakeDB(counters), manager_b)
+            await stream_a.start()
+            await stream_b.start()
+            socket = FakeWebSocket()
+            connection = await manager_a.connect(socket, {"id": "reader"})
+            await stream_a.publish("message", {"id": "m1"})
+            await stream_b.publish("message", {"id": "m2"})
+            await asyncio.sleep(0.01)
+            received = [json.loads(frame) for frame in socket.sent]
+            manager_a.disconnect(connection)
+            # Published on the other worker while the reader was away
+            await stream_b.publish("message", {"id": "m3"})
+            await stream_b.publish("message_deleted", {"id": "m1"})
+            missed = stream_b.replay(received[-1]["seq"])
+            await manager_a.close_all()
+            await manager_b.close_all()
+            return received, [json.loads(frame.text) for frame in missed]
+
+        received, missed = asyncio.run(scenario())
+        assert [event["seq"] for event in received] == [1, 2]
+        assert [(event["seq"], event["type"], event["data"]["id"]) for event in missed] == [
+            (3, "message", "m3"), (4, "message_deleted", "m1")
+        ]
+        print("✅ Missed events replayed in order from another worker's buffer")
+
+    def test_gap_older_than_buffer_needs_db(self):
+        async def scenario():
+            stream = EventStream(FakeDB(), ConnectionManager(), size=5)
+            for index in range(12):
+                await stream.publish("message", {"id": f"m{index}"})
+            return stream
+
+        stream = asyncio.run(scenario())
+        assert stream.replay(2) is None
+        assert len(stream.replay(7)) == 5
+        assert stream.replay(12) == []
+        # Out-of-order arrival from another worker keeps the buffer sorted
+        stream._remember(13, "b", ["chat:global"])
+        stream._remember(15, "d", ["chat:global"])
+        stream._remember(14, "c", ["chat:global"])
+        assert stream.replay(12)[-3:] == ["b", "c", "d"]
+        print("✅ Old gaps fall back to the DB, buffer stays ordered")
@@ -0,0 +1,121 @@
+"""
+Unit tests for the FCM dispatcher against the local transport (no Firebase project needed)
+Tests for:
+1. Multicasts split into 500-token chunks, per-token results parsed
+2. Dead tokens handed to the pruner - only those FCM reports per token
+3. Blocking sends kept off the event loop
+"""
+import asyncio
+import time
+
+from firebase_admin import exceptions
+
+from fcm_service import FCMService, LocalTransport, stringify_data
+
+
+class RecordingTransport(LocalTransport):
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.chunk_sizes = []
+
+    def send_each_for_multicast(self, message):
+        self.chunk_sizes.append(len(message.tokens))
+        return super().send_each_for_multicast(message)
+
+
+class FailingChunkTransport(LocalTransport):
+    """Rejects whole requests that contain a poisoned token, as FCM does for a bad payload"""
+
+    def __init__(self, error):
+        super().__init__(latency=0.0)
+        self.error = error
+
+    def send_each_for_multicast(self, message):
+        if "poison" in message.tokens:
+            raise self.error
+        return super().send_each_for_multicast(message)
+
+
+def service_with_pruner(transport):
+    service = FCMService(transport=transport, max_workers=4)
+    pruned = []
+
+    async def pruner(tokens):
+        pruned.extend(tokens)
+
+    service.set_token_pruner(pruner)
+    return service, pruned
+
+
+class TestFCMService:
+    """Push notifications without stalling the event loop"""
+
+    def test_chunked_multicast_and_pruning(self):
+        transport = RecordingTransport()
+        service, pruned = service_with_pruner(transport)
+        tokens = [f"token-{index}" for index in range(1100)] + ["invalid-a", "invalid-b", "token-0"]
+
+        result = asyncio.run(service.send_to_multiple(tokens, "Title", "Body", {"message_id": "m1", "count": 3, "avatar": None}))
+        assert sorted(transport.chunk_sizes) == [102, 500, 500]  # Duplicate token sent once
+        assert result["success_count"] == 1100 and result["failure_count"] == 2
+        assert result["invalid_tokens"] == ["invalid-a", "invalid-b"] and "error" not in result
+        assert pruned == ["invalid-a", "invalid-b"]
+        service.shutdown()
+        print("✅ Chunked multicast with dead tokens pruned")
+
+    def test_failed_chunk_not_pruned(self):
+        error = exceptions.InvalidArgumentError("The registration token is not a valid FCM registration token")
+        service, pruned = service_with_pruner(FailingChunkTransport(error))
+        tokens = ["poison"] + [f"token-{index}" for index in range(499)] + ["token-500", "invalid-a"]
+
+        result = asyncio.run(service.send_to_multiple(tokens, "Title", "Body"))
+        assert result["success_count"] == 1 and result["failure_count"] == 501
+        # The 500 tokens of the rejected request are kept; only the per-token verdict is pruned
+        assert pruned == ["invalid-a"] and result["invalid_tokens"] == ["invalid-a"]
+        service.shutdown()
+
+        # A 404 for the whole request is a real failure...
+        not_found = exceptions.NotFoundError("404 Not Found")
+        service, pruned = service_with_pruner(FailingChunkTransport(not_found))
+        result = asyncio.run(service.send_to_multiple(["poison", "token-1"], "Title", "Body"))
+        assert result["success_count"] == 0 and result["failure_count"] == 2 and pruned == []
+        service.shutdown()
+
+        # ...unless FCM_TEST_MODE says it is a test project: reported as sent, never counted as sent
+        service = FCMService(transport=FailingChunkTransport(not_found), max_workers=1, test_mode=True)
+        result = asyncio.run(service.send_to_multiple(["poison", "token-1"], "Title", "Body"))
+        assert result["success_count"] == 2 and result["failure_count"] == 0
+        assert service.get_stats()["sent"] == 0 and service.get_stats()["simulated"] == 2
+        service.shutdown()
+        print("✅ Whole-request failures prune nothing")
+
+    def test_single_send(self):
+        service, pruned = service_with_pruner(LocalTransport(latency=0.0))
+        assert asyncio.run(service.send_notification("token-1", "Title", "Body")) is True
+        assert asyncio.run(service.send_notification("invalid-1", "Title", "Body")) is False
+        assert pruned == ["invalid-1"]
+        assert stringify_data({"a": "x", "b": 2, "c": None, "d": {"k": 1}}) == {"a": "x", "b": "2", "d": '{"k": 1}'}
+        service.shutdown()
+        print("✅ Single sends report and prune dead tokens")
+
+    def test_off_event_loop(self):
+        service = FCMService(transport=LocalTransport(latency=0.1), max_workers=4)
+        lag = []
+
+        async def run():
+            async def ticker():
+                for _ in range(10):
+                    started = time.perf_counter()
+                    await asyncio.sleep(0.01)
+                    lag.append(time.perf_counter() - started)
+
+            tick = asyncio.create_task(ticker())
+            await asyncio.gather(*(service.send_to_multiple([f"token-{index}"], "t", "b") for index in range(4)))
+            await tick
+
+        started = time.perf_counter()
+        asyncio.run(run())
+        assert time.perf_counter() - started < 0.35  # Four 100 ms sends in parallel
+        assert max(lag) < 0.08  # Timers kept firing while the sends blocked their threads
+        service.shutdown()
+        print("✅ Blocking Firebase calls run on the thread pool")
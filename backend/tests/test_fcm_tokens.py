@@ -0,0 +1,146 @@
+"""
+Unit tests for the FCM device token registry (no server or database needed)
+Tests for:
+1. Several devices per user, rotation and account switches
+2. Dead tokens and deleted users dropped from the cache
+3. Loading from db.fcm_tokens
+"""
+import asyncio
+
+from pymongo.errors import DuplicateKeyError
+
+from fcm_tokens import FCMTokenRegistry
+
+
+class FakeManager:
+    def __init__(self):
+        self.handlers = {}
+
+    def register_handler(self, op, handler):
+        self.handlers[op] = handler
+
+    def publish(self, envelope):
+        return self.handlers[envelope["op"]](envelope)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+
+class FakeResult:
+    def __init__(self, deleted_count):
+        self.deleted_count = deleted_count
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            if "$ne" in condition and value == condition["$ne"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeTokens:
+    """Just enough of a collection for the registry's writes"""
+
+    def __init__(self, docs=()):
+        self.docs = [dict(doc) for doc in docs]
+        self.upsert_conflicts = 0
+
+    async def find_one_and_delete(self, query, projection=None):
+        for doc in self.docs:
+            if matches(doc, query):
+                self.docs.remove(doc)
+                return doc
+        return None
+
+    async def update_one(self, query, update, upsert=False):
+        if self.upsert_conflicts:
+            self.upsert_conflicts -= 1
+            raise DuplicateKeyError("E11000 duplicate key error")
+        for doc in self.docs:
+            if matches(doc, query):
+                doc.update(update["$set"])
+                return
+        self.docs.append({**query, **update["$set"], **update["$setOnInsert"]})
+
+    async def delete_many(self, query):
+        kept = [doc for doc in self.docs if not matches(doc, query)]
+        deleted = len(self.docs) - len(kept)
+        self.docs = kept
+        return FakeResult(deleted)
+
+    def find(self, query, projection=None):
+        return FakeCursor(self.docs)
+
+
+def make_registry(docs=()):
+    db = type("DB", (), {"fcm_tokens": FakeTokens(docs)})()
+    return FCMTokenRegistry(db, FakeManager())
+
+
+class TestFCMTokenRegistry:
+    """Every device gets its pushes, resolved from memory"""
+
+    def test_devices(self):
+        registry = make_registry()
+
+        async def run():
+            await registry.register("u1", "phone-1", device_id="phone")
+            await registry.register("u1", "laptop-1", device_id="laptop")
+            await registry.register("u1", "phone-2", device_id="phone")  # Rotated token replaces the old one
+            await registry.register("u2", "tablet-1")  # Client without a device id
+            await registry.register("u2", "laptop-1", device_id="laptop")  # Laptop now signed in as u2
+
+        asyncio.run(run())
+        assert sorted(registry.tokens_for("u1")) == ["phone-2"]
+        assert sorted(registry.tokens_for("u2")) == ["laptop-1", "tablet-1"]
+        assert sorted(doc["token"] for doc in registry.db.fcm_tokens.docs) == ["laptop-1", "phone-2", "tablet-1"]
+        assert sorted(registry.tokens_for_users(["u1", "u2", "nobody"])) == ["laptop-1", "phone-2", "tablet-1"]
+        print("✅ One token per device, moved on rotation and account switch")
+
+    def test_rotation_retried(self):
+        registry = make_registry()
+
+        async def run():
+            await registry.register("u1", "phone-1", device_id="phone")
+            # The rotation's first upsert loses a race after the old token was already deleted
+            registry.db.fcm_tokens.upsert_conflicts = 1
+            await registry.register("u1", "phone-2", device_id="phone")
+
+        asyncio.run(run())
+        assert registry.tokens_for("u1") == ["phone-2"]
+        assert [doc["token"] for doc in registry.db.fcm_tokens.docs] == ["phone-2"]
+        print("✅ Token rotated out on the first attempt still leaves every cache")
+
+    def test_removals(self):
+        registry = make_registry()
+
+        async def run():
+            await registry.register("u1", "a", device_id="d1")
+            await registry.register("u1", "b", device_id="d2")
+            await registry.register("u2", "c")
+            await registry.remove_tokens(["a", "unknown"])
+            assert registry.tokens_for("u1") == ["b"]
+            assert await registry.remove_user("u1") == 1
+
+        asyncio.run(run())
+        assert registry.tokens_for("u1") == [] and registry.count == 1
+        assert [doc["token"] for doc in registry.db.fcm_tokens.docs] == ["c"]
+        print("✅ Dead tokens and deleted users dropped")
+
+    def test_load(self):
+        registry = make_registry([{"user_id": "u1", "token": "a"}, {"user_id": "u1", "token": "b"}, {"user_id": "u2"}])
+        asyncio.run(registry.load())
+        assert registry.loaded and sorted(registry.tokens_for("u1")) == ["a", "b"]
+        assert registry.get_stats() == {"loaded": True, "devices": 2, "users": 1}
+        print("✅ Registry loaded from db.fcm_tokens")
@@ -0,0 +1,50 @@
+"""
+Unit tests for encode-once frames (no server or database needed)
+Tests for:
+1. Each encoding is produced once per frame and round-trips
+2. Binary clients receive bytes, text clients the same JSON
+"""
+import zlib
+import asyncio
+from datetime import datetime
+
+import msgpack
+
+from frames import Frame, loads, negotiate_encoding
+from websocket_manager import ConnectionManager
+from test_websocket_manager import FakeWebSocket
+
+
+class TestFrameEncoding:
+    """Serialization happens once and handles datetimes natively"""
+
+    def test_encodings_cached_and_round_trip(self):
+        stamp = datetime(2024, 5, 1, 14, 30, 0, 123456)
+        frame = Frame({"seq": 7, "type": "message", "data": {"id": "m1", "timestamp": stamp}})
+        assert frame.text.startswith('{"seq":7,')
+        assert loads(frame.text)["data"]["timestamp"] == "2024-05-01T14:30:00.123456"
+        packed = frame.encode("msgpack")
+        assert frame.encode("msgpack") is packed
+        assert msgpack.unpackb(packed)["data"]["timestamp"] == "2024-05-01T14:30:00.123456"
+        assert loads(zlib.decompress(frame.encode("json+deflate")).decode()) == loads(frame.text)
+        assert negotiate_encoding("MSGPACK+deflate") == "msgpack+deflate"
+        assert negotiate_encoding("xml") == "json"
+        print("✅ Frames encoded once per encoding, datetimes as ISO 8601")
+
+    def test_mixed_encodings_in_one_broadcast(self):
+        async def scenario():
+            manager = ConnectionManager()
+            text_socket, binary_socket = FakeWebSocket(), FakeWebSocket()
+            await manager.connect(text_socket, {"id": "browser"})
+            await manager.connect(binary_socket, {"id": "bot"}, encoding="msgpack")
+            frame = Frame({"type": "message", "data": {"id": "m1"}})
+            await manager.broadcast(frame)
+            await manager.broadcast('{"type": "legacy"}')
+            await asyncio.sleep(0.05)
+            await manager.close_all()
+            return text_socket.sent, binary_socket.sent
+
+        text_sent, binary_sent = asyncio.run(scenario())
+        assert text_sent == ['{"type":"message","data":{"id":"m1"}}', '{"type": "legacy"}']
+        assert [msgpack.unpackb(data)["type"] for data in binary_sent] == ["message", "legacy"]
+        print("✅ Text and binary subscribers served from the same frames")
@@ -0,0 +1,109 @@
+"""
+Unit tests for the chat image pipeline (no server or database needed)
+Tests for:
+1. Real format sniffed, metadata stripped (animated originals too), orientation applied
+2. Thumbnail and display variants bounded and WebP
+3. Bad input rejected, processing runs in the pool
+"""
+import io
+import asyncio
+
+import pytest
+from PIL import Image
+
+import image_pipeline
+from image_pipeline import ImagePipeline, process_image
+
+
+def make_image(width, height, format="JPEG", orientation=None):
+    image = Image.new("RGB", (width, height), (200, 40, 40))
+    exif = Image.Exif()
+    exif[0x0110] = "Test Phone"  # Model
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    if format == "JPEG":
+        image.save(buffer, format=format, exif=exif)
+    else:
+        image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+class TestImagePipeline:
+    """Uploads validated and resized before they reach the chat"""
+
+    def test_variants_and_metadata(self):
+        # Orientation 6: stored landscape, displayed portrait
+        result = process_image(make_image(2000, 1000, orientation=6))
+        assert result["format"] == "jpeg"
+        assert (result["width"], result["height"]) == (1000, 2000)
+
+        original, original_type = result["variants"]["original"]
+        assert original_type == "image/jpeg"
+        assert not Image.open(io.BytesIO(original)).getexif()
+
+        display = Image.open(io.BytesIO(result["variants"]["display"][0]))
+        thumbnail = Image.open(io.BytesIO(result["variants"]["thumbnail"][0]))
+        assert display.format == thumbnail.format == "WEBP"
+        assert display.size == (640, 1280)
+        assert thumbnail.size == (160, 320) and result["thumbnail_size"] == [160, 320]
+        print("✅ EXIF stripped, rotation applied, variants bounded")
+
+    def test_sniffs_real_format(self):
+        # A PNG is stored as a PNG whatever the data URL claimed
+        result = process_image(make_image(100, 50, format="PNG"))
+        assert result["variants"]["original"][1] == "image/png"
+        assert result["thumbnail_size"] == [100, 50]
+        print("✅ Content type comes from the bytes")
+
+    @pytest.mark.parametrize("format", ["GIF", "WEBP"])
+    def test_animated_original_stripped(self, format):
+        frames = [Image.new("RGB", (40, 30), color) for color in [(255, 0, 0), (0, 255, 0), (0, 0, 255)]]
+        exif = Image.Exif()
+        exif[0x0110] = "Test Phone"  # Model
+        buffer = io.BytesIO()
+        options = {"comment": b"Test Phone"} if format == "GIF" else {"exif": exif, "xmp": b"<x:xmpmeta>Test Phone</x:xmpmeta>"}
+        frames[0].save(buffer, format=format, save_all=True, append_images=frames[1:], duration=[50, 60, 70], loop=3, **options)
+        upload = buffer.getvalue()
+        assert b"Test Phone" in upload
+
+        original, _ = process_image(upload)["variants"]["original"]
+        assert b"Test Phone" not in original
+        stored = Image.open(io.BytesIO(original))
+        assert stored.format == format and stored.n_frames == 3 and not stored.getexif()
+        assert "comment" not in stored.info and "xmp" not in stored.info and stored.info["loop"] == 3
+        durations = []
+        for index in range(stored.n_frames):
+            stored.seek(index)
+            stored.load()
+            durations.append(stored.info["duration"])
+        assert durations == [50, 60, 70]
+        print(f"✅ Animated {format} re-encoded with its timing and without metadata")
+
+    def test_rejects_bad_input(self, monkeypatch):
+        with pytest.raises(ValueError):
+            process_image(b"<svg xmlns='http://www.w3.org/2000/svg'/>")
+        with pytest.raises(ValueError):
+            process_image(make_image(100, 100, format="BMP"))
+        monkeypatch.setattr(image_pipeline, "IMAGE_MAX_PIXELS", 100 * 100 - 1)
+        with pytest.raises(ValueError):
+            process_image(make_image(100, 100))
+        print("✅ Non-images, unsupported formats and oversized images rejected")
+
+    def test_process_pool(self):
+        pipeline = ImagePipeline(workers=1)
+
+        async def run():
+            result = await pipeline.process(make_image(400, 300))
+            with pytest.raises(ValueError):
+                await pipeline.process(b"not an image")
+            return result
+
+        try:
+            result = asyncio.run(run())
+        finally:
+            pipeline.shutdown()
+        assert result["thumbnail_size"] == [320, 240]
+        stats = pipeline.get_stats()
+        assert stats["processed"] == 1 and stats["rejected"] == 1
+        print("✅ Images processed in worker processes")
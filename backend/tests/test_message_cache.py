@@ -0,0 +1,107 @@
+"""
+Unit tests for the recent-message cache (no server or database needed)
+Tests for:
+1. Pages served from memory, newest last, with image placeholders
+2. Cache kept current by adds and deletions
+3. Deep history falls back to MongoDB
+4. Keyset reads after a cursor for polling
+"""
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from message_cache import RecentMessageCache
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs = sorted(self.docs, key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length):
+        return self.docs
+
+
+class FakeMessages:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = 0
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        return FakeCursor(list(self.docs))
+
+
+class FakeMessage(SimpleNamespace):
+    def copy(self, update):
+        return FakeMessage(**{**self.__dict__, **update})
+
+
+START = datetime(2024, 1, 1, 9, 30)
+
+
+def make_doc(index, content_type="text"):
+    content = "data:image/png;base64,AAAA" if content_type == "image" else f"message {index}"
+    return {"id": f"m{index}", "user_id": f"u{index % 3}", "content": content,
+            "content_type": content_type, "timestamp": START + timedelta(seconds=index)}
+
+
+class TestRecentMessageCache:
+    """Hot reads without DB round trips"""
+
+    def test_pages_from_memory_and_updates(self):
+        docs = [make_doc(index) for index in range(20)]
+        db = SimpleNamespace(messages=FakeMessages(docs))
+        cache = RecentMessageCache(db, lambda doc: FakeMessage(**doc), size=10)
+        asyncio.run(cache.load())
+
+        page = cache.recent(5)
+        assert [message.id for message in page] == ["m15", "m16", "m17", "m18", "m19"]
+        older = cache.recent(5, before=(START + timedelta(seconds=15), "m15"))
+        assert [message.id for message in older] == ["m10", "m11", "m12", "m13", "m14"]
+        assert cache.recent(3, before=(START + timedelta(seconds=11), "m11")) is None  # reaches past the cache
+
+        cache.add(FakeMessage(**make_doc(20)))
+        cache.remove("m19")
+        cache.remove("m18")
+        latest = [message.id for message in cache.recent(3)]
+        assert latest == ["m16", "m17", "m20"]
+        assert "m10" not in cache.ids  # trimmed when m20 arrived
+        assert db.messages.queries == 1
+        print("✅ Recent pages served from memory and kept current")
+
+    def test_image_placeholder_and_complete_collection(self):
+        docs = [make_doc(0), make_doc(1, "image"), make_doc(2)]
+        db = SimpleNamespace(messages=FakeMessages(docs))
+        cache = RecentMessageCache(db, lambda doc: FakeMessage(**doc), size=10)
+        asyncio.run(cache.load())
+        listing = cache.recent(50)
+        full = cache.recent(50, listing=False)
+        assert len(listing) == 3  # whole collection is cached, short pages are still hits
+        assert listing[1].content == "__IMAGE__m1__"
+        assert full[1].content.startswith("data:")
+        print("✅ Image placeholders in listings, full content kept")
+
+    def test_after_cursor(self):
+        docs = [make_doc(index) for index in range(20)]
+        # Same timestamp as m19: ordered by id, so neither is skipped
+        docs.append({**make_doc(19), "id": "m19b"})
+        db = SimpleNamespace(messages=FakeMessages(docs))
+        cache = RecentMessageCache(db, lambda doc: FakeMessage(**doc), size=10)
+        asyncio.run(cache.load())
+
+        key = (START + timedelta(seconds=17), "m17")
+        assert [message.id for message in cache.after(key, 10)] == ["m18", "m19", "m19b"]
+        assert [message.id for message in cache.after(key, 2)] == ["m18", "m19"]
+        assert cache.has_after((START + timedelta(seconds=19), "m19")) is True
+        assert cache.has_after((START + timedelta(seconds=19), "m19b")) is False
+        assert cache.after((START + timedelta(seconds=19), "m19b"), 10) == []
+        assert cache.after((START, "m0"), 10) is None  # older than the cache
+        print("✅ Polling after a cursor served from memory")
@@ -0,0 +1,122 @@
+"""
+Unit tests for message schema normalization (no server or database needed)
+Tests for:
+1. Legacy ticker shapes, missing tickers and missing fields normalized
+2. Batched migration stamps documents and can resume
+"""
+import asyncio
+from datetime import datetime
+
+from message_schema import MESSAGE_SCHEMA_VERSION, MessageSchemaMigration, normalize_message_doc
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs = sorted(self.docs, key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length):
+        return [dict(doc) for doc in self.docs]
+
+
+class FakeMessages:
+    def __init__(self, docs):
+        self.docs = docs
+        self.bulk_writes = 0
+        self.updates = []
+
+    def _matches(self, doc, query):
+        if doc.get("schema_version") == query["schema_version"]["$ne"]:
+            return False
+        return "_id" not in query or doc["_id"] > query["_id"]["$gt"]
+
+    async def count_documents(self, query):
+        return sum(1 for doc in self.docs if self._matches(doc, query))
+
+    def find(self, query, projection=None):
+        return FakeCursor([doc for doc in self.docs if self._matches(doc, query)])
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes += 1
+        by_id = {doc["_id"]: doc for doc in self.docs}
+        for operation in operations:
+            doc = by_id[operation._filter["_id"]]
+            if self._matches(doc, {"schema_version": operation._filter["schema_version"]}):
+                doc.update(operation._doc["$set"])
+            self.updates.append(operation._doc["$set"])
+
+
+def legacy_doc(index, **fields):
+    doc = {"_id": index, "id": f"m{index}", "user_id": "u1", "username": "trader",
+           "content": "watching $TSLA", "timestamp": datetime(2024, 1, 1)}
+    doc.update(fields)
+    return doc
+
+
+def validate(doc):
+    if "content" not in doc:
+        raise ValueError("content missing")
+
+
+class TestMessageSchema:
+    """Stored messages brought to one canonical shape"""
+
+    def test_normalize(self):
+        doc = normalize_message_doc(legacy_doc(1, highlighted_tickers=[{"symbol": "TSLA", "price": 1}, {"bad": 1}]))
+        assert doc["highlighted_tickers"] == ["TSLA"]
+        assert doc["content_type"] == "text" and doc["reply_to"] is None
+        assert doc["schema_version"] == MESSAGE_SCHEMA_VERSION
+        assert normalize_message_doc(legacy_doc(2, highlighted_tickers=[3], content="no tickers"))["highlighted_tickers"] == []
+        # Tickers never extracted are backfilled from the text (deduplicated)
+        assert normalize_message_doc(legacy_doc(4, content="$tsla then $NVDA then $TSLA"))["highlighted_tickers"] == ["TSLA", "NVDA"]
+        assert normalize_message_doc(legacy_doc(5, content_type="image", content="data:$AAAA"))["highlighted_tickers"] == []
+        assert normalize_message_doc(legacy_doc(3, highlighted_tickers=["NVDA"]))["highlighted_tickers"] == ["NVDA"]
+        print("✅ Legacy shapes normalized")
+
+    def test_migration_batches_and_resumes(self):
+        docs = [legacy_doc(index, highlighted_tickers=[{"symbol": "TSLA"}]) for index in range(1, 8)]
+        docs[2].pop("content")  # Invalid: stays unstamped
+        docs[4]["schema_version"] = MESSAGE_SCHEMA_VERSION  # Already migrated
+        messages = FakeMessages(docs)
+        db = type("DB", (), {"messages": messages})()
+
+        migration = MessageSchemaMigration(db, validate, batch_size=2)
+        asyncio.run(migration.run())
+        stats = migration.get_stats()
+        assert stats["total"] == 6 and stats["migrated"] == 5 and stats["invalid"] == 1
+        assert messages.bulk_writes == 3
+        assert all(doc["highlighted_tickers"] == ["TSLA"] for doc in docs if doc["_id"] != 3 and doc["_id"] != 5)
+        assert "schema_version" not in docs[2]
+
+        # Re-running only looks at what is still unstamped
+        again = MessageSchemaMigration(db, validate, batch_size=2)
+        asyncio.run(again.run())
+        assert again.total == 1 and again.migrated == 0 and again.invalid == 1
+        print("✅ Migration batched, skips invalid rows and resumes")
+
+    def test_migration_sets_only_changed_fields(self):
+        docs = [legacy_doc(1, content_type="text", is_admin=False, avatar_url=None, real_name=None, screen_name=None,
+                           reply_to_id=None, reply_to=None, text_content=None, highlighted_tickers=["TSLA"])]
+        messages = FakeMessages(docs)
+        db = type("DB", (), {"messages": messages})()
+
+        original_find = messages.find
+
+        def find_then_concurrent_write(query, projection=None):
+            cursor = original_find(query, projection)
+            # Written between the migration's read and its bulk_write
+            docs[0].update(reaction_counts={"like": 3}, content="/api/blobs/abc")
+            return cursor
+
+        messages.find = find_then_concurrent_write
+        asyncio.run(MessageSchemaMigration(db, validate).run())
+        assert messages.updates == [{"schema_version": MESSAGE_SCHEMA_VERSION}]
+        assert docs[0]["reaction_counts"] == {"like": 3} and docs[0]["content"] == "/api/blobs/abc"
+        print("✅ Migration leaves concurrent writes alone")
@@ -0,0 +1,47 @@
+"""
+Unit tests for chat search helpers (no server or database needed)
+Tests for:
+1. Query terms and highlighted snippets
+2. Search pipeline filters, ranking and cursors
+"""
+from datetime import datetime
+
+from cursors import decode_ranked_cursor, encode_ranked_cursor
+from message_search import SORT_NEWEST, build_search_pipeline, make_snippet, search_index_spec, search_terms
+
+
+class TestMessageSearch:
+    """Who said what about $XYZ"""
+
+    def test_terms_and_snippets(self):
+        assert search_terms('$TSLA "stop loss" -puts calls') == ["tsla", "stop loss", "calls"]
+
+        content = "Long day. " * 20 + "Trimmed my $TSLA calls into the close, still holding NVDA"
+        snippet, highlights = make_snippet(content, ["tsla", "calls"])
+        assert snippet.startswith("…") and snippet.endswith("NVDA")
+        assert [snippet[start:end] for start, end in highlights] == ["TSLA", "calls"]
+
+        # Stemmed query words still highlight their inflections
+        snippet, highlights = make_snippet("Trading the breakout", ["trades"])
+        assert [snippet[start:end] for start, end in highlights] == ["Trading"]
+        print("✅ Snippets centred on the first match with highlight offsets")
+
+    def test_pipeline(self):
+        pipeline = build_search_pipeline("earnings", 20, author="trader_joe", ticker="$nvda",
+                                         since=datetime(2024, 1, 1), until=datetime(2024, 1, 8))
+        match = pipeline[0]["$match"]
+        assert match["$text"] == {"$search": "earnings"} and match["content_type"] == "text"
+        assert match["username"] == "trader_joe" and match["highlighted_tickers"] == "NVDA"
+        assert set(match["timestamp"]) == {"$gte", "$lt"}
+        assert {"$sort": {"score": -1, "timestamp": -1, "id": -1}} in pipeline
+        assert {"$limit": 21} in pipeline
+
+        key = (1.25, datetime(2024, 1, 2, 10, 0), "m9")
+        assert decode_ranked_cursor(encode_ranked_cursor(*key)) == key
+        paged = build_search_pipeline("earnings", 20, ranked_after=key)
+        assert paged[2]["$match"]["$or"][0] == {"score": {"$lt": 1.25}}
+
+        newest = build_search_pipeline("earnings", 20, sort=SORT_NEWEST, before=key[1:])
+        assert newest[2] == {"$sort": {"timestamp": -1, "id": -1}}
+        assert search_index_spec()["partialFilterExpression"] == {"content_type": "text"}
+        print("✅ Filters, relevance order and cursors in the search pipeline")
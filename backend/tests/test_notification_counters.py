@@ -0,0 +1,164 @@
+"""
+Unit tests for unread notification counters (no server or database needed)
+Tests for:
+1. Counters moved and pushed, never below zero
+2. Reads never initialize a counter (reconciliation does)
+3. Drift repaired by reconciliation, without clobbering concurrent updates
+"""
+import asyncio
+import json
+
+from notification_counters import UNREAD_FIELD, UnreadCounters
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return [dict(doc) for doc in self.docs]
+
+
+def apply_update(doc, update):
+    if isinstance(update, list):  # The clamped $add pipeline
+        expression = update[0]["$set"][UNREAD_FIELD]["$max"][1]["$add"]
+        doc[UNREAD_FIELD] = max(0, (doc.get(UNREAD_FIELD) or 0) + expression[1])
+    else:
+        doc.update(update["$set"])
+
+
+class FakeResult:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+class FakeUsers:
+    def __init__(self, docs):
+        self.docs = {doc["id"]: doc for doc in docs}
+        # Runs once, just before the next conditional update is applied (a concurrent write)
+        self.before_update = None
+
+    async def find_one(self, query, projection=None):
+        doc = self.docs.get(query["id"])
+        return dict(doc) if doc else None
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=None):
+        doc = self.docs.get(query["id"])
+        if doc is None:
+            return None
+        apply_update(doc, update)
+        return dict(doc)
+
+    async def update_one(self, query, update):
+        doc = self.docs.get(query["id"])
+        expected = query[UNREAD_FIELD]
+        current = doc.get(UNREAD_FIELD) if doc else None
+        unchanged = (UNREAD_FIELD not in doc) if isinstance(expected, dict) else current == expected
+        if doc is None or not unchanged:
+            return FakeResult(0)
+        if self.before_update:
+            self.before_update()
+            self.before_update = None
+            return await self.update_one(query, update)
+        apply_update(doc, update)
+        return FakeResult(1)
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            doc = self.docs.get(operation._filter["id"])
+            if doc is not None:
+                apply_update(doc, operation._doc)
+
+    def find(self, query, projection=None):
+        if "$or" in query:
+            ids = set(query["$or"][1]["id"]["$in"])
+            docs = [doc for doc in self.docs.values() if (doc.get(UNREAD_FIELD) or 0) > 0 or doc["id"] in ids]
+        else:
+            docs = [doc for doc in self.docs.values() if doc["id"] in query["id"]["$in"]]
+        return FakeCursor(docs)
+
+
+class FakeNotifications:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def aggregate(self, pipeline):
+        counts = {}
+        for doc in self.docs:
+            if not doc["read"]:
+                counts[doc["user_id"]] = counts.get(doc["user_id"], 0) + 1
+        return FakeCursor([{"_id": user_id, "count": count} for user_id, count in counts.items()])
+
+
+class FakeManager:
+    def __init__(self):
+        self.sent = []
+
+    def send_to_user(self, user_id, message):
+        self.sent.append((user_id, json.loads(message)["count"]))
+
+
+def make_counters(users, notifications=()):
+    db = type("DB", (), {})()
+    db.users = FakeUsers(users)
+    db.notifications = FakeNotifications(list(notifications))
+    return UnreadCounters(db, FakeManager())
+
+
+class TestUnreadCounters:
+    """The badge without counting notifications"""
+
+    def test_adjust_and_push(self):
+        counters = make_counters([{"id": "u1", UNREAD_FIELD: 1}, {"id": "u2"}])
+
+        async def run():
+            await counters.add_many({"u1": 2, "u2": 1, "u3": 0})
+            assert await counters.adjust("u1", -1) == 2
+            assert await counters.adjust("u2", -5) == 0  # Clamped
+            assert await counters.adjust("missing", 1) is None
+
+        asyncio.run(run())
+        assert counters.manager.sent == [("u1", 3), ("u2", 1), ("u1", 2), ("u2", 0)]
+        print("✅ Counters moved, clamped and pushed")
+
+    def test_first_read_and_increment_race(self):
+        counters = make_counters([{"id": "u1"}], [{"user_id": "u1", "read": True}])
+
+        async def run():
+            # A notification is stored and counted while the user's counter is still unset
+            counters.db.notifications.docs.append({"user_id": "u1", "read": False})
+            assert await counters.get("u1") == 0
+            await counters.add_many({"u1": 1})
+            assert await counters.get("u1") == 1
+            assert await counters.reconcile() == {"checked": 1, "repaired": 0}
+
+        asyncio.run(run())
+        assert asyncio.run(counters.get("nobody")) is None
+        print("✅ Reads never initialize counters, so increments are not counted twice")
+
+    def test_reconcile(self):
+        counters = make_counters(
+            [{"id": "u1", UNREAD_FIELD: 5}, {"id": "u2", UNREAD_FIELD: 1}, {"id": "u3"}, {"id": "u4", UNREAD_FIELD: 2}],
+            [{"user_id": "u2", "read": False}, {"user_id": "u3", "read": False}, {"user_id": "u4", "read": False},
+             {"user_id": "u4", "read": False}],
+        )
+        assert asyncio.run(counters.reconcile()) == {"checked": 4, "repaired": 2}
+        assert {user_id: doc.get(UNREAD_FIELD) for user_id, doc in counters.db.users.docs.items()} == {"u1": 0, "u2": 1, "u3": 1, "u4": 2}
+        assert sorted(counters.manager.sent) == [("u1", 0), ("u3", 1)]
+        print("✅ Drift repaired from db.notifications")
+
+    def test_reconcile_skips_concurrent_updates(self):
+        counters = make_counters([{"id": "u1", UNREAD_FIELD: 5}], [{"user_id": "u1", "read": False}])
+
+        def new_notification():
+            # Stored and counted by the queue after reconcile read the counter
+            counters.db.notifications.docs.append({"user_id": "u1", "read": False})
+            counters.db.users.docs["u1"][UNREAD_FIELD] = 6
+
+        counters.db.users.before_update = new_notification
+        assert asyncio.run(counters.reconcile()) == {"checked": 1, "repaired": 0}
+        assert counters.db.users.docs["u1"][UNREAD_FIELD] == 6 and counters.manager.sent == []
+        # The next pass sees the settled value
+        assert asyncio.run(counters.reconcile()) == {"checked": 1, "repaired": 1}
+        assert counters.db.users.docs["u1"][UNREAD_FIELD] == 2
+        print("✅ Repairs never overwrite a counter that moved meanwhile")
@@ -0,0 +1,122 @@
+"""
+Unit tests for the batched notification queue (no server, database or Firebase needed)
+Tests for:
+1. Queued notifications stored with one insert, pushed per user, FCM coalesced
+2. Failed inserts retried with backoff
+3. Producers wait while the queue is full
+"""
+import asyncio
+import json
+from datetime import datetime
+
+from notification_queue import NotificationQueue
+
+
+class FakeNotifications:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.inserts = []
+
+    async def insert_many(self, docs, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("primary stepped down")
+        self.inserts.append(list(docs))
+
+
+class FakeTokenRegistry:
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def tokens_for(self, user_id):
+        return list(self.tokens.get(user_id, []))
+
+
+class FakeManager:
+    def __init__(self):
+        self.sent = []
+
+    def send_to_user(self, user_id, message):
+        self.sent.append((user_id, json.loads(message)))
+
+
+class FakeFCM:
+    initialized = True
+
+    def __init__(self):
+        self.multicasts = []
+
+    async def send_to_multiple(self, tokens, title, body, data=None):
+        self.multicasts.append((sorted(tokens), title))
+        return {"success_count": len(tokens), "failure_count": 0}
+
+
+def notification(user_id, title="You were mentioned! 👋"):
+    return {"id": f"n-{user_id}-{title}", "user_id": user_id, "type": "mention", "title": title,
+            "message": "hi", "data": {"message_id": "m1"}, "read": False,
+            "created_at": datetime(2024, 1, 1), "expires_at": None}
+
+
+def make_queue(failures=0, **kwargs):
+    db = type("DB", (), {})()
+    db.notifications = FakeNotifications(failures)
+    tokens = FakeTokenRegistry({"u1": ["t1"], "u2": ["t2"], "u3": ["t3a", "t3b"]})
+    return NotificationQueue(db, FakeManager(), tokens, fcm=FakeFCM(), retry_base_delay=0.001, **kwargs)
+
+
+class TestNotificationQueue:
+    """Notifications off the request path, in batches"""
+
+    def test_batched_delivery(self):
+        queue = make_queue()
+
+        async def run():
+            await queue.start()
+            for user_id in ["u1", "u2", "u3"]:
+                await queue.enqueue(notification(user_id))
+            await queue.enqueue(notification("u1", title="New Reply"))
+            await queue.stop()
+
+        asyncio.run(run())
+        assert [len(batch) for batch in queue.db.notifications.inserts] == [4]
+        assert [user_id for user_id, _ in queue.manager.sent] == ["u1", "u2", "u3", "u1"]
+        assert queue.manager.sent[0][1]["notification"]["created_at"] == "2024-01-01T00:00:00"
+        assert "_id" not in queue.manager.sent[0][1]["notification"]
+        # The three identical mentions are one multicast, to every device of each recipient
+        assert queue.fcm.multicasts == [(["t1", "t2", "t3a", "t3b"], "You were mentioned! 👋"), (["t1"], "New Reply")]
+        stats = queue.get_stats()
+        assert stats["delivered"] == 4 and stats["depth"] == 0 and stats["batches"] == 1
+        print("✅ One insert, per-user pushes and coalesced FCM multicasts")
+
+    def test_retries(self):
+        queue = make_queue(failures=2)
+        asyncio.run(queue.deliver([(0.0, notification("u1"))]))
+        assert len(queue.db.notifications.inserts) == 1 and queue.retries == 2
+
+        failing = make_queue(failures=10, max_attempts=3)
+
+        async def run():
+            await failing.start()
+            await failing.enqueue(notification("u1"))
+            await failing.stop()
+
+        asyncio.run(run())
+        assert failing.failed == 1 and failing.manager.sent == []
+        print("✅ Inserts retried with backoff, then counted as failed")
+
+    def test_backpressure(self):
+        queue = make_queue(max_pending=2)
+
+        async def run():
+            await queue.enqueue(notification("u1"))
+            await queue.enqueue(notification("u2"))
+            producer = asyncio.create_task(queue.enqueue(notification("u3")))
+            await asyncio.sleep(0.01)
+            assert not producer.done()  # Waiting for room
+            await queue.start()
+            await producer
+            await queue.stop()
+
+        asyncio.run(run())
+        assert queue.backpressure_waits == 1 and queue.delivered == 3
+        print("✅ Producers wait while the queue is full")
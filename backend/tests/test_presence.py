@@ -0,0 +1,177 @@
+"""
+Unit tests for the in-memory presence registry (no server or database needed)
+Tests for:
+1. Online snapshot and count without DB queries
+2. Multi-device users stay online until their last socket closes
+3. Presence shared between workers through the backplane
+4. Write-behind flushing of is_online/last_seen
+5. Coalesced presence_delta frames
+"""
+import json
+import asyncio
+
+from backplane import InProcessBackplane
+from presence import PresenceRegistry
+from websocket_manager import ConnectionManager
+from test_websocket_manager import FakeWebSocket
+
+
+class FakeUsersCollection:
+    """Records the batched writes presence makes"""
+
+    def __init__(self):
+        self.updates = []
+        self.bulk_writes = 0
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes += 1
+        for operation in operations:
+            self.updates.append((operation._filter["id"], operation._doc["$set"]))
+
+
+class FakeDB:
+    def __init__(self):
+        self.users = FakeUsersCollection()
+
+
+async def connect(manager, presence, user):
+    connection = await manager.connect(FakeWebSocket(), user)
+    return connection, presence.user_connected(user)
+
+
+class TestPresenceRegistry:
+    """Single worker presence"""
+
+    def test_snapshot_count_and_multi_device(self):
+        async def scenario():
+            db = FakeDB()
+            manager = ConnectionManager()
+            presence = PresenceRegistry(db, manager)
+            alice = {"id": "alice", "username": "alice", "password_hash": "secret"}
+            first, joined_first = await connect(manager, presence, alice)
+            second, joined_second = await connect(manager, presence, alice)
+            await connect(manager, presence, {"id": "bob", "username": "bob"})
+            snapshot = presence.snapshot()
+            count = presence.count
+            manager.disconnect(first)
+            left_first = not presence.is_online("alice")  # disconnect listener updated presence
+            manager.disconnect(second)
+            left_second = not presence.is_online("alice")
+            online_after = presence.online_ids()
+            await presence.stop()
+            await manager.close_all()
+            return db, snapshot, count, (joined_first, joined_second, left_first, left_second), online_after
+
+        db, snapshot, count, transitions, online_after = asyncio.run(scenario())
+        assert count == 2
+        assert {p["username"] for p in snapshot} == {"alice", "bob"}
+        assert all("password_hash" not in p for p in snapshot)
+        assert transitions == (True, False, False, True)
+        assert online_after == ["bob"]
+        written = dict(db.users.updates)  # flushed on stop
+        assert written["alice"]["is_online"] is False and written["bob"]["is_online"] is True
+        print("✅ Presence tracked in memory, persisted on flush")
+
+
+class TestPresenceAcrossWorkers:
+    """Workers share presence through the backplane"""
+
+    def test_remote_user_visible_and_sync_removes_stale(self):
+        async def scenario():
+            backplane = InProcessBackplane()
+            manager_a, manager_b = ConnectionManager(backplane), ConnectionManager(backplane)
+            presence_a, presence_b = PresenceRegistry(FakeDB(), manager_a), PresenceRegistry(FakeDB(), manager_b)
+            await connect(manager_a, presence_a, {"id": "alice", "username": "alice"})
+            visible_on_b = presence_b.is_online("alice")
+            # Worker A re-announces with nobody connected (e.g. missed disconnect envelope)
+            for connection in list(manager_a.connections.values()):
+                manager_a._unregister(connection)
+            presence_a._publish_sync()
+            gone_on_b = not presence_b.is_online("alice")
+            await manager_a.close_all()
+            await manager_b.close_all()
+            return visible_on_b, gone_on_b
+
+        visible_on_b, gone_on_b = asyncio.run(scenario())
+        assert visible_on_b
+        assert gone_on_b
+        print("✅ Remote presence applied and reconciled by sync")
+
+
+class TestPresenceFlusher:
+    """Connects, disconnects and heartbeats become one bulk_write"""
+
+    def test_heartbeats_coalesce_into_one_bulk_write(self):
+        async def scenario():
+            db = FakeDB()
+            manager = ConnectionManager()
+            presence = PresenceRegistry(db, manager)
+            for index in range(50):
+                await connect(manager, presence, {"id": f"user{index}", "username": f"user{index}"})
+            for _ in range(20):
+                for index in range(50):
+                    presence.heartbeat(f"user{index}")
+            presence.user_disconnected("user0")  # still has a socket - stays online
+            manager.disconnect(manager.user_connection_list("user1")[0])
+            await presence.stop()  # final flush on shutdown
+            await manager.close_all()
+            return db
+
+        db = asyncio.run(scenario())
+        assert db.users.bulk_writes == 1
+        assert len(db.users.updates) == 50
+        updates = dict(db.users.updates)
+        assert updates["user1"]["is_online"] is False
+        assert updates["user2"]["is_online"] is True
+        assert all("last_seen" in fields for fields in updates.values())
+        print("✅ 1000+ presence updates flushed as a single bulk_write")
+
+    def test_buffer_is_bounded(self):
+        from presence import PresenceFlusher
+
+        flusher = PresenceFlusher(FakeDB(), max_pending=10)
+        for index in range(25):
+            flusher.record(f"hb{index}")
+        flusher.record("joining", True)
+        assert len(flusher.pending) == 21
+        assert flusher.dropped == 5
+        assert flusher.pending["joining"][0] is True
+        print("✅ Heartbeats dropped past the bound, transitions kept")
+
+
+class TestPresenceDelta:
+    """Joins and leaves are coalesced into one frame per tick"""
+
+    def test_churn_becomes_one_frame_per_socket(self):
+        async def scenario():
+            manager = ConnectionManager()
+            presence = PresenceRegistry(FakeDB(), manager)
+            watcher = FakeWebSocket()
+            await manager.connect(watcher, {"id": "watcher"})
+            presence.user_connected({"id": "watcher", "username": "watcher"})
+            presence.flush_delta()
+            await asyncio.sleep(0.01)
+            watcher.sent.clear()
+            # Reconnect storm: 100 users join, 10 leave, one flaps in and out
+            connections = {}
+            for index in range(100):
+                connections[index], _ = await connect(manager, presence, {"id": f"u{index}", "username": f"u{index}"})
+            for index in range(10):
+                manager.disconnect(connections[index])
+            flapper, _ = await connect(manager, presence, {"id": "flapper", "username": "flapper"})
+            manager.disconnect(flapper)
+            presence.flush_delta()
+            await asyncio.sleep(0.05)
+            frames = list(watcher.sent)
+            await presence.stop()
+            await manager.close_all()
+            return frames
+
+        frames = asyncio.run(scenario())
+        assert len(frames) == 1
+        delta = json.loads(frames[0])
+        assert delta["type"] == "presence_delta"
+        assert len(delta["added"]) == 90 and len(delta["users"]) == 90
+        assert "flapper" not in delta["added"] and "flapper" not in delta["removed"]
+        assert delta["removed"] == [] and delta["online_count"] == 91
+        print("✅ 111 presence changes delivered as one presence_delta frame")
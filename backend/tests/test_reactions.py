@@ -0,0 +1,102 @@
+"""
+Unit tests for denormalized reaction counts (no server or database needed)
+Tests for:
+1. Reaction types safe to use as field names
+2. Page summaries from stored counts, with reactors loaded in one query
+3. Counts rebuilt from reaction rows
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from reactions import reaction_summary, rebuild_reaction_counts, validate_reaction_type
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if isinstance(condition, dict):
+            if doc.get(field) not in condition["$in"]:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.queries = []
+        self.writes = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return FakeCursor([doc for doc in self.docs if matches(doc, query)])
+
+    def aggregate(self, pipeline):
+        groups = {}
+        for doc in self.docs:
+            key = (doc["message_id"], doc["reaction_type"])
+            groups[key] = groups.get(key, 0) + 1
+        return FakeCursor([{"_id": {"message_id": m, "reaction_type": t}, "count": n} for (m, t), n in groups.items()])
+
+    async def bulk_write(self, operations, ordered=True):
+        self.writes.append(operations)
+
+    async def update_one(self, query, update, upsert=False):
+        self.docs.append(query)
+
+
+def reaction(message_id, user_id, reaction_type):
+    return {"message_id": message_id, "user_id": user_id, "reaction_type": reaction_type, "created_at": datetime(2024, 1, 1)}
+
+
+def fake_db():
+    db = type("DB", (), {})()
+    db.messages = FakeCollection([
+        {"id": "m1", "reaction_counts": {"heart": 2, "🚀": 0}},
+        {"id": "m2"},
+    ])
+    db.reactions = FakeCollection([reaction("m1", "u1", "heart"), reaction("m1", "u2", "heart"), reaction("m3", "u1", "like")])
+    db.users = FakeCollection([{"id": "u1", "username": "joe"}, {"id": "u2", "username": "ann"}])
+    db.counters = FakeCollection()
+    return db
+
+
+class TestReactions:
+    """Reaction counts without counting reaction rows"""
+
+    def test_reaction_types(self):
+        assert validate_reaction_type("🚀") == "🚀"
+        for bad in ["", "a.b", "$inc", "x" * 33, None]:
+            with pytest.raises(HTTPException):
+                validate_reaction_type(bad)
+        print("✅ Reaction types validated")
+
+    def test_summary(self):
+        db = fake_db()
+        summary = asyncio.run(reaction_summary(db, ["m1", "m2", "m1"], user_id="u1"))
+        assert summary == {"m1": {"counts": {"heart": 2}, "mine": ["heart"]}, "m2": {"counts": {}, "mine": []}}
+
+        expanded = asyncio.run(reaction_summary(db, ["m1", "m2"], expand=True))
+        assert [user["username"] for user in expanded["m1"]["reactors"]["heart"]] == ["joe", "ann"]
+        assert expanded["m2"]["reactors"] == {}
+        assert len(db.users.queries) == 1  # One users query, not one per reaction
+        print("✅ Summaries read stored counts and batch reactor lookups")
+
+    def test_rebuild(self):
+        db = fake_db()
+        assert asyncio.run(rebuild_reaction_counts(db)) == 2
+        updates = {op._filter["id"]: op._doc["$set"]["reaction_counts"] for op in db.messages.writes[0]}
+        assert updates == {"m1": {"heart": 2}, "m3": {"like": 1}}
+        assert db.counters.docs == [{"_id": "reaction_counts"}]
+        print("✅ Counts rebuilt from reaction rows")
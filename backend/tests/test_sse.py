@@ -0,0 +1,44 @@
+"""
+Unit tests for the Server-Sent Events transport (no server or database needed)
+Tests for:
+1. Manager deliveries reach an SSE channel as SSE events
+2. Sequenced events carry their seq as the event id
+3. Closing the connection ends the stream
+"""
+import asyncio
+
+from event_stream import EventStream
+from sse import SSEChannel
+from websocket_manager import ConnectionManager
+from test_event_stream import FakeDB
+
+
+class TestSSEChannel:
+    """SSE channel registered like a WebSocket"""
+
+    def test_events_streamed_with_ids(self):
+        async def scenario():
+            manager = ConnectionManager()
+            stream = EventStream(FakeDB(), manager)
+            channel = SSEChannel()
+            connection = await manager.connect(channel, {"id": "reader"})
+            chunks = []
+
+            async def read():
+                async for chunk in channel.stream():
+                    chunks.append(chunk)
+
+            reader = asyncio.create_task(read())
+            await stream.publish("message", {"id": "m1"})
+            manager.send_to_user("reader", '{"type": "notification"}')
+            await asyncio.sleep(0.05)
+            await connection.close()
+            await asyncio.wait_for(reader, 1)
+            return chunks
+
+        chunks = asyncio.run(scenario())
+        assert chunks[0].startswith("retry:")
+        assert chunks[1].startswith("id: 1\ndata: {\"seq\":1") and chunks[1].endswith("\n\n")
+        assert chunks[2] == 'data: {"type": "notification"}\n\n'
+        assert len(chunks) == 3
+        print("✅ Deliveries streamed as SSE events, stream ends on close")
@@ -0,0 +1,134 @@
+"""
+Unit tests for the per-ticker timeline endpoint (fake database, no server needed)
+Tests for:
+1. Symbols normalized and validated
+2. Pages walked back with the X-Before-Cursor header
+3. Polling with `after` answers 304 from a limit-1 probe
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException, Response
+
+import server
+from cursors import decode_cursor
+
+START = datetime(2024, 1, 1, 9, 30)
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches(doc, part) for part in condition):
+                return False
+        elif field == "$or":
+            if not any(matches(doc, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = doc.get(field)
+            if "$lt" in condition and not value < condition["$lt"]:
+                return False
+            if "$gt" in condition and not value > condition["$gt"]:
+                return False
+        elif isinstance(doc.get(field), list):
+            if condition not in doc[field]:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs, projection):
+        self.docs = docs
+        self.projection = projection
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs = sorted(self.docs, key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length):
+        fields = [field for field, included in self.projection.items() if included and field != "_id"]
+        if fields:
+            return [{field: doc[field] for field in fields} for doc in self.docs]
+        return [dict(doc) for doc in self.docs]
+
+
+class FakeMessages:
+    def __init__(self, docs):
+        self.docs = docs
+        self.finds = []
+
+    def find(self, query, projection=None):
+        self.finds.append(projection)
+        return FakeCursor([doc for doc in self.docs if matches(doc, query)], projection or {})
+
+
+def message_doc(index, tickers):
+    return {"id": f"m{index:02d}", "user_id": "u1", "username": "trader", "content": f"{' '.join('$' + t for t in tickers)} #{index}",
+            "highlighted_tickers": tickers, "timestamp": START + timedelta(minutes=index)}
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    docs = [message_doc(index, ["TSLA"] if index % 2 else ["NVDA"]) for index in range(10)]
+    messages = FakeMessages(docs)
+    monkeypatch.setattr(server, "db", type("DB", (), {"messages": messages})())
+    return messages
+
+
+def get(symbol, **params):
+    response = Response()
+    result = asyncio.run(server.get_ticker_messages(symbol, response, **params))
+    return (result, result.headers) if isinstance(result, Response) else (result, response.headers)
+
+
+class TestTickerTimeline:
+    """GET /api/tickers/{symbol}/messages"""
+
+    def test_symbols_and_empty(self, messages):
+        page, headers = get("$tsla")
+        assert [message.id for message in page] == ["m01", "m03", "m05", "m07", "m09"]
+        page, headers = get("AAPL")
+        assert page == [] and "X-Before-Cursor" not in headers
+        for symbol in ("TOOLONG", "$", "T5LA"):
+            with pytest.raises(HTTPException) as error:
+                get(symbol)
+            assert error.value.status_code == 400
+        print("✅ Symbols normalized, unknown tickers return an empty page")
+
+    def test_paged(self, messages):
+        page, headers = get("TSLA", limit=2)
+        assert [message.id for message in page] == ["m07", "m09"]
+        older, headers = get("TSLA", limit=2, before=headers["X-Before-Cursor"])
+        assert [message.id for message in older] == ["m03", "m05"]
+        oldest, headers = get("TSLA", limit=2, before=headers["X-Before-Cursor"])
+        assert [message.id for message in oldest] == ["m01"]
+        assert decode_cursor(headers["X-After-Cursor"])[1] == "m01"
+        print("✅ Ticker history paged with before cursors")
+
+    def test_after_304(self, messages):
+        page, headers = get("TSLA")
+        cursor = headers["X-After-Cursor"]
+        messages.finds.clear()
+
+        result, headers = get("TSLA", after=cursor)
+        assert result.status_code == 304 and headers["X-After-Cursor"] == cursor
+        # One limit-1 probe on keys only, no page query
+        assert messages.finds == [{"_id": 0, "timestamp": 1, "id": 1}]
+
+        messages.docs.append(message_doc(10, ["NVDA"]))
+        result, _ = get("TSLA", since=cursor)
+        assert result.status_code == 304  # Another ticker's message is not news here
+
+        messages.docs.append(message_doc(11, ["TSLA", "NVDA"]))
+        page, headers = get("TSLA", after=cursor)
+        assert [message.id for message in page] == ["m11"]
+        assert decode_cursor(headers["X-After-Cursor"])[1] == "m11"
+        print("✅ Polling answers 304 until the ticker has a newer message")
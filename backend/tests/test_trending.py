@@ -0,0 +1,113 @@
+"""
+Unit tests for trending tickers (no server or database needed)
+Tests for:
+1. Mentions counted per window and aged out bucket by bucket
+2. Deltas pushed only when a top list changes
+3. State rebuilt from history at start-up
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from trending import TrendingTickers
+
+NOW = datetime(2024, 3, 1, 15, 0, tzinfo=timezone.utc).timestamp()
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeManager:
+    def __init__(self):
+        self.frames = []
+
+    def broadcast_local(self, frame):
+        self.frames.append(frame.payload)
+        return 1
+
+
+class FakeAggregate:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def to_list(self, length):
+        return self.rows
+
+
+class FakeMessages:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def aggregate(self, pipeline):
+        return FakeAggregate(self.rows)
+
+
+def message(seconds_ago, *tickers):
+    timestamp = datetime.utcfromtimestamp(NOW - seconds_ago)
+    return {"highlighted_tickers": list(tickers), "timestamp": timestamp.isoformat()}
+
+
+def mentions(trending, window):
+    return {entry["symbol"]: entry["mentions"] for entry in trending.top(window)}
+
+
+class TestTrendingTickers:
+    """What's hot right now, without aggregating over messages"""
+
+    def test_windows_and_expiry(self):
+        clock = Clock(NOW)
+        trending = TrendingTickers(None, FakeManager(), clock=clock)
+        trending.loaded = True
+        trending.record(message(60, "TSLA", "TSLA", "NVDA"))  # Counted once per message
+        trending.record(message(30 * 60, "TSLA"))
+        trending.record(message(5 * 3600, "AAPL"))
+        trending.record(message(2 * 86400, "GME"))  # Too old for any window
+
+        assert mentions(trending, "15m") == {"TSLA": 1, "NVDA": 1}
+        assert mentions(trending, "1h") == {"TSLA": 2, "NVDA": 1}
+        assert mentions(trending, "24h") == {"TSLA": 2, "NVDA": 1, "AAPL": 1}
+        assert trending.top("1h")[0] == {"symbol": "TSLA", "mentions": 2, "rank": 1}
+
+        clock.now += 45 * 60
+        assert mentions(trending, "15m") == {}
+        assert mentions(trending, "1h") == {"TSLA": 1, "NVDA": 1}
+        clock.now += 24 * 3600
+        assert mentions(trending, "24h") == {} and not trending.buckets
+        print("✅ Windows count recent mentions and shed old buckets")
+
+    def test_deltas(self):
+        manager = FakeManager()
+        trending = TrendingTickers(None, manager, clock=Clock(NOW))
+        trending.loaded = True
+        trending.record(message(10, "TSLA"))
+        assert trending.flush_delta() == 1
+        assert manager.frames[-1]["windows"]["15m"]["updated"] == [{"symbol": "TSLA", "mentions": 1, "rank": 1}]
+        assert trending.flush_delta() == 0  # Nothing changed
+
+        trending.record(message(5, "NVDA"))
+        trending.flush_delta()
+        delta = manager.frames[-1]["windows"]["1h"]
+        # Ties rank alphabetically, so TSLA moved down a place
+        assert delta["updated"] == [{"symbol": "NVDA", "mentions": 1, "rank": 1}, {"symbol": "TSLA", "mentions": 1, "rank": 2}]
+        assert delta["removed"] == []
+        print("✅ Only changed entries are pushed")
+
+    def test_rebuild(self):
+        minute_ms = int((NOW - 120) // 60 * 60 * 1000)
+        rows = [
+            {"_id": {"minute": minute_ms, "ticker": "TSLA"}, "count": 4},
+            {"_id": {"minute": minute_ms - 3 * 3600 * 1000, "ticker": "AMD"}, "count": 2},
+            {"_id": {"minute": minute_ms, "ticker": {"symbol": "OLD"}}, "count": 1},
+        ]
+        db = type("DB", (), {"messages": FakeMessages(rows)})()
+        trending = TrendingTickers(db, FakeManager(), clock=Clock(NOW))
+        trending.record(message(-1, "TSLA"))  # Published after the rebuild started
+        trending.record(message(600, "TSLA"))  # Already in the aggregation
+        asyncio.run(trending.rebuild())
+        assert mentions(trending, "15m") == {"TSLA": 5}
+        assert mentions(trending, "24h") == {"TSLA": 5, "AMD": 2}
+        print("✅ Counters rebuilt from recent history")
@@ -0,0 +1,113 @@
+"""
+Unit tests for the in-memory user directory (no server or database needed)
+Tests for:
+1. Case-insensitive mention resolution and prefix search
+2. Registrations, renames and deletions applied through the backplane
+3. Loading from db.users
+"""
+import asyncio
+
+from user_directory import UserDirectory
+
+
+class FakeManager:
+    def __init__(self):
+        self.handlers = {}
+        self.published = []
+
+    def register_handler(self, op, handler):
+        self.handlers[op] = handler
+
+    def publish(self, envelope):
+        self.published.append(envelope)
+        return self.handlers[envelope["op"]](envelope)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+
+class FakeUsers:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return FakeCursor(self.docs)
+
+
+def user(user_id, username, **fields):
+    return {"id": user_id, "username": username, "status": "approved", **fields}
+
+
+def directory_with(*users):
+    directory = UserDirectory(None, FakeManager())
+    for entry in users:
+        directory.upsert(entry)
+    return directory
+
+
+class TestUserDirectory:
+    """@mentions and autocomplete without a collection scan"""
+
+    def test_mentions_and_search(self):
+        directory = directory_with(user("1", "TraderJoe"), user("2", "trader_ann"), user("3", "bob"), user("4", "Trades"))
+        mentioned = directory.resolve_mentions("@traderjoe @BOB what do you think? cc @TraderJoe @nobody")
+        assert [entry["id"] for entry in mentioned] == ["1", "3"]
+
+        assert [entry["username"] for entry in directory.search("TRADER")] == ["trader_ann", "TraderJoe"]
+        assert [entry["username"] for entry in directory.search("@trad", limit=2)] == ["trader_ann", "TraderJoe"]
+        assert [entry["username"] for entry in directory.search("trade")] == ["trader_ann", "TraderJoe", "Trades"]
+        assert directory.search("x") == [] and directory.search("") == []
+        print("✅ Mentions resolved and prefixes searched case-insensitively")
+
+    def test_search_active_users_only(self):
+        directory = directory_with(user("1", "ann", is_admin=True), user("2", "andy", status="pending"),
+                                   user("3", "anna", status="rejected"), user("4", "anne", status="trial_expired"),
+                                   user("5", "annie", status="trial"))
+        assert directory.search("an") == [
+            {"id": "1", "username": "ann", "screen_name": None, "avatar_url": None},
+            {"id": "5", "username": "annie", "screen_name": None, "avatar_url": None},
+        ]
+        assert [entry["id"] for entry in directory.search("an", limit=1)] == ["1"]
+        directory.update("2", {"status": "approved"})  # Approved by an admin
+        assert [entry["id"] for entry in directory.search("and")] == ["2"]
+        print("✅ Autocomplete offers approved and trial users, without role or status")
+
+    def test_changes(self):
+        directory = directory_with(user("1", "joe"), user("2", "ann"))
+        directory.upsert(user("1", "joseph", avatar_url="/a.png"))  # Rename
+        assert directory.find("joe") is None and directory.find("JOSEPH")["avatar_url"] == "/a.png"
+        assert directory.names == [("ann", "2"), ("joseph", "1")]
+
+        directory.update("2", {"screen_name": "Ann B", "bio": "ignored"})
+        assert directory.get("2") == {"id": "2", "username": "ann", "screen_name": "Ann B", "avatar_url": None, "is_admin": None,
+                                    "status": "approved"}
+        directory.update("1", {"is_admin": True})
+        assert directory.admin_ids() == ["1"]
+        directory.update("1", {"is_admin": False})  # Demoted
+        assert directory.admin_ids() == []
+        directory.update("1", {"is_admin": True})
+        published = len(directory.manager.published)
+        directory.update("2", {"screen_name": "Ann B"})  # Unchanged - nothing sent
+        directory.update("missing", {"screen_name": "x"})
+        assert len(directory.manager.published) == published
+
+        directory.remove("2")
+        assert directory.find("ann") is None and directory.search("a") == []
+        assert len(directory) == 1
+        directory.remove("1")
+        assert directory.admin_ids() == []
+        print("✅ Renames, profile changes and deletions kept in step")
+
+    def test_load(self):
+        db = type("DB", (), {"users": FakeUsers([user("1", "Zed", is_admin=True), user("2", "amy"), {"id": "3"}])})()
+        directory = UserDirectory(db, FakeManager())
+        asyncio.run(directory.load())
+        assert directory.loaded and len(directory) == 2
+        assert directory.names == [("amy", "2"), ("zed", "1")]
+        assert directory.admin_ids() == ["1"]
+        print("✅ Directory loaded from db.users")
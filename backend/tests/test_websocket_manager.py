@@ -0,0 +1,240 @@
+"""
+Unit tests for the WebSocket fan-out engine (no server or database needed)
+Tests for:
+1. Broadcast delivery to every connection
+2. A slow consumer does not block fast ones
+3. Slow consumers are disconnected when their queue overflows
+4. Multi-device registry and group indexes
+5. Topic subscriptions and routing
+6. Ping/pong health checks and dead-socket eviction
+"""
+import json
+import time
+import asyncio
+
+import websocket_manager
+from websocket_manager import ConnectionManager, GROUP_ADMINS, GROUP_MEMBERS, GROUP_TRIAL
+
+
+class FakeWebSocket:
+    """Minimal stand-in for a Starlette WebSocket"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(text)
+
+    async def send_bytes(self, data: bytes):
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.closed_with = code
+
+
+class TestBroadcastFanout:
+    """Broadcast goes through per-connection queues"""
+
+    def test_broadcast_reaches_all_connections(self):
+        async def scenario():
+            manager = ConnectionManager()
+            sockets = [FakeWebSocket() for _ in range(50)]
+            for i, ws in enumerate(sockets):
+                await manager.connect(ws, {"id": f"user-{i}"})
+            await manager.broadcast("hello")
+            await asyncio.sleep(0.05)
+            return manager, sockets
+
+        manager, sockets = asyncio.run(scenario())
+        assert all(ws.sent == ["hello"] for ws in sockets)
+        stats = manager.get_stats()
+        assert stats["broadcasts"] == 1
+        assert stats["frames_sent"] == 50
+        assert stats["completion_ms"]["p50"] is not None
+        print(f"✅ Broadcast reached {len(sockets)} sockets")
+
+    def test_slow_consumer_does_not_stall_others(self):
+        async def scenario():
+            manager = ConnectionManager()
+            slow = FakeWebSocket(delay=1.0)
+            fast = FakeWebSocket()
+            await manager.connect(slow, {"id": "slow"})
+            await manager.connect(fast, {"id": "fast"})
+            await manager.broadcast("tick")
+            await asyncio.sleep(0.05)
+            result = (list(fast.sent), list(slow.sent))
+            await manager.close_all()
+            return result
+
+        fast_sent, slow_sent = asyncio.run(scenario())
+        assert fast_sent == ["tick"]
+        assert slow_sent == []
+        print("✅ Fast client received the frame while the slow one was still sending")
+
+
+class TestSlowConsumerPolicy:
+    """Queue overflow handling"""
+
+    def test_overflow_disconnects_slow_consumer(self, monkeypatch):
+        monkeypatch.setattr(websocket_manager, "WS_SEND_QUEUE_SIZE", 4)
+        monkeypatch.setattr(websocket_manager, "WS_SLOW_CONSUMER_POLICY", "disconnect")
+
+        async def scenario():
+            manager = ConnectionManager()
+            slow = FakeWebSocket(delay=10.0)
+            await manager.connect(slow, {"id": "slow"})
+            for i in range(10):
+                await manager.broadcast(f"frame-{i}")
+            await asyncio.sleep(0.05)
+            return manager, slow
+
+        manager, slow = asyncio.run(scenario())
+        stats = manager.get_stats()
+        assert slow.closed_with == 1013
+        assert stats["connections"] == 0
+        assert stats["slow_consumer_disconnects"] == 1
+        assert stats["frames_dropped"] >= 1
+        print("✅ Slow consumer disconnected on overflow")
+
+    def test_overflow_drops_oldest_when_downgrading(self, monkeypatch):
+        monkeypatch.setattr(websocket_manager, "WS_SEND_QUEUE_SIZE", 4)
+        monkeypatch.setattr(websocket_manager, "WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+
+        async def scenario():
+            manager = ConnectionManager()
+            slow = FakeWebSocket(delay=0.01)
+            connection = await manager.connect(slow, {"id": "slow"})
+            for i in range(10):
+                await manager.broadcast(f"frame-{i}")
+            await asyncio.sleep(0.3)
+            return manager, slow, connection
+
+        manager, slow, connection = asyncio.run(scenario())
+        assert connection.lagging
+        assert slow.sent[-1] == "frame-9"
+        assert manager.get_stats()["connections"] == 1
+        print(f"✅ Lagging client kept newest frames: {slow.sent}")
+
+
+class TestConnectionRegistry:
+    """Connections keyed by id, many sockets per user, group indexes"""
+
+    def test_second_device_does_not_replace_first(self):
+        async def scenario():
+            manager = ConnectionManager()
+            phone, laptop = FakeWebSocket(), FakeWebSocket()
+            first = await manager.connect(phone, {"id": "alice"}, "session-1")
+            await manager.connect(laptop, {"id": "alice"}, "session-1")
+            manager.send_to_user("alice", "ping")
+            await asyncio.sleep(0.05)
+            manager.disconnect(first)
+            still_connected = manager.is_connected("alice")
+            await manager.close_all()
+            return phone, laptop, still_connected, manager
+
+        phone, laptop, still_connected, manager = asyncio.run(scenario())
+        assert phone.sent == ["ping"] and laptop.sent == ["ping"]
+        assert still_connected
+        assert manager.get_stats()["connections"] == 0
+        assert not manager.is_connected("alice")
+        print("✅ Both devices received the frame; disconnecting one kept the user online")
+
+    def test_group_indexes_follow_role_and_status(self):
+        async def scenario():
+            manager = ConnectionManager()
+            await manager.connect(FakeWebSocket(), {"id": "admin", "is_admin": True, "status": "approved"})
+            await manager.connect(FakeWebSocket(), {"id": "trialist", "status": "trial"})
+            await manager.connect(FakeWebSocket(), {"id": "member", "status": "approved"})
+            before = (manager.group_members(GROUP_ADMINS), manager.group_members(GROUP_TRIAL))
+            manager.update_user("member", is_admin=True)
+            manager.update_user("trialist", status="approved")
+            after = (manager.group_members(GROUP_ADMINS), manager.group_members(GROUP_TRIAL), manager.group_members(GROUP_MEMBERS))
+            await manager.close_all()
+            return before, after
+
+        (admins, trial), (admins_after, trial_after, members_after) = asyncio.run(scenario())
+        assert admins == {"admin"} and trial == {"trialist"}
+        assert admins_after == {"admin", "member"}
+        assert trial_after == set()
+        assert members_after == {"trialist"}
+        print("✅ Group indexes updated in memory")
+
+    def test_session_invalidation_skips_new_session(self):
+        async def scenario():
+            manager = ConnectionManager()
+            old, new = FakeWebSocket(), FakeWebSocket()
+            await manager.connect(old, {"id": "bob"}, "old-session")
+            await manager.connect(new, {"id": "bob"}, "new-session")
+            await manager.send_session_invalidation("bob", "new-session")
+            await asyncio.sleep(0.05)
+            await manager.close_all()
+            return old, new
+
+        old, new = asyncio.run(scenario())
+        assert len(old.sent) == 1 and "session_invalidated" in old.sent[0]
+        assert new.sent == []
+        print("✅ Only the old session was invalidated")
+
+
+class TestTopicSubscriptions:
+    """Topic index routes events only to subscribers"""
+
+    def test_routing_and_permissions(self):
+        async def scenario():
+            manager = ConnectionManager()
+            chat, trader, admin = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+            await manager.connect(chat, {"id": "chatter"})
+            trader_connection = await manager.connect(trader, {"id": "trader"})
+            await manager.connect(admin, {"id": "boss", "is_admin": True})
+            manager.unsubscribe(trader_connection, ["chat:global"])
+            added = manager.subscribe(trader_connection, ["ticker:tsla", "admin", "user:chatter", "bogus"])
+            manager.send_to_topics(["chat:global", "ticker:TSLA"], "tsla-msg")
+            manager.send_to_topics(["chat:global"], "plain-msg")
+            manager.send_to_topics(["admin"], "admin-msg")
+            await asyncio.sleep(0.05)
+            await manager.close_all()
+            return chat.sent, trader.sent, admin.sent, added, manager.topic_index
+
+        chat_sent, trader_sent, admin_sent, added, topic_index = asyncio.run(scenario())
+        assert added == {"ticker:TSLA"}
+        assert chat_sent == ["tsla-msg", "plain-msg"]
+        assert trader_sent == ["tsla-msg"]
+        assert admin_sent == ["tsla-msg", "plain-msg", "admin-msg"]
+        assert topic_index == {}
+        print("✅ Topic events reach only their subscribers, each once")
+
+
+class TestConnectionHealth:
+    """Server pings, RTT tracking and eviction of silent sockets"""
+
+    def test_silent_socket_evicted_and_rtt_recorded(self):
+        async def scenario():
+            manager = ConnectionManager()
+            gone = []
+            manager.add_disconnect_listener(lambda connection: gone.append(connection.user_id))
+            alive_socket, dead_socket = FakeWebSocket(), FakeWebSocket()
+            alive = await manager.connect(alive_socket, {"id": "alive"})
+            dead = await manager.connect(dead_socket, {"id": "dead"})
+            dead.last_activity = time.monotonic() - websocket_manager.WS_PONG_TIMEOUT - 1
+            evicted = manager.check_health()
+            await asyncio.sleep(0.02)
+            ping = json.loads(alive_socket.sent[-1])
+            alive.record_pong(ping["ts"])
+            stats = manager.get_stats()
+            await manager.close_all()
+            return evicted, ping, dead_socket.closed_with, gone, stats
+
+        evicted, ping, dead_close_code, gone, stats = asyncio.run(scenario())
+        assert evicted == 1 and dead_close_code == 1011
+        assert ping["type"] == "ping"
+        assert gone[0] == "dead"
+        assert stats["connections"] == 1 and stats["evictions"] == 1 and stats["pings_sent"] == 1
+        assert stats["rtt_ms"]["p50"] is not None
+        print("✅ Silent socket evicted, live socket pinged with RTT recorded")
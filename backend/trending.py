@@ -0,0 +1,220 @@
+"""Trending cashtags over sliding windows, counted incrementally from the chat event stream.
+
+Mentions are added to one-minute buckets as messages (member chat and bot
+alerts alike) are published; each window keeps a running Counter that gains
+new mentions immediately and sheds whole buckets as they age out, so reads
+never aggregate over db.messages. Every worker sees every chat event and
+holds the same counts. Changes to the top lists are pushed to this worker's
+sockets as `trending_delta` frames.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from frames import Frame
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TRENDING_BUCKET_SECONDS = 60
+TRENDING_WINDOWS = {"15m": 15 * 60, "1h": 60 * 60, "24h": 24 * 60 * 60}
+TRENDING_TOP_N = int(os.getenv("TRENDING_TOP_N", "10"))
+# How often changes to the top lists are pushed to clients
+TRENDING_DELTA_INTERVAL = float(os.getenv("TRENDING_DELTA_INTERVAL", "5"))
+
+_MAX_WINDOW_BUCKETS = max(TRENDING_WINDOWS.values()) // TRENDING_BUCKET_SECONDS
+
+
+def _epoch(value: Any) -> Optional[float]:
+    """Seconds since the epoch for a stored (naive UTC) or serialized message timestamp"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class TrendingTickers:
+    """Per-minute mention counters with running totals for each window"""
+
+    def __init__(self, db, manager, top_n: int = TRENDING_TOP_N, clock=time.time):
+        self.db = db
+        self.manager = manager
+        self.top_n = top_n
+        self.clock = clock
+        self.buckets: Dict[int, Counter] = {}
+        self.totals: Dict[str, Counter] = {window: Counter() for window in TRENDING_WINDOWS}
+        # Oldest bucket still counted in each window's total
+        self.window_start: Dict[str, int] = {}
+        self.loaded = False
+        self._pending: List[Tuple[float, List[str]]] = []
+        self._snapshots: Dict[str, List[Dict[str, Any]]] = {}
+        self._pushed: Dict[str, List[Dict[str, Any]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+
+    # ---- counting ----
+
+    def record(self, message: Dict[str, Any]):
+        """Count one published chat message's cashtags (each symbol once per message)"""
+        tickers = [ticker for ticker in message.get("highlighted_tickers") or [] if isinstance(ticker, str) and ticker]
+        if not tickers:
+            return
+        ts = _epoch(message.get("timestamp"))
+        if ts is None:
+            return
+        self.recorded += 1
+        if not self.loaded:
+            self._pending.append((ts, tickers))
+            return
+        self._add(ts, tickers)
+
+    def _add(self, ts: float, tickers: Iterable[str], count: int = 1):
+        now_bucket = self._advance()
+        bucket = min(int(ts // TRENDING_BUCKET_SECONDS), now_bucket)
+        if bucket <= now_bucket - _MAX_WINDOW_BUCKETS:
+            return
+        counter = self.buckets.setdefault(bucket, Counter())
+        for ticker in set(tickers):
+            counter[ticker] += count
+            for window, start in self.window_start.items():
+                if bucket >= start:
+                    self.totals[window][ticker] += count
+                    self._snapshots.pop(window, None)
+
+    def _advance(self) -> int:
+        """Drop buckets that slid out of each window; returns the current bucket"""
+        now_bucket = int(self.clock() // TRENDING_BUCKET_SECONDS)
+        for window, seconds in TRENDING_WINDOWS.items():
+            new_start = now_bucket - seconds // TRENDING_BUCKET_SECONDS + 1
+            old_start = self.window_start.get(window, new_start)
+            if new_start > old_start:
+                total = self.totals[window]
+                # Only buckets that exist - a quiet night does not mean 1440 lookups
+                for bucket in [bucket for bucket in self.buckets if old_start <= bucket < new_start]:
+                    total.subtract(self.buckets[bucket])
+                self.totals[window] = +total  # Drop zero counts
+                self._snapshots.pop(window, None)
+            self.window_start[window] = new_start
+        oldest = now_bucket - _MAX_WINDOW_BUCKETS + 1
+        for bucket in [bucket for bucket in self.buckets if bucket < oldest]:
+            del self.buckets[bucket]
+        return now_bucket
+
+    # ---- reads ----
+
+    def top(self, window: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Most-mentioned symbols in a window, cached until the counts change"""
+        self._advance()
+        snapshot = self._snapshots.get(window)
+        if snapshot is None:
+            ranked = sorted(self.totals[window].items(), key=lambda item: (-item[1], item[0]))[:self.top_n]
+            snapshot = [{"symbol": symbol, "mentions": mentions, "rank": rank} for rank, (symbol, mentions) in enumerate(ranked, 1)]
+            self._snapshots[window] = snapshot
+        return snapshot[:limit] if limit else snapshot
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {window: self.top(window) for window in TRENDING_WINDOWS}
+
+    # ---- push ----
+
+    def flush_delta(self) -> int:
+        """Push windows whose top list changed since the last push to this worker's sockets"""
+        changed = {}
+        for window, entries in self.snapshot().items():
+            previous = self._pushed.get(window, [])
+            if entries == previous:
+                continue
+            old = {entry["symbol"]: entry for entry in previous}
+            symbols = {entry["symbol"] for entry in entries}
+            changed[window] = {
+                "updated": [entry for entry in entries if old.get(entry["symbol"]) != entry],
+                "removed": [symbol for symbol in old if symbol not in symbols],
+            }
+            self._pushed[window] = entries
+        if not changed:
+            return 0
+        return self.manager.broadcast_local(Frame({"type": "trending_delta", "windows": changed}))
+
+    async def _delta_loop(self):
+        while True:
+            await asyncio.sleep(TRENDING_DELTA_INTERVAL)
+            try:
+                self.flush_delta()
+            except Exception as e:
+                logger.error(f"Error sending trending delta: {e}")
+
+    # ---- lifecycle ----
+
+    async def rebuild(self):
+        """Refill the buckets from the last 24h of messages; events published meanwhile are applied after"""
+        self.loaded = False
+        started = self.clock()
+        cutoff = datetime.utcfromtimestamp(started - max(TRENDING_WINDOWS.values()))
+        until = datetime.utcfromtimestamp(started)
+        bucket_ms = TRENDING_BUCKET_SECONDS * 1000
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": cutoff, "$lt": until}, "highlighted_tickers.0": {"$exists": True}}},
+            {"$project": {
+                "_id": 0,
+                "minute": {"$subtract": [{"$toLong": "$timestamp"}, {"$mod": [{"$toLong": "$timestamp"}, bucket_ms]}]},
+                "tickers": {"$setUnion": ["$highlighted_tickers", []]},
+            }},
+            {"$unwind": "$tickers"},
+            {"$group": {"_id": {"minute": "$minute", "ticker": "$tickers"}, "count": {"$sum": 1}}},
+        ]
+        self.buckets = {}
+        self.totals = {window: Counter() for window in TRENDING_WINDOWS}
+        self.window_start = {}
+        self._snapshots = {}
+        self._advance()
+        rows = await self.db.messages.aggregate(pipeline).to_list(None)
+        for row in rows:
+            if not isinstance(row["_id"]["ticker"], str):
+                continue  # Legacy {"symbol": ...} entries not yet normalized
+            self._add(row["_id"]["minute"] / 1000, [row["_id"]["ticker"]], row["count"])
+        self.loaded = True
+        pending, self._pending = self._pending, []
+        for ts, tickers in pending:
+            if ts >= started:  # Older ones were already in the aggregation
+                self._add(ts, tickers)
+        self._pushed = self.snapshot()
+        logger.info(f"📈 Trending tickers rebuilt from {len(rows)} ticker-minutes")
+
+    async def start(self):
+        try:
+            await self.rebuild()
+        except Exception as e:
+            # Count from now on rather than not at all
+            logger.error(f"Trending tickers not rebuilt from history: {e}")
+            self.loaded = True
+            pending, self._pending = self._pending, []
+            for ts, tickers in pending:
+                self._add(ts, tickers)
+        if self._task is None:
+            self._task = asyncio.create_task(self._delta_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "buckets": len(self.buckets),
+            "recorded": self.recorded,
+            "symbols_24h": len(self.totals["24h"]),
+        }
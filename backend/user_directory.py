@@ -0,0 +1,194 @@
+"""In-memory username directory - @mention resolution and user autocomplete without MongoDB.
+
+Holds every user's profile (public fields plus role and status), keyed by id, plus a sorted array of
+case-folded usernames so exact lookups are a dict hit and prefix searches a
+bisect. Loaded once at start-up; registrations, renames, profile changes and
+deletions are applied through the ConnectionManager backplane so every
+worker's copy changes together, and a periodic reload picks up writes made
+outside this process (scripts, the mongo shell).
+"""
+import os
+import re
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Full reload from db.users, for changes the backplane never saw
+USER_DIRECTORY_RELOAD_INTERVAL = float(os.getenv("USER_DIRECTORY_RELOAD_INTERVAL", "600"))
+USER_SEARCH_MAX_LIMIT = 20
+# Accounts autocomplete offers - the same set GET /users lists
+USER_SEARCH_STATUSES = ("approved", "trial")
+
+USER_DIRECTORY_FIELDS = ("id", "username", "screen_name", "avatar_url", "is_admin", "status")
+# What autocomplete returns to any caller
+USER_SEARCH_FIELDS = ("id", "username", "screen_name", "avatar_url")
+USER_DIRECTORY_PROJECTION = {"_id": 0, **{field: 1 for field in USER_DIRECTORY_FIELDS}}
+
+MENTION_RE = re.compile(r'@(\w+)')
+
+
+def fold(username: str) -> str:
+    return username.casefold()
+
+
+def directory_profile(user: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: user.get(field) for field in USER_DIRECTORY_FIELDS}
+
+
+class UserDirectory:
+    """Case-folded username index kept in step across workers"""
+
+    def __init__(self, db, manager):
+        self.db = db
+        self.manager = manager
+        self.users: Dict[str, Dict[str, Any]] = {}  # user_id -> profile
+        self.by_name: Dict[str, List[str]] = {}  # folded username -> user ids (case-only duplicates are possible)
+        self.names: List[Tuple[str, str]] = []  # sorted (folded username, user_id)
+        self.admins: Set[str] = set()  # user ids with is_admin
+        self.loaded = False
+        self._task: Optional[asyncio.Task] = None
+        manager.register_handler("user_directory", self._apply)
+
+    # ---- reads ----
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self.users.get(user_id)
+
+    def find(self, username: str) -> Optional[Dict[str, Any]]:
+        """Exact, case-insensitive username lookup"""
+        user_ids = self.by_name.get(fold(username))
+        return self.users[user_ids[0]] if user_ids else None
+
+    def admin_ids(self) -> List[str]:
+        """Audience for admin pushes"""
+        return list(self.admins)
+
+    def resolve_mentions(self, content: str) -> List[Dict[str, Any]]:
+        """Users @mentioned in a message, each once, in order of first mention"""
+        found: Dict[str, Dict[str, Any]] = {}
+        for name in MENTION_RE.findall(content):
+            user = self.find(name)
+            if user is not None:
+                found.setdefault(user["id"], user)
+        return list(found.values())
+
+    def search(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Approved and trial users whose username starts with prefix (case-insensitive), alphabetically.
+        Returns only the public USER_SEARCH_FIELDS."""
+        prefix = fold(prefix.lstrip("@"))
+        if not prefix:
+            return []
+        results = []
+        index = bisect_left(self.names, (prefix, ""))
+        while index < len(self.names) and len(results) < limit:
+            name, user_id = self.names[index]
+            if not name.startswith(prefix):
+                break
+            user = self.users[user_id]
+            if user.get("status") in USER_SEARCH_STATUSES:
+                results.append({field: user.get(field) for field in USER_SEARCH_FIELDS})
+            index += 1
+        return results
+
+    # ---- changes (applied on every worker) ----
+
+    def upsert(self, user: Dict[str, Any]):
+        """A user was created or renamed"""
+        self.manager.publish({"op": "user_directory", "user": directory_profile(user)})
+
+    def update(self, user_id: str, changes: Dict[str, Any]):
+        """Profile fields changed; ignored for users not in the directory"""
+        current = self.users.get(user_id)
+        if current is None:
+            return
+        profile = dict(current)
+        profile.update({field: value for field, value in changes.items() if field in USER_DIRECTORY_FIELDS})
+        if profile != current:
+            self.upsert(profile)
+
+    def remove(self, user_id: str):
+        self.manager.publish({"op": "user_directory", "removed": user_id})
+
+    def _apply(self, envelope: Dict[str, Any]):
+        if "removed" in envelope:
+            self._remove(envelope["removed"])
+        elif envelope.get("user"):
+            self._put(envelope["user"])
+
+    def _put(self, profile: Dict[str, Any]):
+        if not profile.get("id") or not profile.get("username"):
+            return
+        self._remove(profile["id"])
+        self.users[profile["id"]] = profile
+        if profile.get("is_admin"):
+            self.admins.add(profile["id"])
+        name = fold(profile["username"])
+        self.by_name.setdefault(name, []).append(profile["id"])
+        insort(self.names, (name, profile["id"]))
+
+    def _remove(self, user_id: str):
+        profile = self.users.pop(user_id, None)
+        if profile is None:
+            return
+        self.admins.discard(user_id)
+        name = fold(profile["username"])
+        user_ids = self.by_name.get(name, [])
+        if user_id in user_ids:
+            user_ids.remove(user_id)
+        if not user_ids:
+            self.by_name.pop(name, None)
+        index = bisect_left(self.names, (name, user_id))
+        if index < len(self.names) and self.names[index] == (name, user_id):
+            del self.names[index]
+
+    # ---- lifecycle ----
+
+    async def load(self):
+        """(Re)build the directory from db.users"""
+        users = await self.db.users.find({}, USER_DIRECTORY_PROJECTION).to_list(None)
+        profiles = [user for user in users if user.get("id") and user.get("username")]
+        by_name: Dict[str, List[str]] = {}
+        for user in profiles:
+            by_name.setdefault(fold(user["username"]), []).append(user["id"])
+        # Swap in whole so readers never see a half-built index
+        self.users = {user["id"]: directory_profile(user) for user in profiles}
+        self.by_name = by_name
+        self.names = sorted((fold(user["username"]), user["id"]) for user in profiles)
+        self.admins = {user["id"] for user in profiles if user.get("is_admin")}
+        self.loaded = True
+        logger.info(f"📇 User directory loaded: {len(self.users)} users")
+
+    async def _reload_loop(self):
+        while True:
+            await asyncio.sleep(USER_DIRECTORY_RELOAD_INTERVAL)
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error(f"Error reloading user directory: {e}")
+
+    async def start(self):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"User directory not loaded, retrying in {USER_DIRECTORY_RELOAD_INTERVAL:.0f}s: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._reload_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"loaded": self.loaded, "users": len(self.users)}
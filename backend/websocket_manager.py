@@ -0,0 +1,605 @@
+"""WebSocket connection management with per-connection outbound queues"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+from typing import List, Dict, Set, Optional, Any, Iterable, Callable, Union
+
+from fastapi import WebSocket
+
+from backplane import Backplane, InProcessBackplane, Envelope
+from frames import Frame, ENCODING_JSON, as_frame
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Outbound queue size per socket. A client that falls this many frames behind is a slow consumer.
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# What to do with a slow consumer: "disconnect" closes the socket (client reconnects),
+# "drop_oldest" downgrades it by discarding its oldest queued frames.
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "disconnect")
+# A single send_text taking longer than this marks the socket as dead
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+# How many recent broadcasts to keep latency samples for
+WS_LATENCY_SAMPLES = 1000
+# Server pings every open socket this often; the client answers with a pong carrying the same ts
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "25"))
+# A socket that has sent nothing (pong, heartbeat, anything) for this long is dead and evicted
+WS_PONG_TIMEOUT = float(os.getenv("WS_PONG_TIMEOUT", "60"))
+
+# Secondary indexes over connected users
+GROUP_ADMINS = "admins"
+GROUP_MEMBERS = "members"
+GROUP_TRIAL = "trial"
+GROUP_APPROVED = "approved"
+
+# Subscription topics: chat:<channel>, ticker:<SYMBOL>, user:<id>, admin
+TOPIC_CHAT_GLOBAL = "chat:global"
+TOPIC_ADMIN = "admin"
+TOPIC_PREFIXES = ("chat:", "ticker:", "user:")
+# Upper bound on topics one socket may hold
+WS_MAX_TOPICS = int(os.getenv("WS_MAX_TOPICS", "100"))
+
+
+def user_groups(is_admin: bool, status: Optional[str]) -> Set[str]:
+    """Groups a connected user belongs to, derived from the user document"""
+    groups = {GROUP_ADMINS if is_admin else GROUP_MEMBERS}
+    status = getattr(status, "value", status)
+    if status == "trial":
+        groups.add(GROUP_TRIAL)
+    elif status == "approved":
+        groups.add(GROUP_APPROVED)
+    return groups
+
+
+def user_topic(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def ticker_topic(symbol: str) -> str:
+    return f"ticker:{symbol.upper()}"
+
+
+def normalize_topic(topic: str) -> Optional[str]:
+    """Canonical topic name, or None if it is not a known topic shape"""
+    if not isinstance(topic, str) or not topic or len(topic) > 64:
+        return None
+    if topic == TOPIC_ADMIN:
+        return topic
+    if topic.startswith("ticker:") and len(topic) > len("ticker:"):
+        return ticker_topic(topic[len("ticker:"):])
+    if topic.startswith(TOPIC_PREFIXES) and not topic.endswith(":"):
+        return topic
+    return None
+
+
+def default_topics(user_id: str, is_admin: bool) -> Set[str]:
+    """Topics every new connection starts with"""
+    topics = {TOPIC_CHAT_GLOBAL, user_topic(user_id)}
+    if is_admin:
+        topics.add(TOPIC_ADMIN)
+    return topics
+
+
+def _percentile(samples: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an unsorted sample list"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return round(ordered[index], 3)
+
+
+class BroadcastTracker:
+    """Tracks one broadcast until every targeted writer has sent or dropped its frame"""
+
+    __slots__ = ("started", "remaining", "stats")
+
+    def __init__(self, stats: "FanoutStats", remaining: int):
+        self.started = time.perf_counter()
+        self.remaining = remaining
+        self.stats = stats
+
+    def done(self):
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.stats.completion_ms.append((time.perf_counter() - self.started) * 1000)
+
+
+class FanoutStats:
+    """Counters and latency samples for broadcast fan-out"""
+
+    def __init__(self):
+        self.broadcasts = 0
+        self.frames_enqueued = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.send_failures = 0
+        self.slow_consumer_disconnects = 0
+        self.pings_sent = 0
+        self.evictions = 0
+        # Time spent by broadcast() itself handing the frame to every queue
+        self.enqueue_ms: deque = deque(maxlen=WS_LATENCY_SAMPLES)
+        # Time from broadcast() until the last targeted socket finished sending
+        self.completion_ms: deque = deque(maxlen=WS_LATENCY_SAMPLES)
+        # Ping round trips reported by clients
+        self.rtt_ms: deque = deque(maxlen=WS_LATENCY_SAMPLES)
+
+    def snapshot(self) -> Dict[str, Any]:
+        enqueue = list(self.enqueue_ms)
+        completion = list(self.completion_ms)
+        rtt = list(self.rtt_ms)
+        return {
+            "broadcasts": self.broadcasts,
+            "frames_enqueued": self.frames_enqueued,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "send_failures": self.send_failures,
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+            "pings_sent": self.pings_sent,
+            "evictions": self.evictions,
+            "enqueue_ms": {
+                "p50": _percentile(enqueue, 50),
+                "p95": _percentile(enqueue, 95),
+                "p99": _percentile(enqueue, 99),
+            },
+            "completion_ms": {
+                "p50": _percentile(completion, 50),
+                "p95": _percentile(completion, 95),
+                "p99": _percentile(completion, 99),
+            },
+            "rtt_ms": {
+                "p50": _percentile(rtt, 50),
+                "p95": _percentile(rtt, 95),
+                "p99": _percentile(rtt, 99),
+            },
+        }
+
+
+class ClientConnection:
+    """A single WebSocket with a bounded outbound queue drained by its own writer task"""
+
+    def __init__(self, websocket: WebSocket, user_id: str, session_id: Optional[str], manager: "ConnectionManager",
+                 encoding: str = ENCODING_JSON):
+        self.id = uuid.uuid4().hex
+        self.encoding = encoding  # Wire encoding negotiated at connect, see frames.py
+        self.websocket = websocket
+        self.user_id = user_id
+        self.session_id = session_id
+        self.manager = manager
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.writer_task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.lagging = False  # Set once frames have been dropped for this client
+        self.frames_dropped = 0
+        self.connected_at = time.time()
+        self.topics: Set[str] = set()
+        # Health: transports without an inbound side (SSE) are not pinged
+        self.pingable = getattr(websocket, "pingable", True)
+        self.last_activity = time.monotonic()
+        self.rtt_ms: Optional[float] = None
+
+    def start(self):
+        self.writer_task = asyncio.create_task(self._writer())
+
+    def touch(self):
+        """Anything received from the client proves the socket is alive"""
+        self.last_activity = time.monotonic()
+
+    def record_pong(self, ts: Any):
+        """Client echoed a ping's ts (ms on the server's monotonic clock)"""
+        self.touch()
+        if isinstance(ts, (int, float)):
+            rtt = time.monotonic() * 1000 - ts
+            if 0 <= rtt < WS_PONG_TIMEOUT * 1000:
+                self.rtt_ms = rtt
+                self.manager.stats.rtt_ms.append(rtt)
+
+    def enqueue(self, frame: Union[Frame, str], tracker: Optional[BroadcastTracker] = None) -> bool:
+        """Queue a frame without blocking. Returns False if the client is closed or overflowed."""
+        if self.closed:
+            if tracker:
+                tracker.done()
+            return False
+
+        try:
+            self.queue.put_nowait((frame, tracker))
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if WS_SLOW_CONSUMER_POLICY == "drop_oldest":
+            # Downgrade: keep the newest frames, discard the oldest one
+            try:
+                _, dropped_tracker = self.queue.get_nowait()
+                if dropped_tracker:
+                    dropped_tracker.done()
+            except asyncio.QueueEmpty:
+                pass
+            self.queue.put_nowait((frame, tracker))
+            self.frames_dropped += 1
+            self.manager.stats.frames_dropped += 1
+            if not self.lagging:
+                self.lagging = True
+                logger.warning(f"🐢 Slow WebSocket consumer {self.user_id}: dropping oldest frames")
+            return True
+
+        # Disconnect policy: the frame is lost and the client is dropped
+        self.frames_dropped += 1
+        self.manager.stats.frames_dropped += 1
+        if tracker:
+            tracker.done()
+        if self.abort():
+            self.manager.stats.slow_consumer_disconnects += 1
+            logger.warning(f"🐢 Slow WebSocket consumer {self.user_id}: queue full ({WS_SEND_QUEUE_SIZE}), disconnecting")
+            asyncio.create_task(self._close_socket(1013, "Client too slow"))
+        return False
+
+    async def _writer(self):
+        """Drain the outbound queue one frame at a time"""
+        try:
+            while True:
+                frame, tracker = await self.queue.get()
+                try:
+                    if self.encoding == ENCODING_JSON:
+                        send = self.websocket.send_text(frame.text if isinstance(frame, Frame) else frame)
+                    else:
+                        data = as_frame(frame).encode(self.encoding)
+                        send = self.websocket.send_bytes(data) if isinstance(data, bytes) else self.websocket.send_text(data)
+                    await asyncio.wait_for(send, WS_SEND_TIMEOUT)
+                    self.manager.stats.frames_sent += 1
+                finally:
+                    if tracker:
+                        tracker.done()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.manager.stats.send_failures += 1
+            logger.info(f"WebSocket send failed for user {self.user_id}: {e}")
+            await self.close(code=1011, reason="Send failed")
+
+    def _release_pending(self):
+        """Resolve trackers of frames that will never be sent"""
+        while True:
+            try:
+                _, tracker = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if tracker:
+                tracker.done()
+
+    def abort(self) -> bool:
+        """Stop the writer and unregister from the manager. Returns False if already closed."""
+        if self.closed:
+            return False
+        self.closed = True
+        self.manager._unregister(self)
+        if self.writer_task and self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+        self._release_pending()
+        return True
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass  # Socket already gone
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        """Stop the writer, unregister and close the socket"""
+        if self.abort():
+            await self._close_socket(code, reason)
+
+
+class ConnectionManager:
+    """Registry of live WebSocket connections and broadcast fan-out engine.
+
+    Connections are keyed by connection id, so a user may hold several sockets
+    (tabs, phone + desktop). Users are additionally indexed by group (admins /
+    members, trial / approved) so targeted sends never need a database query.
+
+    Connections also subscribe to topics (chat:global, ticker:TSLA, user:<id>,
+    admin) and a topic index routes topic events only to their subscribers.
+
+    Every delivery is published to the backplane as an envelope and applied to
+    the local sockets, so clients attached to other workers receive it too.
+    """
+
+    def __init__(self, backplane: Optional[Backplane] = None):
+        self.node_id = uuid.uuid4().hex
+        self.backplane = backplane or InProcessBackplane()
+        self.backplane.attach(self.node_id, self.apply)
+        self.op_handlers: Dict[str, Callable[[Envelope], Any]] = {}
+        self.connections: Dict[str, ClientConnection] = {}
+        self.user_index: Dict[str, Set[str]] = {}  # user_id -> connection ids
+        self.group_index: Dict[str, Set[str]] = {}  # group -> user ids
+        self.user_group_memberships: Dict[str, Set[str]] = {}  # user_id -> groups
+        self.topic_index: Dict[str, Set[str]] = {}  # topic -> connection ids
+        self.disconnect_listeners: List[Callable[[ClientConnection], Any]] = []
+        self._health_task: Optional[asyncio.Task] = None
+        self.stats = FanoutStats()
+
+    async def connect(self, websocket: WebSocket, user: Dict[str, Any], session_id: Optional[str] = None,
+                      encoding: str = ENCODING_JSON) -> ClientConnection:
+        await websocket.accept()
+        user_id = user["id"]
+        connection = ClientConnection(websocket, user_id, session_id, self, encoding)
+        connection.start()
+        self.connections[connection.id] = connection
+        self.user_index.setdefault(user_id, set()).add(connection.id)
+        self._index_user(user_id, user_groups(user.get("is_admin", False), user.get("status")))
+        self.subscribe(connection, default_topics(user_id, bool(user.get("is_admin"))))
+        return connection
+
+    def _index_user(self, user_id: str, groups: Set[str]):
+        for group in self.user_group_memberships.get(user_id, set()) - groups:
+            members = self.group_index.get(group)
+            if members:
+                members.discard(user_id)
+        for group in groups:
+            self.group_index.setdefault(group, set()).add(user_id)
+        self.user_group_memberships[user_id] = groups
+
+    def _unregister(self, connection: ClientConnection):
+        if self.connections.pop(connection.id, None) is None:
+            return
+        self._drop_topics(connection, connection.topics)
+        user_connection_ids = self.user_index.get(connection.user_id)
+        if user_connection_ids is not None:
+            user_connection_ids.discard(connection.id)
+            if not user_connection_ids:
+                # Last socket for this user: drop them from every index
+                del self.user_index[connection.user_id]
+                self._index_user(connection.user_id, set())
+                del self.user_group_memberships[connection.user_id]
+        for listener in self.disconnect_listeners:
+            try:
+                listener(connection)
+            except Exception as e:
+                logger.error(f"Disconnect listener error for user {connection.user_id}: {e}")
+
+    def add_disconnect_listener(self, listener: Callable[[ClientConnection], Any]):
+        """Called once for every connection that leaves the registry, however it closed"""
+        self.disconnect_listeners.append(listener)
+
+    def disconnect(self, connection: ClientConnection):
+        """Forget a connection whose socket is already gone"""
+        if not connection.abort():
+            self._unregister(connection)
+
+    def update_user(self, user_id: str, is_admin: Optional[bool] = None, status: Optional[str] = None):
+        """Re-index a connected user after a role or status change (None keeps the current value)"""
+        current = self.user_group_memberships.get(user_id)
+        if current is None:
+            return
+        if is_admin is None:
+            is_admin = GROUP_ADMINS in current
+        if status is None:
+            status = "trial" if GROUP_TRIAL in current else "approved" if GROUP_APPROVED in current else None
+        self._index_user(user_id, user_groups(is_admin, status))
+        if not is_admin:
+            for connection in self.user_connection_list(user_id):
+                self._drop_topics(connection, {TOPIC_ADMIN})
+
+    def subscribe(self, connection: ClientConnection, topics: Iterable[str]) -> Set[str]:
+        """Add topics a connection may receive. Returns the topics actually added."""
+        is_admin = GROUP_ADMINS in self.user_group_memberships.get(connection.user_id, ())
+        own_topic = user_topic(connection.user_id)
+        added = set()
+        for topic in topics:
+            topic = normalize_topic(topic)
+            if topic is None or topic in connection.topics:
+                continue
+            if (topic == TOPIC_ADMIN and not is_admin) or (topic.startswith("user:") and topic != own_topic):
+                continue
+            if len(connection.topics) >= WS_MAX_TOPICS:
+                break
+            connection.topics.add(topic)
+            self.topic_index.setdefault(topic, set()).add(connection.id)
+            added.add(topic)
+        return added
+
+    def unsubscribe(self, connection: ClientConnection, topics: Iterable[str]):
+        self._drop_topics(connection, {normalize_topic(topic) for topic in topics})
+
+    def _drop_topics(self, connection: ClientConnection, topics: Iterable[Optional[str]]):
+        for topic in list(topics):
+            if topic not in connection.topics:
+                continue
+            connection.topics.discard(topic)
+            subscribers = self.topic_index.get(topic)
+            if subscribers is not None:
+                subscribers.discard(connection.id)
+                if not subscribers:
+                    del self.topic_index[topic]
+
+    def topic_subscribers(self, topics: Iterable[str]) -> List[ClientConnection]:
+        """Local connections subscribed to any of the topics, each once"""
+        connection_ids: Set[str] = set()
+        for topic in topics:
+            connection_ids.update(self.topic_index.get(topic, ()))
+        return [self.connections[cid] for cid in connection_ids if cid in self.connections]
+
+    def is_connected(self, user_id: str) -> bool:
+        return user_id in self.user_index
+
+    def user_connection_list(self, user_id: str) -> List[ClientConnection]:
+        return [self.connections[cid] for cid in self.user_index.get(user_id, ()) if cid in self.connections]
+
+    def group_members(self, group: str) -> Set[str]:
+        """User ids currently connected in a group"""
+        return set(self.group_index.get(group, ()))
+
+    async def send_personal_message(self, message: str, connection: ClientConnection):
+        connection.enqueue(message)
+
+    def register_handler(self, op: str, handler: Callable[[Envelope], Any]):
+        """Let another in-memory service (e.g. presence) receive its own envelope ops"""
+        self.op_handlers[op] = handler
+
+    def publish(self, envelope: Envelope):
+        """Send an envelope to every other node and apply it here"""
+        self.backplane.publish(self.node_id, envelope)
+        return self.apply(envelope)
+
+    def apply(self, envelope: Envelope):
+        """Deliver an envelope to the sockets attached to this node"""
+        op = envelope.get("op")
+        if op in self.op_handlers:
+            return self.op_handlers[op](envelope)
+        frame = envelope.get("frame")
+        if frame is not None:
+            # One Frame per envelope: binary encodings are produced once, not per socket
+            frame = as_frame(frame)
+        if op == "broadcast":
+            return self._fan_out(list(self.connections.values()), frame)
+        if op == "users":
+            connections = [c for user_id in envelope["user_ids"] for c in self.user_connection_list(user_id)]
+            return self._fan_out(connections, frame)
+        if op == "group":
+            user_ids = self.group_index.get(envelope["group"], set())
+            exclude_user_id = envelope.get("exclude_user_id")
+            connections = [c for user_id in user_ids if user_id != exclude_user_id for c in self.user_connection_list(user_id)]
+            return self._fan_out(connections, frame)
+        if op == "topics":
+            return self._fan_out(self.topic_subscribers(envelope["topics"]), frame)
+        if op == "session_invalidation":
+            return self._invalidate_sessions(envelope["user_id"], envelope["new_session_id"])
+        logger.warning(f"Unknown backplane envelope op: {op}")
+        return 0
+
+    def send_to_user(self, user_id: str, message: Union[Frame, str]) -> bool:
+        """Queue a frame for every socket of a user on any node. Returns True if a local socket took it."""
+        return self.publish({"op": "users", "user_ids": [user_id], "frame": message}) > 0
+
+    def send_to_users(self, user_ids: Iterable[str], message: Union[Frame, str]) -> int:
+        """Queue a frame for several users, returns how many local sockets took it"""
+        return self.publish({"op": "users", "user_ids": list(user_ids), "frame": message})
+
+    def send_to_group(self, group: str, message: Union[Frame, str], exclude_user_id: Optional[str] = None) -> int:
+        """Queue a frame for every connected user in a group"""
+        return self.publish({"op": "group", "group": group, "frame": message, "exclude_user_id": exclude_user_id})
+
+    def _fan_out(self, connections: List[ClientConnection], message: Union[Frame, str]) -> int:
+        started = time.perf_counter()
+        self.stats.broadcasts += 1
+        if not connections:
+            return 0
+        tracker = BroadcastTracker(self.stats, len(connections))
+        queued = 0
+        for connection in connections:
+            if connection.enqueue(message, tracker):
+                queued += 1
+        self.stats.frames_enqueued += queued
+        self.stats.enqueue_ms.append((time.perf_counter() - started) * 1000)
+        return queued
+
+    def send_to_topics(self, topics: Iterable[str], message: Union[Frame, str]) -> int:
+        """Queue a frame for every connection subscribed to any of the topics, on any node"""
+        return self.publish({"op": "topics", "topics": list(topics), "frame": message})
+
+    def broadcast_local(self, message: Union[Frame, str]) -> int:
+        """Queue a frame for the sockets on this node only - for state every node already holds (presence)"""
+        return self._fan_out(list(self.connections.values()), as_frame(message))
+
+    async def broadcast(self, message: Union[Frame, str]):
+        """Hand the frame to every connection's queue on every node; writers deliver it concurrently"""
+        self.publish({"op": "broadcast", "frame": message})
+
+    async def send_admin_notification(self, message: Union[Frame, str]):
+        """Send notifications to all connected admins"""
+        self.send_to_group(GROUP_ADMINS, message)
+
+    async def send_session_invalidation(self, user_id: str, new_session_id: str):
+        """Send session invalidation message to user's old sessions"""
+        self.publish({"op": "session_invalidation", "user_id": user_id, "new_session_id": new_session_id})
+
+    def _invalidate_sessions(self, user_id: str, new_session_id: str) -> int:
+        frame = json.dumps({
+            "type": "session_invalidated",
+            "message": "Your session has been terminated due to login from another location",
+            "new_session_id": new_session_id
+        })
+        sent = 0
+        for connection in self.user_connection_list(user_id):
+            if connection.session_id == new_session_id:
+                continue
+            if connection.enqueue(frame):
+                sent += 1
+                print(f"Sent session invalidation message to user {user_id} (connection {connection.id})")
+            else:
+                print(f"Error sending session invalidation message to user {user_id}: connection not writable")
+                # Force remove the connection even if sending fails
+                self.disconnect(connection)
+        return sent
+
+    def check_health(self) -> int:
+        """Evict sockets silent for WS_PONG_TIMEOUT and ping the rest. Returns how many were evicted."""
+        now = time.monotonic()
+        ping = json.dumps({"type": "ping", "ts": round(now * 1000, 3)})
+        evicted = 0
+        for connection in list(self.connections.values()):
+            if not connection.pingable:
+                continue
+            if now - connection.last_activity > WS_PONG_TIMEOUT:
+                if connection.abort():
+                    evicted += 1
+                    logger.info(f"💀 Evicting silent WebSocket for user {connection.user_id} ({now - connection.last_activity:.0f}s without a pong)")
+                    asyncio.create_task(connection._close_socket(1011, "Ping timeout"))
+            elif connection.enqueue(ping):
+                self.stats.pings_sent += 1
+        self.stats.evictions += evicted
+        return evicted
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(WS_PING_INTERVAL)
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"Error checking WebSocket health: {e}")
+
+    async def start(self):
+        await self.backplane.start()
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Fan-out counters plus current queue state"""
+        connections = list(self.connections.values())
+        depths = [connection.queue.qsize() for connection in connections]
+        now = time.monotonic()
+        idle = [now - connection.last_activity for connection in connections if connection.pingable]
+        return {
+            "connections": len(connections),
+            "users": len(self.user_index),
+            "groups": {group: len(members) for group, members in self.group_index.items()},
+            "topics": len(self.topic_index),
+            "top_topics": dict(sorted(
+                ((topic, len(subscribers)) for topic, subscribers in self.topic_index.items()),
+                key=lambda item: item[1], reverse=True
+            )[:10]),
+            "lagging_connections": sum(1 for connection in connections if connection.lagging),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths) if depths else 0,
+            "queue_capacity": WS_SEND_QUEUE_SIZE,
+            "max_idle_seconds": round(max(idle), 1) if idle else None,
+            "ping_interval": WS_PING_INTERVAL,
+            "pong_timeout": WS_PONG_TIMEOUT,
+            "slow_consumer_policy": WS_SLOW_CONSUMER_POLICY,
+            "node_id": self.node_id,
+            "backplane": self.backplane.get_stats(),
+            **self.stats.snapshot(),
+        }
+
+    async def close_all(self):
+        """Close every connection, used on shutdown"""
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        for connection in list(self.connections.values()):
+            await connection.close(code=1001, reason="Server shutting down")
+        await self.backplane.stop()
@@ -84,7 +84,7 @@ function App() {
   window.__setMessages = setMessages;
   const [newMessage, setNewMessage] = useState('');
   const [isConnected, setIsConnected] = useState(false);
-  const [connectionMode, setConnectionMode] = useState('disconnected'); // 'websocket', 'polling', 'disconnected'
+  const [connectionMode, setConnectionMode] = useState('disconnected'); // 'websocket', 'sse', 'disconnected'
   const [showLogin, setShowLogin] = useState(true);
   const [loginForm, setLoginForm] = useState({ username: '', email: '', password: '', real_name: '', membership_plan: '' });
   const [rememberMe, setRememberMe] = useState(false);
@@ -140,13 +140,21 @@ function App() {
   const [priceLoading, setPriceLoading] = useState(false);
   const [replyToMessage, setReplyToMessage] = useState(null);
   const [notifications, setNotifications] = useState([]);
+  const [unreadCount, setUnreadCount] = useState(0); // Pushed by the server as 'unread_count'
   const [messageReactions, setMessageReactions] = useState({});
+  const [myReactions, setMyReactions] = useState({});
+  const reactionsLoadedRef = useRef(new Set());
   const [onlineUsers, setOnlineUsers] = useState([]);
   const [showUserList, setShowUserList] = useState(true);
   const [userXP, setUserXP] = useState({ experience_points: 0, level: 1 });
   const [showProfileCustomization, setShowProfileCustomization] = useState(false);
   const [viewingUserId, setViewingUserId] = useState(null);
   const wsRef = useRef(null);
+  const lastSeqRef = useRef(null); // seq of the last chat event received, sent on reconnect for replay
+  const latestCursorRef = useRef(null); // X-After-Cursor of the newest loaded message, for ?since= polling
+  const pollRef = useRef(null);
+  const [historyCursor, setHistoryCursor] = useState(null); // X-Before-Cursor of the oldest loaded message
+  const [trendingTickers, setTrendingTickers] = useState([]); // Most-mentioned cashtags over the last hour
   const messagesEndRef = useRef(null);
 
   // Filter messages based on search query
@@ -166,6 +174,33 @@ function App() {
     }
   }, [messages, searchQuery]);
 
+  // Older history beyond the loaded messages comes from the server-side search index
+  useEffect(() => {
+    const query = searchQuery.trim();
+    if (query.length < 3) return;
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const params = new URLSearchParams({ q: query, limit: '50' });
+        if (currentUser) params.append('user_id', currentUser.id);
+        const response = await axios.get(`${API}/messages/search?${params.toString()}`);
+        if (cancelled) return;
+        const found = (response.data.results || []).map(result => result.message);
+        setFilteredMessages(prev => {
+          const seen = new Set(prev.map(m => m.id));
+          const older = found.filter(m => !seen.has(m.id));
+          return [...older, ...prev].sort((a, b) => new Date(a.timestamp) - new Date(b.timestamp));
+        });
+      } catch (error) {
+        console.error('Error searching messages:', error);
+      }
+    }, 300);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchQuery, currentUser]);
+
   // Load saved user on app start
   useEffect(() => {
     const initializeUser = async () => {
@@ -269,11 +304,24 @@ function App() {
     try {
       const response = await axios.get(`${API}/users/${currentUser.id}/notifications`);
       setNotifications(response.data);
+      // Fetching marks them read, so take the badge count afterwards
+      loadUnreadCount();
     } catch (error) {
       console.error('Error loading notifications:', error);
     }
   };
 
+  const loadUnreadCount = async () => {
+    if (!currentUser) return;
+    
+    try {
+      const response = await axios.get(`${API}/users/${currentUser.id}/notifications/unread-count`);
+      setUnreadCount(response.data.count || 0);
+    } catch (error) {
+      console.error('Error loading unread count:', error);
+    }
+  };
+
   const markNotificationAsRead = async (notificationId) => {
     try {
       await axios.put(`${API}/users/${currentUser.id}/notifications/${notificationId}/read`);
@@ -713,43 +761,66 @@ function App() {
     }
   }, [serviceWorker, currentUser]);
 
-  const addReaction = (messageId, reaction) => {
-    console.log(`Adding reaction ${reaction} to message ${messageId}`);
-    
-    // Find the message to get its author
-    const message = messages.find(msg => msg.id === messageId);
-    if (!message) return;
-    
+  const applyReactionCount = (messageId, reaction, count) => {
     setMessageReactions(prev => {
-      const messageReacts = prev[messageId] || {};
-      const currentCount = messageReacts[reaction] || 0;
-      
-      // Create notification if it's someone else's message
-      if (message.user_id !== currentUser?.id) {
-        const newNotification = {
-          type: 'reaction',
-          from: currentUser?.screen_name || currentUser?.username,
-          to: message.user_id,
-          originalMessage: message.content_type === 'image' ? '📷 Image' : message.content.substring(0, 50),
-          reaction: reaction,
-          timestamp: new Date().toLocaleTimeString(),
-          messageId: messageId
-        };
-        
-        setNotifications(prev => [newNotification, ...(prev || []).slice(0, 49)]); // Keep last 50 notifications
+      const messageReacts = { ...(prev[messageId] || {}) };
+      if (count > 0) {
+        messageReacts[reaction] = count;
+      } else {
+        delete messageReacts[reaction];
       }
-      
-      return {
-        ...prev,
-        [messageId]: {
-          ...messageReacts,
-          [reaction]: currentCount + 1
-        }
-      };
+      return { ...prev, [messageId]: messageReacts };
     });
   };
 
+  const addReaction = async (messageId, reaction) => {
+    if (!currentUser) return;
+    
+    // Clicking a reaction you already gave takes it back
+    const mine = myReactions[messageId] || [];
+    const removing = mine.includes(reaction);
+    try {
+      const response = removing
+        ? await axios.delete(`${API}/messages/${messageId}/react?user_id=${currentUser.id}&reaction_type=${encodeURIComponent(reaction)}`)
+        : await axios.post(`${API}/messages/${messageId}/react`, { user_id: currentUser.id, reaction_type: reaction });
+      setMyReactions(prev => ({
+        ...prev,
+        [messageId]: removing ? mine.filter(r => r !== reaction) : [...mine, reaction]
+      }));
+      applyReactionCount(messageId, reaction, response.data.count);
+    } catch (error) {
+      console.error('Error updating reaction:', error);
+    }
+  };
 
+  // Reaction counts for messages we have not loaded them for yet, one request per batch
+  useEffect(() => {
+    if (!currentUser || messages.length === 0) return;
+    const ids = messages
+      .filter(m => !m.id.startsWith('temp-') && !reactionsLoadedRef.current.has(m.id))
+      .map(m => m.id);
+    if (ids.length === 0) return;
+    ids.forEach(id => reactionsLoadedRef.current.add(id));
+    
+    axios.post(`${API}/messages/reactions/summary`, { message_ids: ids.slice(-200), user_id: currentUser.id })
+      .then(response => {
+        const summary = response.data || {};
+        setMessageReactions(prev => {
+          const next = { ...prev };
+          Object.entries(summary).forEach(([id, entry]) => { next[id] = entry.counts; });
+          return next;
+        });
+        setMyReactions(prev => {
+          const next = { ...prev };
+          Object.entries(summary).forEach(([id, entry]) => { next[id] = entry.mine; });
+          return next;
+        });
+      })
+      .catch(error => {
+        ids.forEach(id => reactionsLoadedRef.current.delete(id));
+        console.error('Error loading reactions:', error);
+      });
+  }, [messages, currentUser]);
 
   // Fetch stock price when symbol changes
   const fetchCurrentPrice = async (symbol) => {
@@ -896,7 +967,8 @@ function App() {
         ? capacitorManager.getWebSocketUrl(BACKEND_URL)
         : wsUrl.replace(`/${currentUser.id}/${currentUser.active_session_id}`, '');
           
-      const finalWsUrl = `${baseWsUrl}/${currentUser.id}/${currentUser.active_session_id}`;
+      const resumeQuery = lastSeqRef.current !== null ? `?last_seq=${lastSeqRef.current}` : '';
+      const finalWsUrl = `${baseWsUrl}/${currentUser.id}/${currentUser.active_session_id}${resumeQuery}`;
       console.log('🔌 Connecting to WebSocket:', finalWsUrl);
       
       const ws = new WebSocket(finalWsUrl);
@@ -914,13 +986,23 @@ function App() {
           const data = JSON.parse(event.data);
           console.log('WebSocket message received:', data);
           
-          if (data.type === 'session_invalidated') {
+          // Chat events are sequenced so a reconnect can resume exactly where we left off
+          if (typeof data.seq === 'number') {
+            lastSeqRef.current = data.seq;
+          }
+          
+          if (data.type === 'ping') {
+            // Server health check - echo ts so it can measure round-trip time
+            if (ws.readyState === WebSocket.OPEN) {
+              ws.send(JSON.stringify({ type: 'pong', ts: data.ts }));
+            }
+          } else if (data.type === 'session_invalidated') {
             // Session has been invalidated by login from another location
             alert('🔒 Your session has been terminated due to login from another location.');
             logout();
           } else if (data.type === 'message') {
             const message = data.data;
-            setMessages(prev => [...prev, message]);
+            setMessages(prev => prev.some(m => m.id === message.id) ? prev : [...prev, message]);
             
             console.log('📝 Message received:', {
               content: message.content.substring(0, 50),
@@ -952,6 +1034,8 @@ function App() {
             
             playSimpleAdminSound();
             
+          } else if (data.type === 'unread_count') {
+            setUnreadCount(data.count);
           } else if (data.type === 'notification') {
             // New notification received
             console.log('🔔 Notification received:', data);
@@ -971,17 +1055,28 @@ function App() {
               }
             }, 100);
             
-          } else if (data.type === 'user_joined') {
-            // User joined chat
-            setOnlineUsers(prev => {
-              if (!prev.find(user => user.id === data.user.id)) {
-                return [...prev, data.user];
-              }
-              return prev;
-            });
-          } else if (data.type === 'user_left') {
-            // User left chat
-            setOnlineUsers(prev => prev.filter(user => user.id !== data.user_id));
+          } else if (data.type === 'presence_delta') {
+            // Batched joins/leaves (one frame per server tick)
+            const removed = new Set(data.removed || []);
+            const updated = new Map((data.users || []).map(user => [user.id, user]));
+            setOnlineUsers(prev => [
+              ...prev.filter(user => !removed.has(user.id) && !updated.has(user.id)),
+              ...updated.values()
+            ]);
+          } else if (data.type === 'reaction') {
+            // Absolute counts, so our own echo is harmless
+            applyReactionCount(data.data.message_id, data.data.reaction_type, data.data.count);
+          } else if (data.type === 'trending_delta') {
+            // Changed entries of the trending lists; we show the 1h window
+            const delta = data.windows && data.windows['1h'];
+            if (delta) {
+              const removed = new Set(delta.removed || []);
+              const updated = new Map((delta.updated || []).map(entry => [entry.symbol, entry]));
+              setTrendingTickers(prev => [
+                ...prev.filter(entry => !removed.has(entry.symbol) && !updated.has(entry.symbol)),
+                ...updated.values()
+              ].sort((a, b) => a.rank - b.rank));
+            }
           } else if (data.type === 'online_users') {
             // Initial list of online users
             setOnlineUsers(data.users || []);
@@ -994,9 +1089,16 @@ function App() {
             if (document.hidden) {
               document.title = `🔔 ${data.admin_real_name || data.admin_username} - CashoutAI`;
             }
+          } else if (data.type === 'resync') {
+            // Missed too much to replay - server sent the latest messages instead
+            setMessages(data.messages || []);
           } else if (data.type === 'message_deleted') {
             // Remove deleted message from state
             setMessages(prev => prev.filter(m => m.id !== data.data.id));
+          } else if (data.type === 'messages_purged') {
+            // Bulk removal (e.g. a user's messages when their account is removed)
+            const purged = new Set(data.data.ids || []);
+            setMessages(prev => prev.filter(m => !purged.has(m.id)));
           }
         } catch (e) {
           console.error('Error parsing WebSocket message:', e);
@@ -1007,7 +1109,9 @@ function App() {
         setIsConnected(false);
         setConnectionMode('disconnected');
         console.log('WebSocket disconnected', event);
-        wsRef.current = null;
+        if (wsRef.current === ws) {
+          wsRef.current = null;
+        }
         
         // Handle session invalidation close codes
         if (event.code === 4002 || event.code === 4003) {
@@ -1020,65 +1124,44 @@ function App() {
         console.error('WebSocket error:', error);
         setIsConnected(false);
         
-        // Add fallback mechanism for session validation when WebSocket fails
-        if (currentUser?.active_session_id) {
-          console.log('WebSocket failed, falling back to polling mode...');
-          
-          // Set connected status to show as "Polling" instead of "Disconnected"
-          setTimeout(() => {
-            if (!wsRef.current || wsRef.current.type === 'polling') {
-              setIsConnected(true); // Show as connected since polling works
-              setConnectionMode('polling');
-            }
-          }, 1000);
-          
-          const sessionCheckInterval = setInterval(async () => {
-            try {
-              const response = await axios.get(`${API}/users/${currentUser.id}/session-status?session_id=${currentUser.active_session_id}`);
-              if (!response.data.valid) {
-                console.log('Session invalidated via polling, logging out...');
-                alert('🔒 Your session has been terminated due to login from another location.');
-                logout();
-                clearInterval(sessionCheckInterval);
-              }
-            } catch (error) {
-              console.error('Session validation error:', error);
-              setIsConnected(false);
-              setConnectionMode('disconnected');
-            }
-          }, 10000); // Check every 10 seconds
-          
-          // Also check for new messages periodically when WebSocket is down
-          const messageCheckInterval = setInterval(async () => {
+        // Fall back to a Server-Sent Events stream carrying the same events
+        // (messages, deletions, notifications, session invalidation) - no polling
+        if (currentUser?.active_session_id && typeof EventSource !== 'undefined' && wsRef.current?.type !== 'sse') {
+          console.log('WebSocket failed, falling back to SSE stream...');
+          const resumeQuery = lastSeqRef.current !== null ? `?last_seq=${lastSeqRef.current}` : '';
+          const source = new EventSource(`${API}/stream/${currentUser.id}/${currentUser.active_session_id}${resumeQuery}`);
+          source.onopen = () => {
+            setIsConnected(true);
+            setConnectionMode('sse');
+          };
+          source.onmessage = ws.onmessage;
+          source.onerror = () => {
+            // EventSource reconnects on its own and resumes via Last-Event-ID
+            setIsConnected(false);
+          };
+          wsRef.current = { type: 'sse', source };
+        } else if (typeof EventSource === 'undefined' && !pollRef.current) {
+          // No streaming transport at all: poll for messages newer than the last cursor.
+          // Unchanged polls are answered 304 without reading any messages.
+          setConnectionMode('polling');
+          pollRef.current = setInterval(async () => {
+            if (!latestCursorRef.current) return;
             try {
-              const response = await axios.get(`${API}/messages?limit=50&user_id=${currentUser?.id}`);
-              const latestMessages = response.data;
-              
-              setMessages(prev => {
-                const existingIds = prev.map(m => m.id);
-                const newMessages = latestMessages.filter(m => !existingIds.includes(m.id));
-                
-                // Check for admin messages in new messages
-                newMessages.forEach(message => {
-                  if (message.is_admin && message.user_id !== currentUser.id) {
-                    console.log('🔔 Admin message detected via polling:', message.screen_name || message.username);
-                    playSimpleAdminSound();
-                  }
-                });
-                
-                return [...prev, ...newMessages];
+              const response = await axios.get(`${API}/messages?since=${encodeURIComponent(latestCursorRef.current)}&limit=100`, {
+                validateStatus: (status) => status === 200 || status === 304
               });
-            } catch (error) {
-              console.error('Message polling error:', error);
+              setIsConnected(true);
+              if (response.headers['x-after-cursor']) latestCursorRef.current = response.headers['x-after-cursor'];
+              if (response.status === 200 && response.data.length > 0) {
+                setMessages(prev => {
+                  const existingIds = new Set(prev.map(m => m.id));
+                  return [...prev, ...response.data.filter(m => !existingIds.has(m.id))];
+                });
+              }
+            } catch (pollError) {
+              console.error('Error polling messages:', pollError);
             }
-          }, 8000); // Check for new messages every 8 seconds
-          
-          // Store interval IDs to clean up later
-          wsRef.current = { 
-            type: 'polling', 
-            sessionInterval: sessionCheckInterval,
-            messageInterval: messageCheckInterval
-          };
+          }, 5000);
         }
       };
       
@@ -1086,10 +1169,13 @@ function App() {
     }
     
     return () => {
+      if (pollRef.current) {
+        clearInterval(pollRef.current);
+        pollRef.current = null;
+      }
       if (wsRef.current) {
-        if (wsRef.current.type === 'polling') {
-          clearInterval(wsRef.current.sessionInterval);
-          clearInterval(wsRef.current.messageInterval);
+        if (wsRef.current.type === 'sse') {
+          wsRef.current.source.close();
         } else {
           wsRef.current.close();
         }
@@ -1098,12 +1184,23 @@ function App() {
     };
   }, [currentUser]);
 
+  const loadTrendingTickers = async () => {
+    try {
+      const response = await axios.get(`${API}/tickers/trending?window=1h`);
+      setTrendingTickers(response.data.tickers || []);
+    } catch (error) {
+      console.error('Error loading trending tickers:', error);
+    }
+  };
+
   const loadMessages = async () => {
     try {
       setMessagesLoading(true);
       const url = currentUser ? `${API}/messages?user_id=${currentUser.id}&limit=50` : `${API}/messages?limit=50`;
       const response = await axios.get(url);
       setMessages(response.data || []);
+      setHistoryCursor(response.headers['x-before-cursor'] || null);
+      latestCursorRef.current = response.headers['x-after-cursor'] || null;
     } catch (error) {
       console.error('Error loading messages:', error);
       setMessages([]);
@@ -1186,6 +1283,7 @@ function App() {
   useEffect(() => {
     if (currentUser) {
       loadMessages();
+      loadTrendingTickers();
       loadUserData();
       loadPendingUsers();
       loadAllUsers();
@@ -2305,7 +2403,7 @@ function App() {
                 }`}></div>
                 <span className={`text-sm ${isDarkTheme ? 'text-gray-300' : 'text-gray-600'}`}>
                   {isConnected ? 
-                    (connectionMode === 'websocket' ? 'Connected' : 'Polling') 
+                    (connectionMode === 'websocket' ? 'Connected' : connectionMode === 'polling' ? 'Polling' : 'Streaming') 
                     : 'Disconnected'
                   }
                 </span>
@@ -2484,9 +2582,9 @@ function App() {
                 >
                   <span className="text-xl mb-1">🔔</span>
                   <span className="text-xs font-medium">Alerts</span>
-                  {notifications.length > 0 && (
+                  {unreadCount > 0 && (
                     <span className="absolute -top-1 -right-1 bg-red-500 text-white rounded-full text-xs w-4 h-4 flex items-center justify-center">
-                      {notifications.length}
+                      {unreadCount > 99 ? '99+' : unreadCount}
                     </span>
                   )}
                 </button>
@@ -2669,8 +2767,19 @@ function App() {
             <div className="flex flex-1 overflow-hidden min-h-0">
               {/* Chat Messages Column - isolated scroll container */}
               <div className="flex-1 flex flex-col min-h-0 overflow-hidden">
+                {trendingTickers.length > 0 && (
+                  <div className={`flex items-center gap-2 px-4 py-1 text-xs overflow-x-auto whitespace-nowrap ${isDarkTheme ? 'text-gray-300' : 'text-gray-600'}`}>
+                    <span>🔥 Trending (1h):</span>
+                    {trendingTickers.slice(0, 5).map(entry => (
+                      <span key={entry.symbol} className="px-2 py-0.5 rounded bg-white/10">
+                        ${entry.symbol} <span className="opacity-60">{entry.mentions}</span>
+                      </span>
+                    ))}
+                  </div>
+                )}
                 <ChatTab 
                   messages={messages}
+                  historyCursor={historyCursor}
                   filteredMessages={filteredMessages}
                   showSearch={showSearch}
                   searchQuery={searchQuery}
@@ -2678,6 +2787,7 @@ function App() {
                   formatMessageContent={formatMessageContent}
                   addReaction={addReaction}
                   messageReactions={messageReactions}
+                  myReactions={myReactions}
                   addToFavorites={addToFavorites}
                   favorites={favorites}
                   messagesEndRef={messagesEndRef}
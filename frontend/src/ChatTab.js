@@ -4,24 +4,27 @@ import axios from 'axios';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || '';
 const API = BACKEND_URL ? `${BACKEND_URL}/api` : '/api';
 
+// Image content the browser can load directly: blob-store URL, data URL or absolute URL
+const directImageSrc = (content) => {
+  if (!content) return null;
+  if (content.startsWith('/api/blobs/')) return `${BACKEND_URL}${content}`;
+  if (content.startsWith('data:') || content.startsWith('http')) return content;
+  return null;
+};
+
 // Lazy-loading image component for chat images
-const ChatImage = ({ messageId, content, alt }) => {
-  const [src, setSrc] = useState(() => {
-    // If content is already a full data URL (from WebSocket real-time), use it directly
-    if (content && (content.startsWith('data:') || content.startsWith('http'))) {
-      return content;
-    }
-    return null;
-  });
-  const [loading, setLoading] = useState(() => {
-    return !(content && (content.startsWith('data:') || content.startsWith('http')));
-  });
+// Processed uploads render their thumbnail; clicking opens the original
+const ChatImage = ({ messageId, content, image, alt }) => {
+  const preview = image && image.thumbnail ? image.thumbnail : content;
+  const [src, setSrc] = useState(() => directImageSrc(preview));
+  const [loading, setLoading] = useState(() => !directImageSrc(preview));
   const [error, setError] = useState(false);
 
   useEffect(() => {
-    // Already have the image data
-    if (content && (content.startsWith('data:') || content.startsWith('http'))) {
-      setSrc(content);
+    // Already have the image (blob URL, or data URL from older messages)
+    const direct = directImageSrc(preview);
+    if (direct) {
+      setSrc(direct);
       setLoading(false);
       return;
     }
@@ -32,7 +35,7 @@ const ChatImage = ({ messageId, content, alt }) => {
       axios.get(`${API}/messages/${messageId}/image`)
         .then(res => {
           if (res.data && res.data.image_url) {
-            setSrc(res.data.image_url);
+            setSrc(directImageSrc(res.data.image_url) || res.data.image_url);
           } else {
             setError(true);
           }
@@ -40,7 +43,7 @@ const ChatImage = ({ messageId, content, alt }) => {
         .catch(() => setError(true))
         .finally(() => setLoading(false));
     }
-  }, [content, messageId]);
+  }, [preview, messageId]);
 
   if (loading) {
     return (
@@ -58,16 +61,26 @@ const ChatImage = ({ messageId, content, alt }) => {
     );
   }
 
-  return (
+  const img = (
     <img 
       src={src} 
       alt={alt || "Shared image"} 
       className="max-w-xs rounded-lg border border-white/20"
       style={{ maxHeight: '200px' }}
+      width={image && image.thumbnail_size ? image.thumbnail_size[0] : undefined}
+      height={image && image.thumbnail_size ? image.thumbnail_size[1] : undefined}
       loading="lazy"
       onError={() => setError(true)}
     />
   );
+  if (image && image.original) {
+    return (
+      <a href={directImageSrc(image.original)} target="_blank" rel="noopener noreferrer">
+        {img}
+      </a>
+    );
+  }
+  return img;
 };
 
 const ChatTab = ({ 
@@ -79,6 +92,7 @@ const ChatTab = ({
   formatMessageContent, 
   addReaction,
   messageReactions,
+  myReactions = {},
   addToFavorites,
   favorites,
   messagesEndRef,
@@ -103,7 +117,8 @@ const ChatTab = ({
   showScrollButton,
   scrollToBottom,
   deleteMessage,
-  messagesLoading = false
+  messagesLoading = false,
+  historyCursor = null
 }) => {
   const displayMessages = showSearch ? (filteredMessages || []) : (messages || []);
   const [followingUsers, setFollowingUsers] = useState([]);
@@ -112,17 +127,25 @@ const ChatTab = ({
   const [loadingMore, setLoadingMore] = useState(false);
   const [hasMore, setHasMore] = useState(true);
 
+  const [olderCursor, setOlderCursor] = useState(null);
+
+  useEffect(() => {
+    setOlderCursor(historyCursor);
+  }, [historyCursor]);
+
   const loadOlderMessages = useCallback(async () => {
     if (loadingMore || !hasMore || !messages || messages.length === 0) return;
     setLoadingMore(true);
     try {
-      const oldestTimestamp = messages[0]?.timestamp;
+      // Keyset cursor of the oldest loaded message; older servers/pages fall back to its timestamp
+      const before = encodeURIComponent(olderCursor || messages[0]?.timestamp);
       const url = currentUser 
-        ? `${API}/messages?user_id=${currentUser.id}&limit=50&before=${oldestTimestamp}`
-        : `${API}/messages?limit=50&before=${oldestTimestamp}`;
+        ? `${API}/messages?user_id=${currentUser.id}&limit=50&before=${before}`
+        : `${API}/messages?limit=50&before=${before}`;
       const response = await axios.get(url);
       if (response.data && response.data.length > 0) {
-        // Prepend older messages (they come newest-first, so reverse)
+        setOlderCursor(response.headers['x-before-cursor'] || null);
+        // Prepend older messages (returned oldest first)
         const chatContainer = document.querySelector('[data-chat-messages]');
         const prevHeight = chatContainer?.scrollHeight || 0;
         
@@ -150,7 +173,7 @@ const ChatTab = ({
       console.error('Error loading older messages:', e);
     }
     setLoadingMore(false);
-  }, [loadingMore, hasMore, messages, currentUser]);
+  }, [loadingMore, hasMore, messages, currentUser, olderCursor]);
 
   // Auto-scroll to bottom when messages first load
   useEffect(() => {
@@ -465,6 +488,7 @@ const ChatTab = ({
                     <ChatImage 
                       messageId={message.id}
                       content={message.content}
+                      image={message.image}
                       alt="Shared image"
                     />
                     {/* Show text caption if present with image */}
@@ -572,7 +596,9 @@ const ChatTab = ({
                           key={reaction}
                           onClick={() => addReaction(message.id, reaction)}
                           className={`text-xs px-1 py-0.5 rounded ml-1 transition-colors ${
-                            isDarkTheme ? 'bg-white/10 hover:bg-white/20' : 'bg-gray-100 hover:bg-gray-200'
+                            (myReactions[message.id] || []).includes(reaction)
+                              ? 'bg-blue-500/30 hover:bg-blue-500/40'
+                              : isDarkTheme ? 'bg-white/10 hover:bg-white/20' : 'bg-gray-100 hover:bg-gray-200'
                           }`}
                         >
                           {reaction}{count}
@@ -155,6 +155,20 @@ class NotificationService {
     }
   }
 
+  // Stable per-browser id, so a rotated token replaces this device's old one instead of piling up
+  getDeviceId() {
+    try {
+      let deviceId = localStorage.getItem('fcm_device_id');
+      if (!deviceId) {
+        deviceId = (window.crypto && window.crypto.randomUUID) ? window.crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        localStorage.setItem('fcm_device_id', deviceId);
+      }
+      return deviceId;
+    } catch (error) {
+      return null;
+    }
+  }
+
   async sendTokenToBackend(token, userId) {
     try {
       const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || '';
@@ -162,7 +176,7 @@ class NotificationService {
       const response = await fetch(`${API_URL}/fcm/register-token`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ token, user_id: userId })
+        body: JSON.stringify({ token, user_id: userId, device_id: this.getDeviceId(), platform: 'web' })
       });
 
       if (response.ok) {